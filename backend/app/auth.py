@@ -1,12 +1,14 @@
-from fastapi import Depends, HTTPException, status, Header
+from fastapi import Depends, HTTPException, Request, status, Header
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 import secrets
 
-from .database import get_db
+from . import metricas, tiempos
+from .database import get_read_db
 from .config import get_settings
 from .services import token_service
+from .services.rate_limit_service import limitador, cabeceras
 
 security = HTTPBasic()
 
@@ -46,14 +48,21 @@ def verificar_admin(credentials: HTTPBasicCredentials = Depends(security)) -> bo
     return True
 
 
-def verificar_api_token(
+async def verificar_api_token(
+    request: Request,
     authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ) -> bool:
     """
-    Verifica el token de API para acceso de terceros.
+    Verifica el token de API para acceso de terceros y aplica sus límites
+    (peticiones por minuto y cuota diaria).
     El token debe enviarse en el header Authorization: Bearer <token>
     """
+    with tiempos.fase("auth"):
+        return await _verificar_api_token(request, authorization, db)
+
+
+async def _verificar_api_token(request: Request, authorization: Optional[str], db: AsyncSession) -> bool:
     if not authorization:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -74,7 +83,7 @@ def verificar_api_token(
     token = parts[1]
     
     # Validar el token en la base de datos
-    api_token = token_service.validar_token(db, token)
+    api_token = await token_service.validar_token(db, token)
     
     if not api_token:
         raise HTTPException(
@@ -83,4 +92,18 @@ def verificar_api_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Límites por token: las cabeceras X-RateLimit-* las agrega el middleware
+    resultado = limitador.consumir(api_token.id, api_token.limite_por_minuto, api_token.cuota_diaria)
+    headers = cabeceras(api_token.limite_por_minuto, api_token.cuota_diaria, resultado)
+    request.state.rate_limit = headers
+    
+    if not resultado[0]:
+        cuota_agotada = api_token.cuota_diaria and resultado[3] == 0
+        metricas.rechazos_limite.inc("token_cuota" if cuota_agotada else "token_minuto")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Cuota diaria del token agotada" if cuota_agotada else "Límite de peticiones por minuto del token excedido",
+            headers=headers,
+        )
+    
     return True
@@ -0,0 +1,67 @@
+"""
+Comandos de mantenimiento de la base de datos.
+
+Uso (desde el directorio backend):
+    python -m app.cli reconstruir-fts
+    python -m app.cli reconstruir-contadores
+    python -m app.cli snapshot
+"""
+import argparse
+import sys
+
+from .database import engine, init_db
+
+
+def reconstruir_fts(args: argparse.Namespace) -> int:
+    """Regenera el índice de búsqueda de personas"""
+    from .services.busqueda_service import crear_indice_fts, reconstruir_indice_fts
+
+    init_db()
+    with engine.begin() as conn:
+        crear_indice_fts(conn)
+        reconstruir_indice_fts(conn)
+    print("Índice de búsqueda reconstruido")
+    return 0
+
+
+def reconstruir_contadores(args: argparse.Namespace) -> int:
+    """Recalcula los contadores de personas"""
+    from .services.estadisticas_service import crear_contadores, reconstruir_contadores
+
+    init_db()
+    with engine.begin() as conn:
+        crear_contadores(conn)
+        reconstruir_contadores(conn)
+    print("Contadores de personas recalculados")
+    return 0
+
+
+def snapshot(args: argparse.Namespace) -> int:
+    """Toma un snapshot de la base de datos en BACKUP_DIR"""
+    from .services.backup_service import tomar_snapshot
+
+    entrada = tomar_snapshot()
+    print(f"Snapshot {entrada['archivo']} ({entrada['tamano']} bytes, sha256 {entrada['sha256']})")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    sub = subparsers.add_parser("reconstruir-fts", help="Regenera el índice de búsqueda de personas")
+    sub.set_defaults(func=reconstruir_fts)
+
+    sub = subparsers.add_parser("reconstruir-contadores", help="Recalcula los contadores de personas")
+    sub.set_defaults(func=reconstruir_contadores)
+
+    sub = subparsers.add_parser("snapshot", help="Toma un snapshot de la base de datos en BACKUP_DIR")
+    sub.set_defaults(func=snapshot)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,6 +9,30 @@ class Settings(BaseSettings):
     # Base de datos SQLite
     DATABASE_URL: str = "sqlite:///./data/personas.db"
     
+    # Perfil de rendimiento de SQLite (se aplica en cada conexión)
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    # Tamaño de la caché de páginas por conexión en KiB
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_MMAP_SIZE: int = 268435456
+    SQLITE_TEMP_STORE: str = "MEMORY"
+    
+    # Pool de conexiones: escritura (y lecturas que forman parte de una
+    # escritura) y pool separado de solo lectura para consultas
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_READ_POOL_SIZE: int = 10
+    DB_READ_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    
+    # Snapshots programados de la base de datos: directorio, cada cuántas
+    # horas (0 = desactivados), cuántos conservar y si se comprimen en gzip
+    BACKUP_DIR: str = "./data/backups"
+    BACKUP_INTERVAL_HOURS: float = 24
+    BACKUP_RETENTION: int = 7
+    BACKUP_COMPRESS: bool = True
+    
     # Credenciales para acceso/backup de la base de datos
     # Estas credenciales protegen la descarga del backup de la BD
     DB_BACKUP_USER: str = "backup_admin"
@@ -18,6 +42,32 @@ class Settings(BaseSettings):
     APISPERU_TOKEN: str = ""
     APISPERU_BASE_URL: str = "https://dniruc.apisperu.com/api/v1"
     
+    # Cliente HTTP compartido hacia apisperu.com (pool de conexiones keep-alive)
+    UPSTREAM_MAX_CONNECTIONS: int = 50
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 30.0
+    UPSTREAM_CONNECT_TIMEOUT: float = 3.0
+    UPSTREAM_READ_TIMEOUT: float = 10.0
+    UPSTREAM_POOL_TIMEOUT: float = 5.0
+    # HTTP/2 requiere instalar el paquete opcional 'h2' (httpx[http2])
+    UPSTREAM_HTTP2: bool = False
+    
+    # Reintentos ante errores pasajeros de apisperu.com (conexión, timeout,
+    # 429 y 5xx), con backoff exponencial y jitter (segundos)
+    UPSTREAM_RETRIES: int = 2
+    UPSTREAM_RETRY_BACKOFF: float = 0.2
+    UPSTREAM_RETRY_BACKOFF_MAX: float = 2.0
+    # Circuito: se abre tras N fallos seguidos y durante ese tiempo las
+    # consultas fallan de inmediato; luego se prueba con pocas consultas
+    UPSTREAM_BREAKER_FAILURES: int = 5
+    UPSTREAM_BREAKER_OPEN_SECONDS: float = 30.0
+    UPSTREAM_BREAKER_HALF_OPEN_PROBES: int = 1
+    # Timeout de lectura adaptativo: p99 de las últimas N latencias por el
+    # factor, entre el mínimo y UPSTREAM_READ_TIMEOUT
+    UPSTREAM_LATENCY_SAMPLES: int = 200
+    UPSTREAM_TIMEOUT_FACTOR: float = 3.0
+    UPSTREAM_TIMEOUT_MIN: float = 1.0
+    
     # Credenciales de administrador (para el panel web)
     ADMIN_USER: str = "admin"
     ADMIN_PASSWORD: str = "admin123"
@@ -26,6 +76,105 @@ class Settings(BaseSettings):
     # Límite global: 200 peticiones/minuto por IP
     RATE_LIMIT_PER_IP: int = 200
     
+    # Caché en memoria de personas consultadas (por nrodoc)
+    PERSONA_CACHE_MAX_SIZE: int = 10000
+    PERSONA_CACHE_TTL_SECONDS: int = 3600
+    
+    # Vigencia de los datos de una persona (0 = nunca vencen). Pasado ese
+    # tiempo se siguen sirviendo, marcados como desactualizados, y se piden
+    # de nuevo a apisperu.com en segundo plano, con un máximo de refrescos
+    # por minuto (0 = sin refrescos) y simultáneos para no competir con las
+    # consultas nuevas. Solo se refrescan los registros con origen apisperu
+    # (no los manuales, importados ni los anteriores a la columna origen)
+    PERSONA_FRESHNESS_DAYS: int = 180
+    PERSONA_REFRESH_PER_MINUTE: int = 30
+    PERSONA_REFRESH_CONCURRENCY: int = 2
+    
+    # Caché negativa: DNIs que la API externa reportó como no encontrados
+    # Opcionalmente se persiste en SQLite para sobrevivir reinicios
+    NEGATIVE_CACHE_MAX_SIZE: int = 50000
+    NEGATIVE_CACHE_TTL_SECONDS: int = 86400
+    NEGATIVE_CACHE_PERSIST: bool = False
+    
+    # Caché de tokens de API activos y guardado diferido de su último uso
+    TOKEN_CACHE_MAX_SIZE: int = 1000
+    TOKEN_CACHE_TTL_SECONDS: int = 60
+    TOKEN_USAGE_FLUSH_SECONDS: float = 5.0
+    
+    # Listado de personas con paginación por cursor: máximo de registros
+    # por página (el modo por número de página sigue limitado a 100)
+    PERSONAS_CURSOR_MAX_PER_PAGE: int = 1000
+    
+    # Conteo de resultados de búsqueda: se detiene en COUNT_APPROX_LIMIT y se
+    # guarda en caché (salvo con exact=true)
+    COUNT_APPROX_LIMIT: int = 10000
+    COUNT_CACHE_MAX_SIZE: int = 1000
+    COUNT_CACHE_TTL_SECONDS: int = 30
+    
+    # Importación masiva de personas: filas por transacción y máximo de
+    # errores detallados en el resumen
+    IMPORT_BATCH_SIZE: int = 5000
+    IMPORT_MAX_ERRORES: int = 1000
+    
+    # Límites por token de API (se pueden cambiar por token): peticiones por
+    # minuto y cuota diaria (0 = sin límite), y shards de los contadores
+    TOKEN_RATE_LIMIT_PER_MINUTE: int = 120
+    TOKEN_DAILY_QUOTA: int = 0
+    RATE_LIMIT_SHARDS: int = 16
+    
+    # Bloqueo de login por IP tras LOGIN_MAX_ATTEMPTS intentos fallidos
+    # durante LOGIN_LOCKOUT_SECONDS. Los intentos por IP se guardan en
+    # memoria (máximo LOGIN_THROTTLE_MAX_ENTRIES, se expulsan los más viejos)
+    # y las IPs bloqueadas aparte (máximo LOGIN_LOCKOUT_MAX_ENTRIES, no se
+    # expulsan antes de vencer); opcionalmente también en SQLite, para que
+    # los bloqueos sobrevivan reinicios y se compartan entre workers
+    LOGIN_MAX_ATTEMPTS: int = 5
+    LOGIN_LOCKOUT_SECONDS: int = 900
+    LOGIN_THROTTLE_MAX_ENTRIES: int = 10000
+    LOGIN_LOCKOUT_MAX_ENTRIES: int = 10000
+    LOGIN_THROTTLE_PERSIST: bool = False
+    
+    # Métricas en formato Prometheus (GET /metrics). Si se define
+    # METRICS_TOKEN se exige Authorization: Bearer <METRICS_TOKEN>
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: str = ""
+    
+    # Cabecera Server-Timing con el tiempo por fase (auth, db, apisperu,
+    # json) y log de las peticiones que tardan más de SLOW_REQUEST_MS
+    # (0 = desactivado)
+    SERVER_TIMING_ENABLED: bool = True
+    SLOW_REQUEST_MS: float = 1000
+    
+    # Perfilador por muestreo: se activa por petición con la cabecera
+    # X-Profile: <PROFILE_TOKEN> (vacío = desactivada) o al azar con
+    # PROFILE_SAMPLE_RATE (0 a 1). Los perfiles se guardan en PROFILE_DIR
+    # (máximo PROFILE_MAX_FILES) en formato folded para flamegraphs
+    PROFILE_TOKEN: str = ""
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_INTERVAL_MS: float = 5
+    PROFILE_DIR: str = "./data/perfiles"
+    PROFILE_MAX_FILES: int = 50
+    
+    # Búsqueda por lotes: máximo de DNIs por petición y consultas
+    # simultáneas a apisperu.com para los que no están en la BD local
+    BATCH_MAX_DNIS: int = 500
+    BATCH_UPSTREAM_CONCURRENCY: int = 10
+    
+    # Trabajos en segundo plano para listas grandes de DNIs
+    JOB_MAX_DNIS: int = 500000
+    JOB_CHUNK_SIZE: int = 1000
+    JOB_UPSTREAM_CONCURRENCY: int = 5
+    JOB_UPSTREAM_RATE_PER_SECOND: float = 10.0
+    JOB_POLL_INTERVAL_SECONDS: float = 5.0
+    JOB_LEASE_SECONDS: int = 600
+    # Un DNI que falla por un error pasajero (timeout, circuito abierto, 5xx,
+    # token) sigue pendiente y se reintenta con backoff exponencial desde
+    # JOB_RETRY_BACKOFF_SECONDS (hasta JOB_RETRY_BACKOFF_MAX_SECONDS); tras
+    # JOB_RETRY_MAX_ATTEMPTS intentos queda con estado error
+    JOB_RETRY_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BACKOFF_SECONDS: float = 30
+    JOB_RETRY_BACKOFF_MAX_SECONDS: float = 900
+    
     # Servidor
     HOST: str = "0.0.0.0"
     PORT: int = 8000
@@ -1,7 +1,12 @@
 import os
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from . import metricas, tiempos
 from .config import get_settings
 
 settings = get_settings()
@@ -9,18 +14,161 @@ settings = get_settings()
 # Asegurar que el directorio data existe
 os.makedirs("data", exist_ok=True)
 
+_es_sqlite = settings.DATABASE_URL.startswith("sqlite")
+
+
+def _pragmas_sqlite(solo_lectura: bool = False) -> list[str]:
+    """PRAGMAs del perfil de rendimiento configurado"""
+    pragmas = [
+        f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}",
+        # Un valor negativo indica el tamaño en KiB en lugar de páginas
+        f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}",
+        f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}",
+        f"PRAGMA temp_store={settings.SQLITE_TEMP_STORE}",
+    ]
+    if solo_lectura:
+        pragmas.append("PRAGMA query_only=ON")
+    return pragmas
+
+
+def _aplicar_perfil(sync_engine, solo_lectura: bool = False):
+    """Registra los PRAGMAs para que se apliquen en cada conexión nueva"""
+    if not _es_sqlite:
+        return
+
+    pragmas = _pragmas_sqlite(solo_lectura)
+
+    @event.listens_for(sync_engine, "connect")
+    def _al_conectar(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+_OPERACIONES = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+def _medir_consultas(sync_engine, nombre: str):
+    """Registra la duración de cada consulta SQL en las métricas"""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        context._inicio_metricas = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        duracion = time.perf_counter() - context._inicio_metricas
+        tiempos.sumar("db", duracion)
+        operacion = statement.lstrip()[:6].upper()
+        metricas.duracion_consultas_db.observar(
+            duracion,
+            nombre,
+            operacion.lower() if operacion in _OPERACIONES else "otra",
+        )
+
+
+@event.listens_for(Session, "before_commit")
+def _antes_commit(session):
+    session.info["inicio_commit"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _despues_commit(session):
+    inicio = session.info.pop("inicio_commit", None)
+    if inicio is not None:
+        metricas.duracion_commits_db.observar(time.perf_counter() - inicio)
+
+
+def _opciones_pool(pool_size: int, max_overflow: int) -> dict:
+    """
+    Pool de conexiones reutilizables. Con aiosqlite SQLAlchemy usa NullPool
+    por defecto (una conexión nueva por sesión), así que se indica explícitamente.
+    """
+    return {
+        "poolclass": AsyncAdaptedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+    }
+
+
+# Motor síncrono: inicialización de tablas y scripts de mantenimiento
 engine = create_engine(
     settings.DATABASE_URL,
     connect_args={"check_same_thread": False}  # Solo para SQLite
 )
+_aplicar_perfil(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def _url_async(url: str) -> str:
+    """Convierte la URL de SQLite al driver asíncrono aiosqlite"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    return url
+
+
+# Motor asíncrono: lo usan los endpoints para no bloquear el event loop
+async_engine = create_async_engine(
+    _url_async(settings.DATABASE_URL),
+    **_opciones_pool(settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
+)
+_aplicar_perfil(async_engine.sync_engine)
+_medir_consultas(async_engine.sync_engine, "escritura")
+
+# Motor de solo lectura con su propio pool: las consultas no compiten por
+# las conexiones de escritura y, con WAL, no bloquean al escritor
+async_read_engine = create_async_engine(
+    _url_async(settings.DATABASE_URL),
+    **_opciones_pool(settings.DB_READ_POOL_SIZE, settings.DB_READ_MAX_OVERFLOW)
+)
+_aplicar_perfil(async_read_engine.sync_engine, solo_lectura=True)
+_medir_consultas(async_read_engine.sync_engine, "lectura")
+
+
+def _conexiones_pool() -> dict:
+    return {
+        (nombre, estado): valor
+        for nombre, motor in (("escritura", async_engine), ("lectura", async_read_engine))
+        for estado, valor in (("en_uso", motor.pool.checkedout()), ("libres", motor.pool.checkedin()))
+    }
+
+
+metricas.registrar(metricas.Recolector(
+    "dni_db_pool_connections", "Conexiones de los pools asíncronos por estado", ("engine", "state"), _conexiones_pool
+))
+
+# expire_on_commit=False evita recargas implícitas (no permitidas en async)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+AsyncReadSessionLocal = async_sessionmaker(
+    async_read_engine, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
-def get_db():
-    """Dependency para obtener sesión de base de datos"""
+async def get_db():
+    """Dependency para obtener sesión asíncrona de base de datos"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_read_db():
+    """Dependency para obtener sesión asíncrona de solo lectura"""
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+def get_sync_db():
+    """Sesión síncrona para scripts y tareas fuera del event loop"""
     db = SessionLocal()
     try:
         yield db
@@ -32,3 +180,75 @@ def init_db():
     """Inicializar base de datos con tablas"""
     from . import models
     Base.metadata.create_all(bind=engine)
+    _agregar_columnas_faltantes()
+    
+    if _es_sqlite:
+        from .services.busqueda_service import crear_indice_fts
+        from .services.estadisticas_service import crear_contadores
+        with engine.begin() as conn:
+            crear_indice_fts(conn)
+            crear_contadores(conn)
+
+
+def _agregar_columnas_faltantes():
+    """
+    create_all no modifica tablas existentes: agrega con ALTER TABLE las
+    columnas nuevas de los modelos que aún no existen en la base de datos,
+    y crea los índices nuevos que falten.
+
+    Las columnas agregadas quedan en NULL en las filas existentes, a
+    propósito: personas.origen no se completa porque no se puede saber si
+    una fila antigua vino de apisperu.com o se cargó a mano, y con NULL el
+    refresco en segundo plano no la sobrescribe.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existentes = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existentes:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+async def diagnostico_sqlite() -> dict:
+    """Perfil configurado, valores efectivos de los PRAGMAs y estado de los pools"""
+    consultas = ["journal_mode", "synchronous", "busy_timeout", "cache_size",
+                 "mmap_size", "temp_store", "query_only", "page_size", "page_count"]
+
+    async def leer_pragmas(motor) -> dict:
+        valores = {}
+        async with motor.connect() as conn:
+            for nombre in consultas:
+                valores[nombre] = (await conn.exec_driver_sql(f"PRAGMA {nombre}")).scalar()
+        return valores
+
+    def estado_pool(motor) -> dict:
+        pool = motor.pool
+        return {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        }
+
+    return {
+        "perfil": {
+            "journal_mode": settings.SQLITE_JOURNAL_MODE,
+            "synchronous": settings.SQLITE_SYNCHRONOUS,
+            "busy_timeout_ms": settings.SQLITE_BUSY_TIMEOUT_MS,
+            "cache_size_kb": settings.SQLITE_CACHE_SIZE_KB,
+            "mmap_size": settings.SQLITE_MMAP_SIZE,
+            "temp_store": settings.SQLITE_TEMP_STORE,
+        },
+        "escritura": {
+            "pragmas": await leer_pragmas(async_engine),
+            "pool": estado_pool(async_engine),
+        },
+        "lectura": {
+            "pragmas": await leer_pragmas(async_read_engine),
+            "pool": estado_pool(async_read_engine),
+        },
+    }
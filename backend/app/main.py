@@ -1,19 +1,24 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Header, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 
-from .database import get_db, init_db
+from .database import get_db, get_read_db, init_db, diagnostico_sqlite, AsyncSessionLocal
 from .auth import verificar_admin, verificar_api_token
 from .schemas import (
-    PersonaBusqueda, PersonaResponse, TokenCreate, TokenResponse, TokenList,
-    ConfigUpdate, ConfigResponse, MessageResponse
+    PersonaBusqueda, PersonaResponse, BusquedaLote, PersonaBusquedaLote, TokenCreate, TokenLimites, TokenResponse, TokenList,
+    ConfigUpdate, ConfigResponse, MessageResponse, PerfiladorConfig
 )
-from .services import dni_service, token_service
+from .services import dni_service, token_service, http_client, job_service, busqueda_service, estadisticas_service, export_service, import_service, backup_service, login_service, upstream_service
+from .services.cache_service import persona_cache, no_encontrado_cache, token_cache, conteo_cache, login_cache, login_bloqueo_cache
 from .models import Config
 from .config import get_settings
+from .serializacion import Sobres, fila_a_dict, filas_a_dict
+from . import metricas, perfilador, tiempos
+from .middleware import CabecerasMiddleware
 import secrets
 
 # Rate Limiting
@@ -21,7 +26,6 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from fastapi import Request
-from fastapi.responses import JSONResponse
 
 # Diccionario de descripciones de códigos HTTP
 HTTP_DESCRIPTIONS = {
@@ -35,60 +39,27 @@ HTTP_DESCRIPTIONS = {
     500: "Internal Server Error - Error interno del servidor"
 }
 
-def serialize_value(obj):
-    """Convierte objetos no serializables a JSON"""
-    from datetime import datetime
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    return obj
+# Prefijos del sobre estándar precalculados por código HTTP
+sobres = Sobres(HTTP_DESCRIPTIONS)
 
 def model_to_dict(obj):
-    """Convierte un modelo a diccionario con fechas serializables"""
-    if hasattr(obj, "model_dump"):
-        data = obj.model_dump()
-    elif hasattr(obj, "__dict__"):
-        data = {k: v for k, v in obj.__dict__.items() if not k.startswith('_')}
-    else:
-        return obj
-    
-    # Convertir fechas a string
-    from datetime import datetime
-    for key, value in data.items():
-        if isinstance(value, datetime):
-            data[key] = value.isoformat()
-    return data
+    """Convierte un modelo a diccionario (las fechas las convierte el codificador JSON)"""
+    return fila_a_dict(obj)
 
 def create_api_response(success: bool, code: int, message: str, data=None):
     """Crea una respuesta estandarizada"""
-    content = {
-        "success": success,
-        "code": code,
-        "code_description": HTTP_DESCRIPTIONS.get(code, "Desconocido"),
-        "message": message
-    }
-    
-    if data is not None:
-        # Si es un objeto Pydantic o modelo SQLAlchemy
-        if hasattr(data, "model_dump") or hasattr(data, "__dict__"):
-            content["data"] = model_to_dict(data)
-        elif isinstance(data, list):
-            content["data"] = [model_to_dict(i) for i in data]
-        elif isinstance(data, dict):
-            # Si es un diccionario, procesar sus valores
-            from datetime import datetime
-            processed = {}
-            for k, v in data.items():
-                if isinstance(v, list):
-                    processed[k] = [model_to_dict(i) for i in v]
-                elif isinstance(v, datetime):
-                    processed[k] = v.isoformat()
-                else:
-                    processed[k] = v
-            content["data"] = processed
-        else:
-            content["data"] = data
-            
-    return JSONResponse(status_code=code, content=content)
+    with tiempos.fase("json"):
+        if data is not None:
+            if isinstance(data, list):
+                data = filas_a_dict(data)
+            elif isinstance(data, dict):
+                # Si es un diccionario, convertir las listas de modelos que contenga
+                data = {k: filas_a_dict(v) if isinstance(v, list) else v for k, v in data.items()}
+            else:
+                # Si es un objeto Pydantic o modelo SQLAlchemy
+                data = fila_a_dict(data)
+        
+        return sobres.respuesta(success, code, message, data)
 
 # Inicializar Limiter
 limiter = Limiter(key_func=get_remote_address)
@@ -104,6 +75,7 @@ app = FastAPI(
 app.state.limiter = limiter
 @app.exception_handler(RateLimitExceeded)
 async def custom_rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    metricas.rechazos_limite.inc("ip")
     return create_api_response(
         False, 
         429, 
@@ -119,28 +91,35 @@ app.add_middleware(
     allow_headers=["Authorization", "Content-Type"],
 )
 
-# Middleware de seguridad para headers
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
-
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response: Response = await call_next(request)
-        # Headers de seguridad
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate"
-        return response
-
-app.add_middleware(SecurityHeadersMiddleware)
+# Cabeceras de seguridad y de límites, Server-Timing, métricas por ruta y
+# log de peticiones lentas (middleware ASGI puro)
+app.add_middleware(CabecerasMiddleware)
 
 
 @app.on_event("startup")
 async def startup():
-    """Inicializar base de datos al iniciar"""
+    """Inicializar base de datos y cliente HTTP compartido al iniciar"""
     init_db()
+    if get_settings().NEGATIVE_CACHE_PERSIST:
+        async with AsyncSessionLocal() as db:
+            await dni_service.purgar_no_encontrados_expirados(db)
+    if get_settings().LOGIN_THROTTLE_PERSIST:
+        async with AsyncSessionLocal() as db:
+            await login_service.purgar_expirados(db)
+    await http_client.iniciar_cliente()
+    token_service.iniciar_guardado_uso()
+    job_service.iniciar_worker()
+    backup_service.iniciar_snapshots()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Detener tareas en segundo plano, guardar el uso de tokens y cerrar conexiones"""
+    await backup_service.detener_snapshots()
+    await dni_service.detener_refrescos()
+    await job_service.detener_worker()
+    await token_service.detener_guardado_uso()
+    await http_client.cerrar_cliente()
 
 
 # ==================== Login ====================
@@ -152,33 +131,29 @@ class LoginRequest(BaseModel):
     username: str = Field(..., min_length=1, max_length=50)
     password: str = Field(..., min_length=1, max_length=100)
 
-# Diccionario para tracking de intentos fallidos por IP
-login_attempts = {}
-
 @app.post("/api/login")
 @limiter.limit("10/minute")
-async def login(request: Request, credentials: LoginRequest):
+async def login(
+    request: Request,
+    credentials: LoginRequest,
+    db: AsyncSession = Depends(get_db)
+):
     """
     Valida las credenciales de administrador.
     Limitado a 10 intentos por minuto por IP.
     """
     client_ip = get_remote_address(request)
-    
-    # Verificar intentos fallidos (bloqueo temporal después de 5 intentos)
-    if client_ip in login_attempts:
-        attempts, last_attempt = login_attempts[client_ip]
-        from datetime import datetime, timedelta
-        if attempts >= 5 and datetime.now() - last_attempt < timedelta(minutes=15):
-            return create_api_response(
-                False, 429, 
-                "Demasiados intentos fallidos. Intente en 15 minutos."
-            )
-        # Reset si pasaron más de 15 minutos
-        if datetime.now() - last_attempt >= timedelta(minutes=15):
-            login_attempts[client_ip] = (0, datetime.now())
-    
     settings = get_settings()
     
+    # Verificar intentos fallidos (bloqueo temporal después de LOGIN_MAX_ATTEMPTS intentos)
+    if await login_service.segundos_bloqueado(db, client_ip):
+        metricas.rechazos_limite.inc("login")
+        minutos = max(1, settings.LOGIN_LOCKOUT_SECONDS // 60)
+        return create_api_response(
+            False, 429, 
+            f"Demasiados intentos fallidos. Intente en {minutos} minutos."
+        )
+    
     admin_user = getattr(settings, 'ADMIN_USER', 'admin')
     admin_password = getattr(settings, 'ADMIN_PASSWORD', 'escolastica123')
     
@@ -193,18 +168,11 @@ async def login(request: Request, credentials: LoginRequest):
     
     if is_correct_username and is_correct_password:
         # Reset intentos en login exitoso
-        if client_ip in login_attempts:
-            del login_attempts[client_ip]
+        await login_service.limpiar(db, client_ip)
         return create_api_response(True, 200, "Login exitoso")
     else:
         # Registrar intento fallido
-        from datetime import datetime
-        if client_ip in login_attempts:
-            attempts, _ = login_attempts[client_ip]
-            login_attempts[client_ip] = (attempts + 1, datetime.now())
-        else:
-            login_attempts[client_ip] = (1, datetime.now())
-        
+        await login_service.registrar_fallo(db, client_ip)
         return create_api_response(False, 401, "Credenciales incorrectas")
 
 
@@ -215,53 +183,157 @@ async def login(request: Request, credentials: LoginRequest):
 async def buscar_persona(
     request: Request,
     dni: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     api_token: str = Depends(verificar_api_token)
 ):
     """Busca una persona por DNI usando Token de API."""
     # Sanitizar y validar DNI
     dni = dni.strip()
-    if not dni.isdigit() or len(dni) != 8:
-        return create_api_response(False, 400, "El DNI debe ser un número de 8 dígitos")
-    
-    # Validar que no sea un DNI obviamente inválido
-    if dni in ["00000000", "11111111", "22222222", "33333333", "44444444", 
-               "55555555", "66666666", "77777777", "88888888", "99999999"]:
-        return create_api_response(False, 400, "DNI inválido")
+    error = dni_service.validar_dni(dni)
+    if error:
+        return create_api_response(False, 400, error)
     
     persona, mensaje = await dni_service.buscar_persona(db, dni)
     
     if persona:
-        data = PersonaResponse.model_validate(persona)
-        return create_api_response(True, 200, mensaje, data)
+        # dni_service ya devuelve un PersonaResponse validado
+        return create_api_response(True, 200, mensaje, persona)
     else:
         return create_api_response(False, 404, mensaje)
 
 
+@app.post("/api/persona/lote", response_model=PersonaBusquedaLote)
+@limiter.limit("30/minute")
+async def buscar_personas_lote(
+    request: Request,
+    lote: BusquedaLote,
+    db: AsyncSession = Depends(get_read_db),
+    api_token: str = Depends(verificar_api_token)
+):
+    """
+    Busca varios DNIs en una sola petición usando Token de API.
+    Cada DNI tiene su propio resultado con success, code y message.
+    """
+    settings = get_settings()
+    
+    # Sanitizar y eliminar duplicados conservando el orden
+    dnis = list(dict.fromkeys(dni.strip() for dni in lote.dnis))
+    if len(dnis) > settings.BATCH_MAX_DNIS:
+        return create_api_response(
+            False, 400,
+            f"Se permiten como máximo {settings.BATCH_MAX_DNIS} DNIs por petición"
+        )
+    
+    errores = {dni: dni_service.validar_dni(dni) for dni in dnis}
+    validos = [dni for dni in dnis if not errores[dni]]
+    resultados = await dni_service.buscar_personas_lote(db, validos)
+    
+    items = []
+    encontrados = 0
+    for dni in dnis:
+        if errores[dni]:
+            items.append({"dni": dni, "success": False, "code": 400, "message": errores[dni], "data": None})
+            continue
+        
+        persona, mensaje, definitivo = resultados[dni]
+        if persona:
+            encontrados += 1
+            items.append({"dni": dni, "success": True, "code": 200, "message": mensaje, "data": model_to_dict(persona)})
+        else:
+            # 503 si fue un error pasajero: el cliente puede reintentar ese DNI
+            code = 404 if definitivo else 503
+            items.append({"dni": dni, "success": False, "code": code, "message": mensaje, "data": None})
+    
+    data = {
+        "items": items,
+        "total": len(dnis),
+        "encontrados": encontrados,
+        "no_encontrados": len(validos) - encontrados,
+        "invalidos": len(dnis) - len(validos)
+    }
+    return create_api_response(True, 200, "Búsqueda por lotes completada", data)
+
+
+# ==================== Trabajos por Lotes ====================
+
+@app.post("/api/trabajos")
+@limiter.limit("20/hour")
+async def crear_trabajo(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    api_token: str = Depends(verificar_api_token)
+):
+    """
+    Registra un trabajo en segundo plano para una lista grande de DNIs.
+    El cuerpo de la petición es el archivo (texto o CSV) con un DNI por línea.
+    """
+    trabajo, mensaje = await job_service.crear_trabajo(db, request.stream())
+    
+    if not trabajo:
+        return create_api_response(False, 400, mensaje)
+    return create_api_response(True, 201, mensaje, job_service.trabajo_a_dict(trabajo))
+
+
+@app.get("/api/trabajos/{trabajo_id}")
+async def obtener_trabajo(
+    trabajo_id: str,
+    db: AsyncSession = Depends(get_read_db),
+    api_token: str = Depends(verificar_api_token)
+):
+    """Consulta el avance de un trabajo."""
+    trabajo = await job_service.obtener_trabajo(db, trabajo_id)
+    
+    if not trabajo:
+        return create_api_response(False, 404, "Trabajo no encontrado")
+    return create_api_response(True, 200, "Estado del trabajo", job_service.trabajo_a_dict(trabajo))
+
+
+@app.get("/api/trabajos/{trabajo_id}/resultados")
+async def descargar_resultados_trabajo(
+    trabajo_id: str,
+    db: AsyncSession = Depends(get_read_db),
+    api_token: str = Depends(verificar_api_token)
+):
+    """
+    Descarga los resultados del trabajo como CSV, enviado por partes.
+    Si el trabajo no ha terminado, los DNIs sin procesar figuran como pendientes.
+    """
+    trabajo = await job_service.obtener_trabajo(db, trabajo_id)
+    
+    if not trabajo:
+        return create_api_response(False, 404, "Trabajo no encontrado")
+    
+    headers = {
+        "Content-Disposition": f'attachment; filename="resultados_{trabajo.id}.csv"',
+        "X-Trabajo-Estado": trabajo.estado
+    }
+    return StreamingResponse(
+        job_service.generar_resultados_csv(trabajo.id),
+        media_type="text/csv",
+        headers=headers
+    )
+
+
 @app.get("/api/buscar/{dni}", response_model=PersonaBusqueda)
 @limiter.limit("200/minute")
 async def buscar_persona_admin(
     request: Request,
     dni: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     _: bool = Depends(verificar_admin)
 ):
     """Busca una persona por DNI (Panel Admin)."""
     # Sanitizar y validar DNI
     dni = dni.strip()
-    if not dni.isdigit() or len(dni) != 8:
-        return create_api_response(False, 400, "El DNI debe ser un número de 8 dígitos")
-    
-    # Validar que no sea un DNI obviamente inválido
-    if dni in ["00000000", "11111111", "22222222", "33333333", "44444444", 
-               "55555555", "66666666", "77777777", "88888888", "99999999"]:
-        return create_api_response(False, 400, "DNI inválido")
+    error = dni_service.validar_dni(dni)
+    if error:
+        return create_api_response(False, 400, error)
         
     persona, mensaje = await dni_service.buscar_persona(db, dni)
     
     if persona:
-        data = PersonaResponse.model_validate(persona)
-        return create_api_response(True, 200, mensaje, data)
+        # dni_service ya devuelve un PersonaResponse validado
+        return create_api_response(True, 200, mensaje, persona)
     else:
         return create_api_response(False, 404, mensaje)
 
@@ -270,38 +342,185 @@ async def buscar_persona_admin(
 @limiter.limit("5/hour")
 async def descargar_backup(
     request: Request,
-    db: Session = Depends(get_db),
+    gzip: bool = False,
     _: bool = Depends(verificar_admin)
 ):
     """
-    Descarga la base de datos SQLite como backup.
+    Descarga un backup consistente de la base de datos SQLite.
+    Se toma un snapshot con la API de backup de SQLite (sin bloquear a los
+    escritores) y se envía por partes, opcionalmente comprimido con gzip.
     Requiere autenticación de administrador.
     Limitado a 5 descargas por hora por seguridad.
     """
-    settings = get_settings()
-    # Extraer la ruta del archivo de DATABASE_URL
-    db_path = settings.DATABASE_URL.replace("sqlite:///", "")
+    if backup_service.ruta_base_datos() is None:
+        return create_api_response(False, 404, "Archivo de base de datos no encontrado")
     
-    # Convertir rutas relativas a absolutas
-    if db_path.startswith("./"):
-        db_path = os.path.abspath(db_path)
+    from datetime import datetime
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"backup_personas_{timestamp}.db"
+    if gzip:
+        filename += ".gz"
     
-    if os.path.exists(db_path):
-        from datetime import datetime
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"backup_personas_{timestamp}.db"
-        
-        # Usar headers explícitos para evitar problemas con el filename
-        headers = {
-            "Content-Disposition": f'attachment; filename="{filename}"'
+    # Usar headers explícitos para evitar problemas con el filename
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"'
+    }
+    
+    return StreamingResponse(
+        backup_service.generar_backup(gzip),
+        headers=headers,
+        media_type="application/gzip" if gzip else "application/octet-stream"
+    )
+
+
+@app.get("/api/backup/snapshots")
+async def listar_snapshots(
+    _: bool = Depends(verificar_admin)
+):
+    """Lista los snapshots programados guardados, con su sha256."""
+    return create_api_response(True, 200, "Snapshots listados", backup_service.leer_manifiesto())
+
+
+@app.post("/api/backup/snapshots")
+@limiter.limit("5/hour")
+async def crear_snapshot(
+    request: Request,
+    _: bool = Depends(verificar_admin)
+):
+    """Toma un snapshot ahora y lo agrega al manifiesto."""
+    if backup_service.ruta_base_datos() is None:
+        return create_api_response(False, 404, "Archivo de base de datos no encontrado")
+    
+    entrada = await backup_service.tomar_snapshot_async()
+    return create_api_response(True, 201, "Snapshot creado", entrada)
+
+
+@app.get("/api/backup/snapshots/{nombre}")
+async def descargar_snapshot(
+    nombre: str,
+    _: bool = Depends(verificar_admin)
+):
+    """Descarga un snapshot guardado."""
+    ruta = backup_service.ruta_snapshot(nombre)
+    if not ruta:
+        return create_api_response(False, 404, "Snapshot no encontrado")
+    
+    return FileResponse(
+        path=ruta,
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'},
+        media_type="application/gzip" if nombre.endswith(".gz") else "application/octet-stream"
+    )
+
+
+# ==================== Diagnóstico ====================
+
+@app.get("/api/diagnostico/db")
+async def diagnostico_db(
+    _: bool = Depends(verificar_admin)
+):
+    """Perfil de SQLite configurado, PRAGMAs efectivos y estado de los pools."""
+    return create_api_response(True, 200, "Diagnóstico de base de datos", await diagnostico_sqlite())
+
+
+@app.get("/api/perfiles")
+async def listar_perfiles(
+    _: bool = Depends(verificar_admin)
+):
+    """Perfiles de peticiones guardados (formato folded) y tasa de muestreo vigente."""
+    return create_api_response(
+        True, 200, "Perfiles obtenidos",
+        {"tasa_muestreo": perfilador.configuracion["tasa_muestreo"], "perfiles": perfilador.listar()}
+    )
+
+
+@app.put("/api/perfiles/config")
+async def configurar_perfilador(
+    config: PerfiladorConfig,
+    _: bool = Depends(verificar_admin)
+):
+    """Cambia la probabilidad de perfilar cada petición (0 = solo con X-Profile)."""
+    perfilador.configuracion["tasa_muestreo"] = config.tasa_muestreo
+    return create_api_response(True, 200, "Perfilador configurado", perfilador.configuracion)
+
+
+@app.get("/api/perfiles/{nombre}")
+async def descargar_perfil(
+    nombre: str,
+    _: bool = Depends(verificar_admin)
+):
+    """Descarga un perfil para abrirlo con flamegraph.pl o speedscope."""
+    ruta = perfilador.ruta_perfil(nombre)
+    if not ruta:
+        return create_api_response(False, 404, "Perfil no encontrado")
+    
+    return FileResponse(
+        path=ruta,
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'},
+        media_type="text/plain"
+    )
+
+
+# ==================== Caché ====================
+
+@app.get("/api/estadisticas")
+async def estadisticas(
+    dias: int = 30,
+    db: AsyncSession = Depends(get_read_db),
+    _: bool = Depends(verificar_admin)
+):
+    """
+    Resumen para el panel: total de personas, registros por origen
+    (apisperu, manual, importacion) y registros por día de los últimos días.
+    Se lee de los contadores, sin recorrer la tabla.
+    """
+    dias = max(1, min(dias, 366))
+    return create_api_response(
+        True, 200, "Estadísticas obtenidas",
+        await estadisticas_service.resumen(db, dias)
+    )
+
+
+@app.get("/api/cache/estadisticas")
+async def estadisticas_cache(
+    _: bool = Depends(verificar_admin)
+):
+    """Devuelve los contadores de la caché en memoria y de consultas agrupadas."""
+    return create_api_response(
+        True, 200, "Estadísticas de caché obtenidas",
+        {
+            "persona_cache": persona_cache.stats(),
+            "no_encontrado_cache": no_encontrado_cache.stats(),
+            "token_cache": token_cache.stats(),
+            "conteo_cache": conteo_cache.stats(),
+            "login_cache": login_cache.stats(),
+            "login_bloqueo_cache": login_bloqueo_cache.stats(),
+            "consultas_agrupadas": dni_service.consultas_en_curso.stats(),
+            "refrescos": dni_service.estado_refrescos()
         }
-        
-        return FileResponse(
-            path=db_path,
-            headers=headers,
-            media_type='application/octet-stream'
-        )
-    return create_api_response(False, 404, "Archivo de base de datos no encontrado")
+    )
+
+
+@app.get("/api/upstream/estado")
+async def estado_upstream(
+    _: bool = Depends(verificar_admin)
+):
+    """
+    Estado del circuito hacia apisperu.com, percentiles de latencia, timeout
+    de lectura vigente y contadores de llamadas, reintentos y errores.
+    """
+    return create_api_response(
+        True, 200, "Estado de la API externa obtenido", upstream_service.estado()
+    )
+
+
+@app.delete("/api/cache", response_model=MessageResponse)
+async def limpiar_cache(
+    _: bool = Depends(verificar_admin)
+):
+    """Vacía la caché en memoria de personas y de DNIs no encontrados."""
+    persona_cache.clear()
+    no_encontrado_cache.clear()
+    return create_api_response(True, 200, "Caché vaciada correctamente")
 
 
 # ==================== Gestión de Tokens ====================
@@ -309,32 +528,35 @@ async def descargar_backup(
 @app.post("/api/tokens", response_model=TokenResponse)
 async def crear_token(
     token_data: TokenCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     _: bool = Depends(verificar_admin)
 ):
     """Crea un nuevo token de API. Requiere autenticación de administrador."""
-    nuevo_token = token_service.crear_token(db, token_data.nombre, token_data.descripcion)
+    nuevo_token = await token_service.crear_token(
+        db, token_data.nombre, token_data.descripcion,
+        token_data.limite_por_minuto, token_data.cuota_diaria
+    )
     return create_api_response(True, 201, "Token creado exitosamente", nuevo_token)
 
 
 @app.get("/api/tokens", response_model=TokenList)
 async def listar_tokens(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     _: bool = Depends(verificar_admin)
 ):
     """Lista todos los tokens de API. Requiere autenticación de administrador."""
-    tokens = token_service.listar_tokens(db)
+    tokens = await token_service.listar_tokens(db)
     return create_api_response(True, 200, "Tokens listados exitosamente", {"tokens": tokens, "total": len(tokens)})
 
 
 @app.delete("/api/tokens/{token_id}", response_model=MessageResponse)
 async def eliminar_token(
     token_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     _: bool = Depends(verificar_admin)
 ):
     """Elimina un token de API. Requiere autenticación de administrador."""
-    if token_service.eliminar_token(db, token_id):
+    if await token_service.eliminar_token(db, token_id):
         return create_api_response(True, 200, "Token eliminado correctamente")
     else:
         return create_api_response(False, 404, "Token no encontrado")
@@ -343,11 +565,11 @@ async def eliminar_token(
 @app.patch("/api/tokens/{token_id}/toggle", response_model=TokenResponse)
 async def toggle_token_estado(
     token_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     _: bool = Depends(verificar_admin)
 ):
     """Activa/desactiva un token. Requiere autenticación de administrador."""
-    token = token_service.toggle_token(db, token_id)
+    token = await token_service.toggle_token(db, token_id)
     
     if token:
         return create_api_response(True, 200, "Estado del token actualizado", token)
@@ -355,15 +577,36 @@ async def toggle_token_estado(
         return create_api_response(False, 404, "Token no encontrado")
 
 
+@app.patch("/api/tokens/{token_id}/limites", response_model=TokenResponse)
+async def actualizar_limites_token(
+    token_id: int,
+    limites: TokenLimites,
+    db: AsyncSession = Depends(get_db),
+    _: bool = Depends(verificar_admin)
+):
+    """
+    Cambia los límites de un token: peticiones por minuto y cuota diaria.
+    None usa los valores por defecto y 0 quita el límite.
+    """
+    token = await token_service.actualizar_limites(
+        db, token_id, limites.limite_por_minuto, limites.cuota_diaria
+    )
+    
+    if token:
+        return create_api_response(True, 200, "Límites del token actualizados", token)
+    else:
+        return create_api_response(False, 404, "Token no encontrado")
+
+
 # ==================== Configuración ====================
 
 @app.get("/api/config", response_model=ConfigResponse)
 async def obtener_config(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     _: bool = Depends(verificar_admin)
 ):
     """Obtiene el estado de la configuración."""
-    config_db = db.query(Config).filter(Config.clave == "apisperu_token").first()
+    config_db = await db.scalar(select(Config).where(Config.clave == "apisperu_token"))
     settings = get_settings()
     env_token = getattr(settings, 'APISPERU_TOKEN', None)
     
@@ -379,11 +622,11 @@ async def obtener_config(
 @app.put("/api/config", response_model=MessageResponse)
 async def actualizar_config(
     config_data: ConfigUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     _: bool = Depends(verificar_admin)
 ):
     """Actualiza la configuración. Requiere autenticación de administrador."""
-    dni_service.guardar_token_apisperu(db, config_data.apisperu_token)
+    await dni_service.guardar_token_apisperu(db, config_data.apisperu_token)
     return create_api_response(True, 200, "Token de apisperu.com actualizado correctamente")
 
 
@@ -391,7 +634,8 @@ async def actualizar_config(
 
 from .schemas import PersonasPaginadas, PersonaUpdate, PersonaCreate
 from .models import Persona
-from sqlalchemy import or_
+from typing import Optional
+from datetime import datetime, timezone
 import math
 
 @app.get("/api/personas", response_model=PersonasPaginadas)
@@ -399,34 +643,74 @@ async def listar_personas(
     q: str = "",
     page: int = 1,
     per_page: int = 10,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    exact: bool = False,
+    db: AsyncSession = Depends(get_read_db),
     _: bool = Depends(verificar_admin)
 ):
-    """Lista personas con búsqueda y paginación."""
-    if per_page not in [10, 20, 50, 100]:
-        per_page = 10
+    """
+    Lista personas con búsqueda y paginación.
     
-    query = db.query(Persona)
+    Si se envía el parámetro cursor (vacío para la primera página) se usa
+    paginación por cursor: páginas de hasta PERSONAS_CURSOR_MAX_PER_PAGE
+    registros ordenadas por id, con next_cursor/prev_cursor en la respuesta
+    y sin total. Si no, se usa paginación por número de página; en una
+    búsqueda el total es aproximado salvo que se pida exact=true.
+    """
+    # Búsqueda con el índice de texto completo (ignora mayúsculas y tildes,
+    # cada palabra se busca como prefijo y los resultados van por relevancia)
+    consulta = busqueda_service.consulta_fts(q) if q and len(q) >= 3 else None
     
-    if q and len(q) >= 3:
-        search_term = f"%{q}%"
-        query = query.filter(
-            or_(
-                Persona.nrodoc.ilike(search_term),
-                Persona.nombres.ilike(search_term),
-                Persona.apellido_paterno.ilike(search_term),
-                Persona.apellido_materno.ilike(search_term)
+    if cursor is not None:
+        settings = get_settings()
+        referencia = None
+        if cursor:
+            referencia = busqueda_service.decodificar_cursor(cursor)
+            if referencia is None:
+                return create_api_response(False, 400, "Cursor inválido")
+        
+        per_page = max(1, min(per_page, settings.PERSONAS_CURSOR_MAX_PER_PAGE))
+        if q and len(q) >= 3 and consulta is None:
+            personas, siguiente, anterior = [], None, None
+        else:
+            personas, siguiente, anterior = await busqueda_service.listar_por_cursor(
+                db, consulta, referencia, per_page
             )
-        )
+        
+        data = {
+            "items": personas,
+            "per_page": per_page,
+            "next_cursor": siguiente,
+            "prev_cursor": anterior
+        }
+        return create_api_response(True, 200, "Personas listadas exitosamente", data)
+    
+    if per_page not in [10, 20, 50, 100]:
+        per_page = 10
     
-    total = query.count()
+    # El total sin filtro sale de los contadores mantenidos por triggers; el
+    # de una búsqueda es aproximado (acotado y en caché) salvo con exact=true
+    total_aproximado = False
+    if consulta:
+        total, total_aproximado = await estadisticas_service.contar_busqueda(db, consulta, exact)
+    elif q and len(q) >= 3:
+        total = 0
+    else:
+        total = await estadisticas_service.total_personas(db)
     total_pages = math.ceil(total / per_page) if total > 0 else 1
     
     if page < 1: page = 1
     if page > total_pages: page = total_pages
     
     offset = (page - 1) * per_page
-    personas = query.order_by(Persona.id.desc()).offset(offset).limit(per_page).all()
+    if consulta:
+        personas = await busqueda_service.buscar(db, consulta, offset, per_page)
+    elif total:
+        personas = list(await db.scalars(
+            select(Persona).order_by(Persona.id.desc()).offset(offset).limit(per_page)
+        ))
+    else:
+        personas = []
     
     # El helper create_api_response se encargará de aplanar la estructura si detecta items y total
     data = {
@@ -434,20 +718,84 @@ async def listar_personas(
         "total": total,
         "page": page,
         "per_page": per_page,
-        "total_pages": total_pages
+        "total_pages": total_pages,
+        "total_aproximado": total_aproximado
     }
     
     return create_api_response(True, 200, "Personas listadas exitosamente", data)
 
 
+@app.get("/api/personas/exportar")
+async def exportar_personas(
+    formato: str = "ndjson",
+    gzip: bool = False,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    actualizado_desde: Optional[datetime] = None,
+    _: bool = Depends(verificar_admin)
+):
+    """
+    Exporta personas como NDJSON o CSV, enviado por partes y opcionalmente
+    comprimido con gzip. desde/hasta filtran por fecha de registro y
+    actualizado_desde devuelve lo registrado o actualizado desde esa fecha;
+    la cabecera X-Exportacion-Marca sirve como actualizado_desde de la
+    siguiente exportación incremental.
+    """
+    if formato not in export_service.FORMATOS:
+        return create_api_response(False, 400, "Formato no soportado (use ndjson o csv)")
+    
+    # Se toma antes de empezar a leer para no perder cambios concurrentes
+    marca = datetime.now(timezone.utc).replace(microsecond=0)
+    nombre = f"personas_{marca.strftime('%Y%m%d_%H%M%S')}.{formato}"
+    media_type = "application/x-ndjson" if formato == "ndjson" else "text/csv"
+    if gzip:
+        nombre += ".gz"
+        media_type = "application/gzip"
+    
+    headers = {
+        "Content-Disposition": f'attachment; filename="{nombre}"',
+        "X-Exportacion-Marca": marca.isoformat()
+    }
+    return StreamingResponse(
+        export_service.generar_exportacion(formato, desde, hasta, actualizado_desde, gzip),
+        media_type=media_type,
+        headers=headers
+    )
+
+
+@app.post("/api/personas/importar")
+async def importar_personas(
+    request: Request,
+    formato: str = "csv",
+    db: AsyncSession = Depends(get_db),
+    _: bool = Depends(verificar_admin)
+):
+    """
+    Importa personas desde un CSV con encabezado (columnas de PersonaCreate)
+    o NDJSON enviado como cuerpo de la petición. Las filas válidas se
+    insertan o actualizan por nrodoc y quedan disponibles para las
+    búsquedas sin consultar la API externa.
+    """
+    if formato not in import_service.FORMATOS:
+        return create_api_response(False, 400, "Formato no soportado (use csv o ndjson)")
+    
+    try:
+        resumen = await import_service.importar_personas(db, request.stream(), formato)
+    except ValueError as e:
+        return create_api_response(False, 400, str(e))
+    
+    mensaje = f"Importación terminada: {resumen['insertadas']} nuevas, {resumen['actualizadas']} actualizadas, {resumen['omitidas']} omitidas (manuales), {resumen['con_error']} con error"
+    return create_api_response(True, 200, mensaje, resumen)
+
+
 @app.get("/api/personas/{persona_id}", response_model=PersonaResponse)
 async def obtener_persona(
     persona_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     _: bool = Depends(verificar_admin)
 ):
     """Obtiene una persona por ID."""
-    persona = db.query(Persona).filter(Persona.id == persona_id).first()
+    persona = await db.get(Persona, persona_id)
     if not persona:
         return create_api_response(False, 404, "Persona no encontrada")
     return create_api_response(True, 200, "Persona encontrada", persona)
@@ -456,18 +804,19 @@ async def obtener_persona(
 @app.post("/api/personas", response_model=PersonaResponse)
 async def crear_persona(
     persona_data: PersonaCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     _: bool = Depends(verificar_admin)
 ):
     """Crea una nueva persona manualmente."""
-    existente = db.query(Persona).filter(Persona.nrodoc == persona_data.nrodoc).first()
+    existente = await db.scalar(select(Persona).where(Persona.nrodoc == persona_data.nrodoc))
     if existente:
         return create_api_response(False, 400, "Ya existe una persona con ese DNI")
     
-    nueva_persona = Persona(**persona_data.model_dump())
+    nueva_persona = Persona(**persona_data.model_dump(), origen="manual")
     db.add(nueva_persona)
-    db.commit()
-    db.refresh(nueva_persona)
+    await db.commit()
+    await db.refresh(nueva_persona)
+    await dni_service.invalidar_cache(db, nueva_persona.nrodoc)
     return create_api_response(True, 201, "Persona creada exitosamente", nueva_persona)
 
 
@@ -475,11 +824,11 @@ async def crear_persona(
 async def actualizar_persona(
     persona_id: int,
     persona_data: PersonaUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     _: bool = Depends(verificar_admin)
 ):
     """Actualiza una persona existente."""
-    persona = db.query(Persona).filter(Persona.id == persona_id).first()
+    persona = await db.get(Persona, persona_id)
     if not persona:
         return create_api_response(False, 404, "Persona no encontrada")
     
@@ -487,25 +836,29 @@ async def actualizar_persona(
     for key, value in update_data.items():
         if value is not None:
             setattr(persona, key, value)
+    # Los datos editados a mano ya no se refrescan desde apisperu.com
+    persona.origen = "manual"
     
-    db.commit()
-    db.refresh(persona)
+    await db.commit()
+    await db.refresh(persona)
+    await dni_service.invalidar_cache(db, persona.nrodoc)
     return create_api_response(True, 200, "Persona actualizada exitosamente", persona)
 
 
 @app.delete("/api/personas/{persona_id}", response_model=MessageResponse)
 async def eliminar_persona(
     persona_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     _: bool = Depends(verificar_admin)
 ):
     """Elimina una persona de la base de datos."""
-    persona = db.query(Persona).filter(Persona.id == persona_id).first()
+    persona = await db.get(Persona, persona_id)
     if not persona:
         return create_api_response(False, 404, "Persona no encontrada")
     
-    db.delete(persona)
-    db.commit()
+    await db.delete(persona)
+    await db.commit()
+    await dni_service.invalidar_cache(db, persona.nrodoc)
     return create_api_response(True, 200, "Persona eliminada correctamente")
 
 
@@ -527,7 +880,27 @@ async def serve_frontend():
     return {"message": "DNI Lookup API - Frontend no disponible"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """
+    Métricas en formato de texto de Prometheus. Si METRICS_TOKEN está
+    configurado se exige Authorization: Bearer <METRICS_TOKEN>.
+    """
+    settings = get_settings()
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if settings.METRICS_TOKEN and not secrets.compare_digest(
+        (authorization or "").encode("utf8"), f"Bearer {settings.METRICS_TOKEN}".encode("utf8")
+    ):
+        raise HTTPException(status_code=401, detail="Token de métricas inválido")
+    return Response(content=metricas.exponer(), media_type=metricas.CONTENT_TYPE)
+
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint para Dokploy"""
-    return {"status": "healthy"}
+    """
+    Health check endpoint para Dokploy.
+    El servicio sigue sano con el circuito abierto: los datos locales se
+    siguen sirviendo, solo fallan rápido las consultas a la API externa.
+    """
+    return {"status": "healthy", "apisperu": upstream_service.circuito.estado}
@@ -0,0 +1,167 @@
+"""
+Métricas del servicio en el formato de texto de Prometheus (GET /metrics).
+
+Los contadores e histogramas no usan locks: se actualizan desde el hilo del
+event loop, donde sumar a un diccionario o una lista no se intercala con
+otra actualización. Los nombres de métricas y etiquetas siguen las
+convenciones de Prometheus (en inglés); los valores que vienen del dominio
+(resultado de una búsqueda, nombre de caché) quedan en español.
+"""
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Límites de los histogramas de latencia, en segundos
+LIMITES_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres: Sequence[str], valores: Tuple, extra: str = "") -> str:
+    partes = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) and not valor.is_integer() else str(int(valor))
+
+
+class Contador:
+    """Contador que solo crece, con etiquetas opcionales"""
+
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.valores: Dict[Tuple, float] = {}
+
+    def inc(self, *etiquetas, valor: float = 1) -> None:
+        self.valores[etiquetas] = self.valores.get(etiquetas, 0) + valor
+
+    def muestras(self) -> List[str]:
+        return [
+            f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}"
+            for clave, valor in sorted(self.valores.items())
+        ]
+
+
+class Histograma:
+    """
+    Histograma con límites fijos. Cada serie es una lista con la cantidad
+    por intervalo (el último es +Inf) seguida de la suma observada; los
+    acumulados que pide Prometheus se calculan al exponer.
+    """
+
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (), limites: Sequence[float] = LIMITES_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.limites = tuple(limites)
+        self.series: Dict[Tuple, list] = {}
+
+    def observar(self, valor: float, *etiquetas) -> None:
+        serie = self.series.get(etiquetas)
+        if serie is None:
+            serie = self.series[etiquetas] = [0] * (len(self.limites) + 1) + [0.0]
+        serie[bisect_left(self.limites, valor)] += 1
+        serie[-1] += valor
+
+    def muestras(self) -> List[str]:
+        lineas = []
+        for clave, serie in sorted(self.series.items()):
+            acumulado = 0
+            for limite, cantidad in zip(self.limites + (float("inf"),), serie):
+                acumulado += cantidad
+                le = f'le="{_numero(limite)}"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(serie[-1])}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {acumulado}")
+        return lineas
+
+
+class Recolector:
+    """
+    Métrica que se lee al exponer a partir de una función que devuelve
+    {valores_de_etiquetas: valor}; sirve para estado que ya existe en otro
+    lado (tamaño de cachés, estado del circuito, pools).
+    """
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str], funcion: Callable[[], Dict[Tuple, float]], tipo: str = "gauge"):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.funcion = funcion
+        self.tipo = tipo
+
+    def muestras(self) -> List[str]:
+        return [
+            f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}"
+            for clave, valor in sorted(self.funcion().items())
+        ]
+
+
+_registro: List = []
+
+
+def registrar(metrica):
+    """Agrega una métrica a la exposición de /metrics y la devuelve"""
+    _registro.append(metrica)
+    return metrica
+
+
+def exponer() -> str:
+    """Todas las métricas registradas en formato de texto de Prometheus"""
+    lineas = []
+    for metrica in _registro:
+        lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+        lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+        lineas.extend(metrica.muestras())
+    return "\n".join(lineas) + "\n"
+
+
+# ==================== Métricas del servicio ====================
+
+peticiones_http = registrar(Contador(
+    "dni_http_requests_total", "Peticiones HTTP por ruta, método y código", ("method", "route", "status")
+))
+duracion_http = registrar(Histograma(
+    "dni_http_request_duration_seconds", "Duración de las peticiones HTTP por ruta", ("method", "route")
+))
+busquedas = registrar(Contador(
+    "dni_lookups_total",
+    "Búsquedas de DNI por resultado: memoria, base_datos, cache_negativa, api_externa, no_encontrado o error",
+    ("result",)
+))
+busquedas_desactualizadas = registrar(Contador(
+    "dni_lookups_stale_total", "Búsquedas servidas con datos desactualizados"
+))
+llamadas_upstream = registrar(Contador(
+    "dni_upstream_requests_total",
+    "Llamadas a apisperu.com por código HTTP (o timeout, error_conexion, circuito_abierto)",
+    ("status",)
+))
+duracion_upstream = registrar(Histograma(
+    "dni_upstream_request_duration_seconds", "Duración de cada llamada a apisperu.com"
+))
+duracion_consultas_db = registrar(Histograma(
+    "dni_db_query_duration_seconds", "Duración de las consultas SQL por motor y operación", ("engine", "operation")
+))
+duracion_commits_db = registrar(Histograma(
+    "dni_db_commit_duration_seconds", "Duración de los commits de sesión (incluye el flush)"
+))
+rechazos_limite = registrar(Contador(
+    "dni_rate_limit_rejections_total",
+    "Peticiones rechazadas por límite: ip, token_minuto, token_cuota o login",
+    ("limit",)
+))
@@ -0,0 +1,93 @@
+"""
+Middleware ASGI de la aplicación.
+
+Un solo middleware ASGI puro (sin BaseHTTPMiddleware, que ejecuta la app en
+otra tarea y copia la respuesta) que en cada petición HTTP:
+- agrega las cabeceras de seguridad y las X-RateLimit-* del token,
+- mide las fases de la petición y las envía en Server-Timing,
+- registra las métricas por ruta,
+- deja en el log las peticiones más lentas que SLOW_REQUEST_MS y
+- perfila las peticiones que lo piden o que salen sorteadas.
+"""
+import asyncio
+import logging
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import metricas, perfilador, tiempos
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+CABECERAS_SEGURIDAD = {
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "X-XSS-Protection": "1; mode=block",
+    "Referrer-Policy": "strict-origin-when-cross-origin",
+    "Cache-Control": "no-store, no-cache, must-revalidate",
+}
+
+
+class CabecerasMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        settings = get_settings()
+        self.server_timing = settings.SERVER_TIMING_ENABLED
+        self.umbral_lento = settings.SLOW_REQUEST_MS / 1000
+        self.cabecera_perfil = bool(settings.PROFILE_TOKEN)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        perfil = None
+        if not scope["path"].startswith("/api/perfiles"):
+            cabecera = None
+            if self.cabecera_perfil:
+                cabecera = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"x-profile"), None)
+            if perfilador.debe_perfilar(cabecera):
+                perfil = perfilador.muestreador.iniciar()
+
+        inicio = time.perf_counter()
+        token = tiempos.iniciar()
+        fases = tiempos.actuales()
+        estado = 500
+
+        async def enviar(message: Message) -> None:
+            nonlocal estado
+            if message["type"] == "http.response.start":
+                estado = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.update(CABECERAS_SEGURIDAD)
+                # Límites del token de API (los deja verificar_api_token en request.state)
+                rate_limit = scope.get("state", {}).get("rate_limit")
+                if rate_limit:
+                    headers.update(rate_limit)
+                if self.server_timing:
+                    headers["Server-Timing"] = tiempos.server_timing(fases, time.perf_counter() - inicio)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            tiempos.terminar(token)
+            duracion = time.perf_counter() - inicio
+            # Métricas por plantilla de ruta (no por URL, para acotar las series)
+            ruta = getattr(scope.get("route"), "path", "sin_ruta")
+            metodo = scope["method"]
+            metricas.peticiones_http.inc(metodo, ruta, str(estado))
+            metricas.duracion_http.observar(duracion, metodo, ruta)
+
+            if self.umbral_lento and duracion >= self.umbral_lento:
+                logger.warning(
+                    "Petición lenta: %s %s -> %d en %.1f ms (%s)",
+                    metodo, ruta, estado, duracion * 1000,
+                    ", ".join(f"{nombre}={segundos * 1000:.1f}ms" for nombre, segundos in fases.items()) or "sin fases",
+                )
+
+            if perfil is not None:
+                perfilador.muestreador.detener(perfil)
+                await asyncio.to_thread(perfilador.guardar, perfil, metodo, ruta)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -14,8 +14,33 @@ class Persona(Base):
     apellido_paterno = Column(String(100))
     apellido_materno = Column(String(100))
     codigo_verificacion = Column(String(10))
+    # De dónde viene el registro: apisperu, manual o importacion (NULL en
+    # los registros anteriores a la columna; no se refrescan)
+    origen = Column(String(20))
+    fecha_registro = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    fecha_actualizacion = Column(DateTime(timezone=True), onupdate=func.now(), index=True)
+
+
+class ContadorPersonas(Base):
+    """
+    Contadores de la tabla personas mantenidos por triggers: total, por
+    origen ("origen:<valor>") y por día de registro ("dia:AAAA-MM-DD")
+    """
+    __tablename__ = "contadores_personas"
+    
+    clave = Column(String(40), primary_key=True)
+    valor = Column(Integer, nullable=False, default=0)
+
+
+class DniNoEncontrado(Base):
+    """DNIs que la API externa reportó como no encontrados (caché negativa)"""
+    __tablename__ = "dnis_no_encontrados"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    nrodoc = Column(String(20), unique=True, index=True, nullable=False)
+    mensaje = Column(String(255))
     fecha_registro = Column(DateTime(timezone=True), server_default=func.now())
-    fecha_actualizacion = Column(DateTime(timezone=True), onupdate=func.now())
+    fecha_expiracion = Column(DateTime(timezone=True), nullable=False, index=True)
 
 
 class ApiToken(Base):
@@ -29,6 +54,22 @@ class ApiToken(Base):
     activo = Column(Boolean, default=True)
     fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
     ultimo_uso = Column(DateTime(timezone=True))
+    total_peticiones = Column(Integer, default=0, server_default="0", nullable=False)
+    # Límites propios del token (None = usar los valores por defecto, 0 = sin límite)
+    limite_por_minuto = Column(Integer)
+    cuota_diaria = Column(Integer)
+    # Uso del día (UTC) sincronizado periódicamente desde memoria
+    uso_diario = Column(Integer, default=0, server_default="0", nullable=False)
+    fecha_uso_diario = Column(Date)
+
+
+class IntentoLogin(Base):
+    """Intentos fallidos de login por IP (si LOGIN_THROTTLE_PERSIST está activo)"""
+    __tablename__ = "intentos_login"
+    
+    ip = Column(String(64), primary_key=True)
+    intentos = Column(Integer, nullable=False, default=0)
+    ultimo_intento = Column(DateTime, nullable=False, index=True)
 
 
 class Config(Base):
@@ -40,3 +81,46 @@ class Config(Base):
     valor = Column(String(500))
     descripcion = Column(String(255))
     fecha_actualizacion = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class TrabajoLote(Base):
+    """Trabajo en segundo plano para resolver listas grandes de DNIs"""
+    __tablename__ = "trabajos_lote"
+    
+    id = Column(String(32), primary_key=True)
+    # cargando, pendiente, procesando, completado, error
+    estado = Column(String(20), default="pendiente", index=True, nullable=False)
+    total = Column(Integer, default=0)
+    procesados = Column(Integer, default=0)
+    encontrados = Column(Integer, default=0)
+    no_encontrados = Column(Integer, default=0)
+    invalidos = Column(Integer, default=0)
+    # DNIs que siguieron fallando por errores pasajeros tras JOB_RETRY_MAX_ATTEMPTS
+    errores = Column(Integer, default=0, server_default="0", nullable=False)
+    mensaje = Column(String(255))
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
+    fecha_inicio = Column(DateTime(timezone=True))
+    fecha_fin = Column(DateTime(timezone=True))
+    # Reserva del proceso que lo está procesando; si vence, otro lo retoma
+    reservado_hasta = Column(DateTime(timezone=True))
+
+
+class TrabajoLoteItem(Base):
+    """DNI individual dentro de un trabajo por lotes y su resultado"""
+    __tablename__ = "trabajos_lote_items"
+    __table_args__ = (
+        Index("ix_trabajos_lote_items_trabajo_posicion", "trabajo_id", "posicion"),
+        Index("ix_trabajos_lote_items_trabajo_estado", "trabajo_id", "estado"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    trabajo_id = Column(String(32), ForeignKey("trabajos_lote.id", ondelete="CASCADE"), nullable=False)
+    posicion = Column(Integer, nullable=False)
+    nrodoc = Column(String(20), nullable=False)
+    # pendiente, encontrado, no_encontrado, invalido, error
+    estado = Column(String(20), default="pendiente", nullable=False)
+    mensaje = Column(String(255))
+    persona_id = Column(Integer)
+    # Intentos fallidos por errores pasajeros y cuándo se vuelve a intentar
+    intentos = Column(Integer, default=0, server_default="0", nullable=False)
+    reintentar_desde = Column(DateTime)
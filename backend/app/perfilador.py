@@ -0,0 +1,145 @@
+"""
+Perfilador por muestreo de peticiones, para administradores.
+
+Mientras hay peticiones perfilándose, un hilo toma cada PROFILE_INTERVAL_MS
+la pila del hilo del event loop (sys._current_frames) y cuenta cuántas veces
+aparece cada pila. El resultado se guarda en formato "folded"
+(`modulo:funcion;modulo:funcion N` por línea), el que usan flamegraph.pl y
+speedscope para dibujar el flamegraph.
+
+Una petición se perfila si trae la cabecera X-Profile con el valor de
+PROFILE_TOKEN o, al azar, con la probabilidad configurada (PUT
+/api/perfiles/config). Como el event loop atiende varias peticiones a la
+vez, las muestras incluyen lo que hacían las demás en ese momento; las
+pilas en select() son tiempo esperando E/S.
+"""
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from .config import get_settings
+
+_NOMBRE_PERFIL = re.compile(r"^perfil_\d{8}_\d{6}_\d{6}_[A-Z]+_[\w-]*\.folded$")
+
+# Probabilidad de perfilar una petición; se puede cambiar sin reiniciar
+configuracion = {"tasa_muestreo": get_settings().PROFILE_SAMPLE_RATE}
+
+
+def _nombre_marco(marco) -> str:
+    return f"{marco.f_globals.get('__name__', '?')}:{marco.f_code.co_name}"
+
+
+class Muestreador:
+    """Hilo que muestrea la pila del event loop mientras haya perfiles activos"""
+
+    def __init__(self):
+        self._activos: List[Counter] = []
+        self._lock = threading.Lock()
+        self._hilo: Optional[threading.Thread] = None
+        self._id_hilo_loop: Optional[int] = None
+
+    def iniciar(self) -> Counter:
+        """Empieza un perfil; se llama desde el hilo del event loop"""
+        perfil = Counter()
+        with self._lock:
+            self._id_hilo_loop = threading.get_ident()
+            self._activos.append(perfil)
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._muestrear, name="perfilador", daemon=True)
+                self._hilo.start()
+        return perfil
+
+    def detener(self, perfil: Counter) -> Counter:
+        with self._lock:
+            self._activos.remove(perfil)
+        return perfil
+
+    def _muestrear(self) -> None:
+        intervalo = get_settings().PROFILE_INTERVAL_MS / 1000
+        while True:
+            time.sleep(intervalo)
+            with self._lock:
+                if not self._activos:
+                    self._hilo = None
+                    return
+                perfiles = list(self._activos)
+                id_hilo = self._id_hilo_loop
+
+            marco = sys._current_frames().get(id_hilo)
+            nombres = []
+            while marco is not None:
+                nombres.append(_nombre_marco(marco))
+                marco = marco.f_back
+            pila = ";".join(reversed(nombres))
+            for perfil in perfiles:
+                perfil[pila] += 1
+
+
+muestreador = Muestreador()
+
+
+def debe_perfilar(valor_cabecera: Optional[str]) -> bool:
+    """Decide si la petición se perfila (cabecera X-Profile o muestreo)"""
+    token = get_settings().PROFILE_TOKEN
+    if valor_cabecera and token and secrets.compare_digest(valor_cabecera.encode(), token.encode()):
+        return True
+    tasa = configuracion["tasa_muestreo"]
+    return tasa > 0 and secrets.randbelow(1_000_000) < tasa * 1_000_000
+
+
+def guardar(perfil: Counter, metodo: str, ruta: str) -> Optional[str]:
+    """
+    Escribe el perfil en PROFILE_DIR y elimina los más antiguos que superan
+    PROFILE_MAX_FILES. Devuelve el nombre del archivo (None si no hubo
+    muestras).
+    """
+    if not perfil:
+        return None
+    settings = get_settings()
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+
+    fecha = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
+    ruta_limpia = re.sub(r"[^\w-]+", "_", ruta).strip("_")[:60]
+    nombre = f"perfil_{fecha}_{metodo}_{ruta_limpia}.folded"
+    with open(os.path.join(settings.PROFILE_DIR, nombre), "w", encoding="utf-8") as archivo:
+        for pila, cantidad in perfil.most_common():
+            archivo.write(f"{pila} {cantidad}\n")
+
+    for viejo in listar()[max(1, settings.PROFILE_MAX_FILES):]:
+        try:
+            os.remove(os.path.join(settings.PROFILE_DIR, viejo["archivo"]))
+        except FileNotFoundError:
+            pass
+    return nombre
+
+
+def listar() -> List[dict]:
+    """Perfiles guardados, del más reciente al más antiguo"""
+    directorio = get_settings().PROFILE_DIR
+    try:
+        nombres = [n for n in os.listdir(directorio) if _NOMBRE_PERFIL.match(n)]
+    except FileNotFoundError:
+        return []
+    perfiles = []
+    for nombre in sorted(nombres, reverse=True):
+        info = os.stat(os.path.join(directorio, nombre))
+        perfiles.append({
+            "archivo": nombre,
+            "fecha": datetime.fromtimestamp(info.st_mtime, timezone.utc).isoformat(),
+            "tamano": info.st_size,
+        })
+    return perfiles
+
+
+def ruta_perfil(nombre: str) -> Optional[str]:
+    """Ruta de un perfil guardado o None si el nombre no es válido"""
+    if not _NOMBRE_PERFIL.match(nombre):
+        return None
+    ruta = os.path.join(get_settings().PROFILE_DIR, nombre)
+    return ruta if os.path.isfile(ruta) else None
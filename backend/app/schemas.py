@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import Optional, Any, List
-from datetime import datetime
+from datetime import date, datetime
 
 
 # ==================== Estructura de Respuesta Estándar ====================
@@ -78,8 +78,15 @@ class PersonaResponse(PersonaBase):
     """Respuesta con datos completos de una persona"""
     id: int = Field(..., description="ID único en la base de datos")
     fecha_registro: Optional[datetime] = Field(None, description="Fecha de registro en el sistema")
+    fecha_actualizacion: Optional[datetime] = Field(None, description="Última actualización desde apisperu.com o manual")
     desde_cache: bool = Field(default=False, description="Indica si el dato proviene del caché local")
-    
+    desactualizado: bool = Field(
+        default=False,
+        description="El dato superó PERSONA_FRESHNESS_DAYS; se está actualizando en segundo plano"
+    )
+    # Se usa para decidir si el registro se refresca; no se envía en la respuesta
+    origen: Optional[str] = Field(None, exclude=True)
+
     class Config:
         from_attributes = True
 
@@ -107,6 +114,34 @@ class PersonaBusqueda(APIResponse):
     data: Optional[PersonaResponse] = None
 
 
+class BusquedaLote(BaseModel):
+    """Esquema para buscar varios DNIs en una sola petición"""
+    dnis: List[str] = Field(..., min_length=1, description="Lista de DNIs (8 dígitos)")
+
+
+class ResultadoLote(BaseModel):
+    """Resultado de la búsqueda de un DNI dentro de un lote"""
+    dni: str = Field(..., description="DNI consultado")
+    success: bool = Field(..., description="Indica si se encontró la persona")
+    code: int = Field(..., description="Código HTTP equivalente para este DNI")
+    message: str = Field(..., description="Mensaje descriptivo del resultado")
+    data: Optional[PersonaResponse] = None
+
+
+class PersonasLote(BaseModel):
+    """Respuesta de una búsqueda por lotes"""
+    items: List[ResultadoLote] = Field(..., description="Resultados en el orden solicitado")
+    total: int = Field(..., description="Total de DNIs distintos consultados")
+    encontrados: int = Field(..., description="DNIs encontrados")
+    no_encontrados: int = Field(..., description="DNIs no encontrados o con error")
+    invalidos: int = Field(..., description="DNIs con formato inválido")
+
+
+class PersonaBusquedaLote(APIResponse):
+    """Respuesta de búsqueda por lotes"""
+    data: Optional[PersonasLote] = None
+
+
 # ==================== API Token ====================
 
 class TokenBase(BaseModel):
@@ -115,7 +150,13 @@ class TokenBase(BaseModel):
     descripcion: Optional[str] = Field(None, description="Descripción del uso del token")
 
 
-class TokenCreate(TokenBase):
+class TokenLimites(BaseModel):
+    """Límites de un token (None = valores por defecto, 0 = sin límite)"""
+    limite_por_minuto: Optional[int] = Field(None, ge=0, description="Peticiones por minuto")
+    cuota_diaria: Optional[int] = Field(None, ge=0, description="Peticiones por día (UTC)")
+
+
+class TokenCreate(TokenBase, TokenLimites):
     """Esquema para crear un nuevo token"""
     pass
 
@@ -127,6 +168,11 @@ class TokenResponse(TokenBase):
     activo: bool = Field(..., description="Estado del token (activo/inactivo)")
     fecha_creacion: datetime = Field(..., description="Fecha de creación")
     ultimo_uso: Optional[datetime] = Field(None, description="Última vez que se usó el token")
+    total_peticiones: int = Field(0, description="Peticiones realizadas con el token")
+    limite_por_minuto: Optional[int] = Field(None, description="Peticiones por minuto (None = por defecto)")
+    cuota_diaria: Optional[int] = Field(None, description="Peticiones por día (None = por defecto)")
+    uso_diario: int = Field(0, description="Peticiones del día registrado en fecha_uso_diario")
+    fecha_uso_diario: Optional[date] = Field(None, description="Día (UTC) de uso_diario")
     
     class Config:
         from_attributes = True
@@ -153,3 +199,10 @@ class ConfigResponse(APIResponse):
 class MessageResponse(APIResponse):
     """Respuesta simple con mensaje"""
     pass
+
+
+# ==================== Perfilador ====================
+
+class PerfiladorConfig(BaseModel):
+    """Configuración del perfilador que se puede cambiar sin reiniciar"""
+    tasa_muestreo: float = Field(..., ge=0, le=1, description="Probabilidad de perfilar cada petición")
@@ -0,0 +1,123 @@
+"""
+Serialización rápida de las respuestas de la API.
+
+Usa orjson si está instalado (si no, json de la biblioteca estándar), arma
+el sobre estándar a partir de un prefijo precalculado por código HTTP y
+convierte los modelos de SQLAlchemy a diccionario leyendo directamente sus
+columnas.
+"""
+import json
+from datetime import date, datetime
+from typing import Any, Dict, List, Tuple
+
+from fastapi.responses import Response
+from sqlalchemy import inspect as sa_inspect
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+
+def _por_defecto(obj: Any) -> Any:
+    """Tipos que json no sabe convertir"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+if orjson is not None:
+    _OPCIONES = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        """Convierte a JSON (bytes UTF-8)"""
+        return orjson.dumps(obj, default=_por_defecto, option=_OPCIONES)
+else:
+    _encoder = json.JSONEncoder(
+        ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_por_defecto
+    )
+
+    def dumps(obj: Any) -> bytes:
+        """Convierte a JSON (bytes UTF-8)"""
+        return _encoder.encode(obj).encode("utf-8")
+
+
+# Columnas de cada modelo de SQLAlchemy, calculadas una sola vez por clase
+_columnas_por_clase: Dict[type, Tuple[str, ...]] = {}
+
+
+def _columnas(cls: type) -> Tuple[str, ...]:
+    columnas = _columnas_por_clase.get(cls)
+    if columnas is None:
+        columnas = tuple(attr.key for attr in sa_inspect(cls).mapper.column_attrs)
+        _columnas_por_clase[cls] = columnas
+    return columnas
+
+
+def fila_a_dict(obj: Any) -> Any:
+    """
+    Convierte un registro de SQLAlchemy o un modelo Pydantic a diccionario.
+    Las fechas se dejan como datetime; las convierte el codificador JSON.
+    """
+    if hasattr(obj, "__table__"):
+        datos = obj.__dict__
+        return {
+            columna: datos[columna] if columna in datos else getattr(obj, columna)
+            for columna in _columnas(type(obj))
+        }
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "__dict__"):
+        return {k: v for k, v in obj.__dict__.items() if not k.startswith("_")}
+    return obj
+
+
+def filas_a_dict(filas: List[Any]) -> List[Any]:
+    """Convierte una lista de registros con fila_a_dict"""
+    return [fila_a_dict(fila) for fila in filas]
+
+
+class Sobres:
+    """
+    Prefijos precalculados del sobre estándar de la API
+    ({"success", "code", "code_description", ...}) por éxito y código HTTP.
+    """
+
+    def __init__(self, descripciones: Dict[int, str]):
+        self._descripciones = descripciones
+        self._prefijos: Dict[Tuple[bool, int], bytes] = {}
+        for code in descripciones:
+            for success in (True, False):
+                self._prefijo(success, code)
+
+    def _prefijo(self, success: bool, code: int) -> bytes:
+        prefijo = self._prefijos.get((success, code))
+        if prefijo is None:
+            descripcion = self._descripciones.get(code, "Desconocido")
+            prefijo = (
+                b'{"success":' + (b"true" if success else b"false")
+                + b',"code":' + str(code).encode()
+                + b',"code_description":' + dumps(descripcion)
+                + b',"message":'
+            )
+            self._prefijos[(success, code)] = prefijo
+        return prefijo
+
+    def cuerpo(self, success: bool, code: int, message: str, data: Any = None) -> bytes:
+        """JSON completo de la respuesta; data debe ser serializable"""
+        partes = [self._prefijo(success, code), dumps(message)]
+        if data is not None:
+            partes.append(b',"data":')
+            partes.append(dumps(data))
+        partes.append(b"}")
+        return b"".join(partes)
+
+    def respuesta(self, success: bool, code: int, message: str, data: Any = None) -> Response:
+        """Respuesta HTTP con el JSON ya generado"""
+        return Response(
+            content=self.cuerpo(success, code, message, data),
+            status_code=code,
+            media_type="application/json",
+        )
@@ -0,0 +1,201 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional
+
+from ..config import get_settings
+from ..database import engine
+
+logger = logging.getLogger(__name__)
+
+_MANIFIESTO = "manifest.json"
+_NOMBRE_SNAPSHOT = re.compile(r"^personas_\d{8}_\d{6}\.db(\.gz)?$")
+_TAMANO_LECTURA = 1024 * 1024
+
+_tarea_snapshots: Optional[asyncio.Task] = None
+_snapshot_lock = asyncio.Lock()
+
+
+def ruta_base_datos() -> Optional[str]:
+    """Ruta absoluta del archivo SQLite o None si la base no es un archivo"""
+    ruta = engine.url.database
+    if engine.url.get_backend_name() != "sqlite" or not ruta or ruta == ":memory:":
+        return None
+    return os.path.abspath(ruta)
+
+
+def crear_snapshot(destino: str) -> None:
+    """
+    Copia la base de datos en destino con la API de backup de SQLite.
+
+    La copia se hace en un solo paso dentro de una transacción de lectura:
+    es consistente aunque haya escrituras en curso y, con WAL, no bloquea a
+    los escritores ni deja fuera lo que aún está en el archivo -wal.
+    """
+    origen = sqlite3.connect(ruta_base_datos(), timeout=get_settings().SQLITE_BUSY_TIMEOUT_MS / 1000)
+    try:
+        copia = sqlite3.connect(destino)
+        try:
+            origen.backup(copia)
+        finally:
+            copia.close()
+    finally:
+        origen.close()
+
+
+async def generar_backup(comprimir: bool = False) -> AsyncIterator[bytes]:
+    """
+    Crea un snapshot temporal y lo envía por partes, opcionalmente en gzip.
+    El archivo temporal se elimina al terminar o si el cliente se desconecta.
+    """
+    fd, temporal = tempfile.mkstemp(prefix="backup_personas_", suffix=".db")
+    os.close(fd)
+    try:
+        await asyncio.to_thread(crear_snapshot, temporal)
+
+        compresor = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+        with open(temporal, "rb") as archivo:
+            while True:
+                datos = await asyncio.to_thread(archivo.read, _TAMANO_LECTURA)
+                if not datos:
+                    break
+                if compresor:
+                    datos = compresor.compress(datos)
+                if datos:
+                    yield datos
+        if compresor:
+            yield compresor.flush()
+    finally:
+        os.remove(temporal)
+
+
+# ==================== Snapshots programados ====================
+
+def _sha256(ruta: str) -> str:
+    h = hashlib.sha256()
+    with open(ruta, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(_TAMANO_LECTURA), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def leer_manifiesto() -> List[dict]:
+    """Snapshots registrados en el manifiesto, del más reciente al más antiguo"""
+    ruta = os.path.join(get_settings().BACKUP_DIR, _MANIFIESTO)
+    try:
+        with open(ruta, encoding="utf-8") as archivo:
+            return json.load(archivo)
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+def _escribir_manifiesto(entradas: List[dict]) -> None:
+    directorio = get_settings().BACKUP_DIR
+    temporal = os.path.join(directorio, f".{_MANIFIESTO}.tmp")
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(entradas, archivo, indent=2)
+    os.replace(temporal, os.path.join(directorio, _MANIFIESTO))
+
+
+def ruta_snapshot(nombre: str) -> Optional[str]:
+    """Ruta de un snapshot del manifiesto o None si el nombre no es válido"""
+    if not _NOMBRE_SNAPSHOT.match(nombre):
+        return None
+    ruta = os.path.join(get_settings().BACKUP_DIR, nombre)
+    return ruta if os.path.isfile(ruta) else None
+
+
+def tomar_snapshot() -> dict:
+    """
+    Guarda un snapshot en BACKUP_DIR (comprimido si BACKUP_COMPRESS), lo
+    registra en el manifiesto con su sha256 y elimina los que superan
+    BACKUP_RETENTION.
+    """
+    settings = get_settings()
+    os.makedirs(settings.BACKUP_DIR, exist_ok=True)
+
+    fecha = datetime.now(timezone.utc)
+    nombre = f"personas_{fecha.strftime('%Y%m%d_%H%M%S')}.db"
+    if settings.BACKUP_COMPRESS:
+        nombre += ".gz"
+    destino = os.path.join(settings.BACKUP_DIR, nombre)
+
+    fd, temporal = tempfile.mkstemp(prefix=".snapshot_", suffix=".db", dir=settings.BACKUP_DIR)
+    os.close(fd)
+    try:
+        crear_snapshot(temporal)
+        if settings.BACKUP_COMPRESS:
+            with open(temporal, "rb") as entrada, gzip.open(f"{temporal}.gz", "wb", compresslevel=6) as salida:
+                shutil.copyfileobj(entrada, salida, _TAMANO_LECTURA)
+            os.replace(f"{temporal}.gz", destino)
+        else:
+            os.replace(temporal, destino)
+    finally:
+        for resto in (temporal, f"{temporal}.gz"):
+            if os.path.exists(resto):
+                os.remove(resto)
+
+    entrada = {
+        "archivo": nombre,
+        "fecha": fecha.isoformat(),
+        "tamano": os.path.getsize(destino),
+        "sha256": _sha256(destino),
+    }
+    entradas = [entrada] + [e for e in leer_manifiesto() if e["archivo"] != nombre]
+
+    conservar = max(1, settings.BACKUP_RETENTION)
+    for vieja in entradas[conservar:]:
+        ruta = os.path.join(settings.BACKUP_DIR, vieja["archivo"])
+        if os.path.exists(ruta):
+            os.remove(ruta)
+    _escribir_manifiesto(entradas[:conservar])
+
+    logger.info("Snapshot de la base de datos guardado en %s", destino)
+    return entrada
+
+
+async def tomar_snapshot_async() -> dict:
+    """Toma un snapshot en un hilo, uno a la vez"""
+    async with _snapshot_lock:
+        return await asyncio.to_thread(tomar_snapshot)
+
+
+async def _snapshots_periodicos() -> None:
+    """Toma un snapshot cada BACKUP_INTERVAL_HOURS"""
+    intervalo = get_settings().BACKUP_INTERVAL_HOURS * 3600
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            await tomar_snapshot_async()
+        except Exception:
+            logger.exception("Error tomando el snapshot programado")
+
+
+def iniciar_snapshots() -> None:
+    """Inicia los snapshots programados si BACKUP_INTERVAL_HOURS > 0"""
+    global _tarea_snapshots
+    if get_settings().BACKUP_INTERVAL_HOURS <= 0 or ruta_base_datos() is None:
+        return
+    if _tarea_snapshots is None or _tarea_snapshots.done():
+        _tarea_snapshots = asyncio.create_task(_snapshots_periodicos())
+
+
+async def detener_snapshots() -> None:
+    """Detiene la tarea de snapshots programados"""
+    global _tarea_snapshots
+    if _tarea_snapshots is not None:
+        _tarea_snapshots.cancel()
+        try:
+            await _tarea_snapshots
+        except asyncio.CancelledError:
+            pass
+        _tarea_snapshots = None
@@ -0,0 +1,193 @@
+import base64
+import json
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Persona
+
+# Índice de texto completo (FTS5) sobre la tabla personas.
+# Es una tabla "external content": no duplica los datos, solo el índice,
+# y se mantiene sincronizada con triggers. El tokenizador unicode61 con
+# remove_diacritics ignora mayúsculas y tildes ("PÉREZ" = "perez").
+# prefix='3 4' precalcula prefijos para que la búsqueda mientras se
+# escribe no recorra todo el índice.
+_DDL_FTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS personas_fts USING fts5(
+        nrodoc, nombres, apellido_paterno, apellido_materno,
+        content='personas', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='3 4'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS personas_fts_ai AFTER INSERT ON personas BEGIN
+        INSERT INTO personas_fts(rowid, nrodoc, nombres, apellido_paterno, apellido_materno)
+        VALUES (new.id, new.nrodoc, new.nombres, new.apellido_paterno, new.apellido_materno);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS personas_fts_ad AFTER DELETE ON personas BEGIN
+        INSERT INTO personas_fts(personas_fts, rowid, nrodoc, nombres, apellido_paterno, apellido_materno)
+        VALUES ('delete', old.id, old.nrodoc, old.nombres, old.apellido_paterno, old.apellido_materno);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS personas_fts_au
+    AFTER UPDATE OF nrodoc, nombres, apellido_paterno, apellido_materno ON personas BEGIN
+        INSERT INTO personas_fts(personas_fts, rowid, nrodoc, nombres, apellido_paterno, apellido_materno)
+        VALUES ('delete', old.id, old.nrodoc, old.nombres, old.apellido_paterno, old.apellido_materno);
+        INSERT INTO personas_fts(rowid, nrodoc, nombres, apellido_paterno, apellido_materno)
+        VALUES (new.id, new.nrodoc, new.nombres, new.apellido_paterno, new.apellido_materno);
+    END
+    """,
+]
+
+# Palabras del texto de búsqueda (letras y dígitos, incluye tildes y ñ)
+_PALABRAS = re.compile(r"\w+", re.UNICODE)
+
+# Página de resultados de una búsqueda, por relevancia (bm25)
+SQL_BUSCAR = """
+    SELECT personas.* FROM personas_fts
+    JOIN personas ON personas.id = personas_fts.rowid
+    WHERE personas_fts MATCH :q
+    ORDER BY personas_fts.rank, personas.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+# Direcciones de un cursor: hacia ids menores (siguiente) o mayores (anterior)
+SIGUIENTE = "sig"
+ANTERIOR = "ant"
+
+
+def crear_indice_fts(conn: Connection) -> None:
+    """
+    Crea el índice y sus triggers si no existen. Si el índice es nuevo y la
+    tabla ya tiene datos (base de datos existente), lo llena.
+    """
+    existia = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'personas_fts'"
+    )).first() is not None
+
+    for ddl in _DDL_FTS:
+        conn.execute(text(ddl))
+
+    if not existia:
+        reconstruir_indice_fts(conn)
+
+
+def reconstruir_indice_fts(conn: Connection) -> None:
+    """Regenera el índice completo a partir de la tabla personas"""
+    conn.execute(text("INSERT INTO personas_fts(personas_fts) VALUES ('rebuild')"))
+
+
+def consulta_fts(q: str) -> Optional[str]:
+    """
+    Convierte el texto del usuario en una consulta FTS5: cada palabra se
+    busca como prefijo y todas deben aparecer ("juan per" -> "juan"* "per"*).
+    Devuelve None si el texto no tiene palabras.
+    """
+    palabras = _PALABRAS.findall(q)
+    if not palabras:
+        return None
+    return " ".join(f'"{palabra}"*' for palabra in palabras)
+
+
+async def buscar(db: AsyncSession, consulta: str, offset: int, limit: int) -> List[Persona]:
+    """Personas que coinciden con la consulta FTS, ordenadas por relevancia (bm25)"""
+    stmt = select(Persona).from_statement(text(SQL_BUSCAR))
+    resultado = await db.scalars(stmt, {"q": consulta, "limit": limit, "offset": offset})
+    return list(resultado)
+
+
+def codificar_cursor(persona_id: int, direccion: str) -> str:
+    """Genera un cursor opaco a partir del id de referencia y la dirección"""
+    crudo = json.dumps({"id": persona_id, "d": direccion}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> Optional[Tuple[int, str]]:
+    """Devuelve (id, dirección) de un cursor o None si no es válido"""
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        persona_id, direccion = int(datos["id"]), datos["d"]
+    except (ValueError, TypeError, KeyError):
+        return None
+    if direccion not in (SIGUIENTE, ANTERIOR):
+        return None
+    return persona_id, direccion
+
+
+def sql_cursor_fts(con_referencia: bool, hacia_atras: bool) -> str:
+    """
+    Página de ids de una búsqueda a partir de un cursor (parámetros :q,
+    :ref y :limit), recorriendo el rowid del índice FTS
+    """
+    condiciones = ["personas_fts MATCH :q"]
+    if con_referencia:
+        condiciones.append("rowid > :ref" if hacia_atras else "rowid < :ref")
+    return (
+        f"SELECT rowid FROM personas_fts WHERE {' AND '.join(condiciones)} "
+        f"ORDER BY rowid {'ASC' if hacia_atras else 'DESC'} LIMIT :limit"
+    )
+
+
+def consulta_cursor(referencia: Optional[int], hacia_atras: bool, limit: int):
+    """Página de personas sin búsqueda a partir de un cursor, por el índice del id"""
+    stmt = select(Persona)
+    if referencia is not None:
+        stmt = stmt.where(Persona.id > referencia if hacia_atras else Persona.id < referencia)
+    return stmt.order_by(Persona.id.asc() if hacia_atras else Persona.id.desc()).limit(limit)
+
+
+async def listar_por_cursor(
+    db: AsyncSession,
+    consulta: Optional[str],
+    cursor: Optional[Tuple[int, str]],
+    limit: int
+) -> Tuple[List[Persona], Optional[str], Optional[str]]:
+    """
+    Página de personas ordenadas por id descendente a partir de un cursor.
+
+    Usa el índice del id (o el rowid del índice FTS si hay consulta), así que
+    el costo por página no depende de lo profundo que se esté en la tabla.
+    Devuelve (personas, cursor_siguiente, cursor_anterior).
+    """
+    referencia, direccion = cursor if cursor else (None, SIGUIENTE)
+    hacia_atras = direccion == ANTERIOR
+
+    if consulta:
+        ids = list(await db.scalars(
+            text(sql_cursor_fts(referencia is not None, hacia_atras)),
+            {"q": consulta, "ref": referencia, "limit": limit + 1}
+        ))
+        hay_mas = len(ids) > limit
+        ids = ids[:limit]
+        por_id = {p.id: p for p in await db.scalars(select(Persona).where(Persona.id.in_(ids)))} if ids else {}
+        personas = [por_id[i] for i in ids if i in por_id]
+    else:
+        personas = list(await db.scalars(consulta_cursor(referencia, hacia_atras, limit + 1)))
+        hay_mas = len(personas) > limit
+        personas = personas[:limit]
+
+    if hacia_atras:
+        personas.reverse()
+
+    if not personas:
+        return [], None, None
+
+    # Hacia adelante siempre se puede volver si se partió de un cursor;
+    # hacia atrás siempre se puede avanzar hasta la página de la que se vino
+    if hacia_atras:
+        siguiente = codificar_cursor(personas[-1].id, SIGUIENTE)
+        anterior = codificar_cursor(personas[0].id, ANTERIOR) if hay_mas else None
+    else:
+        siguiente = codificar_cursor(personas[-1].id, SIGUIENTE) if hay_mas else None
+        anterior = codificar_cursor(personas[0].id, ANTERIOR) if referencia is not None else None
+
+    return personas, siguiente, anterior
@@ -0,0 +1,256 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set
+
+from .. import metricas
+from ..config import get_settings
+
+# Cubos por TTL de la rueda de vencimientos (resolución = ttl / _CUBOS_POR_TTL)
+_CUBOS_POR_TTL = 256
+
+
+class TTLCache:
+    """
+    Caché en memoria acotada por tamaño (LRU) y por tiempo de vida (TTL).
+
+    Cada entrada guarda el instante en que expira; las entradas vencidas se
+    descartan al leerlas o con purgar_expirados. Para purgar sin recorrer
+    las vigentes, cada clave está también en una rueda de vencimientos:
+    cubos de `resolucion` segundos indexados por instante de vencimiento,
+    que se vacían en orden. Cuando se supera el tamaño máximo se expulsa la
+    entrada usada hace más tiempo, salvo con expulsar=False: entonces las
+    entradas solo salen al vencer o al invalidarlas, y con la caché llena
+    las claves nuevas se rechazan.
+    """
+
+    def __init__(self, max_size: int, ttl: float, expulsar: bool = True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.expulsar = expulsar
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        # Rueda de vencimientos: índice de cubo -> claves que vencen en él
+        self._resolucion = max(1.0, ttl / _CUBOS_POR_TTL)
+        self._cubos: Dict[int, Set[Hashable]] = {}
+        self._siguiente_cubo = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
+
+    def _cubo(self, expira: float) -> int:
+        return int(expira // self._resolucion)
+
+    def _agregar_a_cubo(self, key: Hashable, expira: float) -> None:
+        indice = self._cubo(expira)
+        self._cubos.setdefault(indice, set()).add(key)
+        if indice < self._siguiente_cubo:
+            self._siguiente_cubo = indice
+
+    def _quitar_de_cubo(self, key: Hashable, expira: float) -> None:
+        indice = self._cubo(expira)
+        cubo = self._cubos.get(indice)
+        if cubo is not None:
+            cubo.discard(key)
+            if not cubo:
+                del self._cubos[indice]
+
+    def _eliminar(self, key: Hashable) -> None:
+        """Quita una entrada y su lugar en la rueda (con el lock tomado)"""
+        expira, _ = self._data.pop(key)
+        self._quitar_de_cubo(key, expira)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Obtiene un valor vigente o None si no existe o expiró"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expira, value = entry
+            if expira <= time.monotonic():
+                self._eliminar(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def contiene(self, key: Hashable) -> bool:
+        """Indica si hay un valor vigente, sin contar acierto ni fallo"""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Guarda un valor, expulsando la entrada menos usada si está llena.
+        Con expulsar=False y la caché llena de entradas vigentes, una clave
+        nueva no se guarda y devuelve False.
+        """
+        if self.max_size <= 0:
+            return False
+
+        expira = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._eliminar(key)
+            elif not self.expulsar and len(self._data) >= self.max_size:
+                self._purgar(time.monotonic(), 100)
+                if len(self._data) >= self.max_size:
+                    self.rejected += 1
+                    return False
+
+            self._data[key] = (expira, value)
+            self._agregar_a_cubo(key, expira)
+            while len(self._data) > self.max_size:
+                antigua, (expira_antigua, _) = self._data.popitem(last=False)
+                self._quitar_de_cubo(antigua, expira_antigua)
+                self.evictions += 1
+        return True
+
+    def purgar_expirados(self, limite: int = 100) -> int:
+        """
+        Elimina entradas vencidas recorriendo la rueda desde el cubo más
+        antiguo, hasta revisar `limite` entradas. Los cubos ya terminados
+        solo tienen vencidas, así que cada entrada eliminada cuesta O(1);
+        del cubo en curso se revisan a lo sumo `limite`.
+        """
+        with self._lock:
+            return self._purgar(time.monotonic(), limite)
+
+    def _purgar(self, ahora: float, limite: int) -> int:
+        actual = self._cubo(ahora)
+        eliminadas = revisadas = 0
+        while self._cubos and self._siguiente_cubo <= actual and revisadas < limite:
+            cubo = self._cubos.get(self._siguiente_cubo)
+            if cubo is None:
+                # Tras un rato sin uso se salta el hueco de una vez
+                if actual - self._siguiente_cubo > len(self._cubos):
+                    self._siguiente_cubo = min(min(self._cubos), actual)
+                else:
+                    self._siguiente_cubo += 1
+                continue
+
+            for key in list(itertools.islice(cubo, limite - revisadas)):
+                revisadas += 1
+                if self._data[key][0] <= ahora:
+                    self._eliminar(key)
+                    self.expirations += 1
+                    eliminadas += 1
+            if self._siguiente_cubo == actual:
+                # El cubo en curso aún puede tener entradas vigentes
+                break
+            if self._siguiente_cubo not in self._cubos:
+                self._siguiente_cubo += 1
+        return eliminadas
+
+    def invalidate(self, key: Hashable) -> None:
+        """Elimina una entrada si existe"""
+        with self._lock:
+            if key in self._data:
+                self._eliminar(key)
+
+    def clear(self) -> None:
+        """Vacía la caché"""
+        with self._lock:
+            self._data.clear()
+            self._cubos.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Devuelve los contadores de uso de la caché"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "rejected": self.rejected,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_settings = get_settings()
+
+# Caché de respuestas de persona ya construidas, indexada por nrodoc
+persona_cache = TTLCache(
+    max_size=_settings.PERSONA_CACHE_MAX_SIZE,
+    ttl=_settings.PERSONA_CACHE_TTL_SECONDS,
+)
+
+# Caché negativa de DNIs no encontrados en la API externa (nrodoc -> mensaje)
+no_encontrado_cache = TTLCache(
+    max_size=_settings.NEGATIVE_CACHE_MAX_SIZE,
+    ttl=_settings.NEGATIVE_CACHE_TTL_SECONDS,
+)
+
+# Tokens de API activos ya validados (token -> TokenActivo)
+token_cache = TTLCache(
+    max_size=_settings.TOKEN_CACHE_MAX_SIZE,
+    ttl=_settings.TOKEN_CACHE_TTL_SECONDS,
+)
+
+# Conteos de resultados de búsqueda (consulta FTS -> (total, aproximado))
+conteo_cache = TTLCache(
+    max_size=_settings.COUNT_CACHE_MAX_SIZE,
+    ttl=_settings.COUNT_CACHE_TTL_SECONDS,
+)
+
+# Intentos fallidos de login por IP (ip -> (intentos, último intento))
+login_cache = TTLCache(
+    max_size=_settings.LOGIN_THROTTLE_MAX_ENTRIES,
+    ttl=_settings.LOGIN_LOCKOUT_SECONDS,
+)
+
+# IPs bloqueadas (ip -> último intento), aparte de los intentos: una ola de
+# fallos desde IPs nuevas no puede expulsar los bloqueos vigentes
+login_bloqueo_cache = TTLCache(
+    max_size=_settings.LOGIN_LOCKOUT_MAX_ENTRIES,
+    ttl=_settings.LOGIN_LOCKOUT_SECONDS,
+    expulsar=False,
+)
+
+
+_caches = {
+    "persona": persona_cache,
+    "no_encontrado": no_encontrado_cache,
+    "token": token_cache,
+    "conteo": conteo_cache,
+    "login": login_cache,
+    "login_bloqueo": login_bloqueo_cache,
+}
+
+
+def _por_cache(atributo: str):
+    return lambda: {(nombre,): getattr(cache, atributo) for nombre, cache in _caches.items()}
+
+
+metricas.registrar(metricas.Recolector(
+    "dni_cache_entries", "Entradas en cada caché en memoria", ("cache",),
+    lambda: {(nombre,): len(cache) for nombre, cache in _caches.items()}
+))
+metricas.registrar(metricas.Recolector(
+    "dni_cache_max_entries", "Tamaño máximo de cada caché en memoria", ("cache",), _por_cache("max_size")
+))
+metricas.registrar(metricas.Recolector(
+    "dni_cache_hits_total", "Aciertos de cada caché en memoria", ("cache",), _por_cache("hits"), tipo="counter"
+))
+metricas.registrar(metricas.Recolector(
+    "dni_cache_misses_total", "Fallos de cada caché en memoria", ("cache",), _por_cache("misses"), tipo="counter"
+))
+metricas.registrar(metricas.Recolector(
+    "dni_cache_evictions_total", "Entradas expulsadas por tamaño de cada caché", ("cache",), _por_cache("evictions"),
+    tipo="counter"
+))
@@ -1,97 +1,508 @@
+import asyncio
+import logging
+import time
 import httpx
-from sqlalchemy.orm import Session
-from typing import Optional
-from datetime import datetime
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, List, Dict
+from datetime import datetime, timedelta, timezone
 
-from ..models import Persona, Config
+from .. import metricas, tiempos
+from ..models import Persona, Config, DniNoEncontrado
 from ..schemas import PersonaResponse
 from ..config import get_settings
+from ..database import AsyncSessionLocal
+from .cache_service import conteo_cache, persona_cache, no_encontrado_cache
+from . import upstream_service
+from .singleflight import SingleFlight
 
+logger = logging.getLogger(__name__)
 
-async def buscar_persona(db: Session, nrodoc: str) -> tuple[Optional[PersonaResponse], str]:
+# Consultas a la API externa en curso, agrupadas por nrodoc
+consultas_en_curso = SingleFlight()
+
+
+class _PresupuestoRefresco:
     """
-    Busca una persona primero en la base de datos local.
-    Si no existe, consulta la API externa de apisperu.com
+    Cubeta de fichas de los refrescos: empieza llena con `por_minuto`
+    fichas y se repone de forma continua. Solo se usa desde el event loop.
+    """
+
+    def __init__(self):
+        self._fichas: Optional[float] = None
+        self._ultimo = 0.0
+
+    def consumir(self, por_minuto: int, ahora: Optional[float] = None) -> bool:
+        """Toma una ficha si hay; por_minuto debe ser mayor que 0"""
+        if ahora is None:
+            ahora = time.monotonic()
+        if self._fichas is None:
+            fichas = float(por_minuto)
+        else:
+            fichas = min(float(por_minuto), self._fichas + (ahora - self._ultimo) * por_minuto / 60.0)
+        self._ultimo = ahora
+        if fichas < 1:
+            self._fichas = fichas
+            return False
+        self._fichas = fichas - 1
+        return True
+
+
+# Refrescos en segundo plano de registros desactualizados: DNIs en curso,
+# tareas vivas y presupuesto por minuto
+_refrescos_en_curso: set = set()
+_tareas_refresco: set = set()
+_presupuesto_refresco = _PresupuestoRefresco()
+_semaforo_refresco: Optional[asyncio.Semaphore] = None
+contadores_refresco = {"programados": 0, "sin_presupuesto": 0, "actualizados": 0, "errores": 0}
+
+# DNIs obviamente inválidos
+DNIS_INVALIDOS = {
+    "00000000", "11111111", "22222222", "33333333", "44444444",
+    "55555555", "66666666", "77777777", "88888888", "99999999"
+}
+
+
+def validar_dni(dni: str) -> Optional[str]:
+    """Devuelve el mensaje de error si el DNI no es válido, o None si lo es"""
+    if not dni.isdigit() or len(dni) != 8:
+        return "El DNI debe ser un número de 8 dígitos"
+    if dni in DNIS_INVALIDOS:
+        return "DNI inválido"
+    return None
+
+
+def _a_respuesta(persona_db: Persona, desde_cache: bool) -> PersonaResponse:
+    """Construye la respuesta a partir de un registro de la base de datos"""
+    return PersonaResponse(
+        id=persona_db.id,
+        tipodoc=persona_db.tipodoc,
+        nrodoc=persona_db.nrodoc,
+        nombres=persona_db.nombres,
+        apellido_paterno=persona_db.apellido_paterno,
+        apellido_materno=persona_db.apellido_materno,
+        codigo_verificacion=persona_db.codigo_verificacion,
+        fecha_registro=persona_db.fecha_registro,
+        fecha_actualizacion=persona_db.fecha_actualizacion,
+        desde_cache=desde_cache,
+        origen=persona_db.origen
+    )
+
+
+def _es_refrescable(origen: Optional[str]) -> bool:
+    """
+    Solo se refresca lo que vino de apisperu.com. Los registros manuales e
+    importados no se sobrescriben, y tampoco los anteriores a la columna
+    origen (NULL): no se sabe si se cargaron a mano.
+    """
+    return origen == "apisperu"
+
+
+def _con_vigencia(persona: PersonaResponse) -> PersonaResponse:
+    """
+    Si los datos superaron PERSONA_FRESHNESS_DAYS los marca como
+    desactualizados y programa su refresco; se sirven igual.
+    """
+    dias = get_settings().PERSONA_FRESHNESS_DAYS
+    if not dias or not _es_refrescable(persona.origen):
+        return persona
+    
+    referencia = persona.fecha_actualizacion or persona.fecha_registro
+    if referencia is None:
+        return persona
+    if referencia.tzinfo is None:
+        # SQLite devuelve las fechas en UTC sin zona horaria
+        referencia = referencia.replace(tzinfo=timezone.utc)
+    if datetime.now(timezone.utc) - referencia < timedelta(days=dias):
+        return persona
+    
+    metricas.busquedas_desactualizadas.inc()
+    programar_refresco(persona.nrodoc)
+    return persona.model_copy(update={"desactualizado": True})
+
+
+async def buscar_persona(db: AsyncSession, nrodoc: str) -> tuple[Optional[PersonaResponse], str]:
+    """
+    Busca una persona primero en la caché en memoria y luego en la base de
+    datos local. Si no existe, consulta la API externa de apisperu.com
     
     Returns:
         (PersonaResponse, message) o (None, error_message)
     """
-    # 1. Buscar primero en la base de datos local
-    persona_db = db.query(Persona).filter(Persona.nrodoc == nrodoc).first()
+    # 1. Buscar en la caché en memoria (no toca SQLite ni el ORM)
+    persona_cacheada = persona_cache.get(nrodoc)
+    
+    if persona_cacheada:
+        metricas.busquedas.inc("memoria")
+        return _con_vigencia(persona_cacheada), "Datos obtenidos de la base de datos local"
+    
+    # 2. Buscar en la base de datos local
+    persona_db = await db.scalar(select(Persona).where(Persona.nrodoc == nrodoc))
     
     if persona_db:
-        return PersonaResponse(
-            id=persona_db.id,
-            tipodoc=persona_db.tipodoc,
-            nrodoc=persona_db.nrodoc,
-            nombres=persona_db.nombres,
-            apellido_paterno=persona_db.apellido_paterno,
-            apellido_materno=persona_db.apellido_materno,
-            codigo_verificacion=persona_db.codigo_verificacion,
-            fecha_registro=persona_db.fecha_registro,
-            desde_cache=True
-        ), "Datos obtenidos de la base de datos local"
-    
-    # 2. Si no existe, consultar API externa
-    token = obtener_token_apisperu(db)
+        persona = _a_respuesta(persona_db, desde_cache=True)
+        persona_cache.set(nrodoc, persona)
+        metricas.busquedas.inc("base_datos")
+        return _con_vigencia(persona), "Datos obtenidos de la base de datos local"
+    
+    # 3. DNIs que la API externa ya reportó como no encontrados
+    mensaje_no_encontrado = await buscar_no_encontrado(db, nrodoc)
+    
+    if mensaje_no_encontrado:
+        metricas.busquedas.inc("cache_negativa")
+        return None, mensaje_no_encontrado
+    
+    # 4. Si no existe, consultar API externa. Las consultas concurrentes
+    # por el mismo DNI comparten una única llamada e inserción.
+    with tiempos.fase("apisperu"):
+        persona, mensaje, _ = await consultas_en_curso.do(nrodoc, lambda: _consultar_api_externa(nrodoc))
+    return persona, mensaje
+
+
+async def buscar_personas_lote(
+    db: AsyncSession,
+    nrodocs: List[str],
+    concurrencia: Optional[int] = None,
+    max_por_segundo: Optional[float] = None
+) -> Dict[str, tuple[Optional[PersonaResponse], str, bool]]:
+    """
+    Busca varias personas a la vez.
+    Los aciertos locales se resuelven con una sola consulta IN (...) y los
+    faltantes se piden a la API externa con concurrencia limitada y,
+    opcionalmente, un ritmo máximo de consultas por segundo.
+    
+    Returns:
+        {nrodoc: (PersonaResponse, message, True) o (None, error_message, definitivo)},
+        donde definitivo es False si la consulta falló por un error pasajero
+        (timeout, circuito abierto, 5xx, token) y conviene reintentarla
+    """
+    resultados: Dict[str, tuple[Optional[PersonaResponse], str, bool]] = {}
+    pendientes = []
+    
+    # 1. Caché en memoria
+    for nrodoc in nrodocs:
+        persona_cacheada = persona_cache.get(nrodoc)
+        if persona_cacheada:
+            metricas.busquedas.inc("memoria")
+            resultados[nrodoc] = (_con_vigencia(persona_cacheada), "Datos obtenidos de la base de datos local", True)
+        else:
+            pendientes.append(nrodoc)
+    
+    # 2. Base de datos local en una sola consulta
+    if pendientes:
+        for persona_db in await db.scalars(select(Persona).where(Persona.nrodoc.in_(pendientes))):
+            persona = _a_respuesta(persona_db, desde_cache=True)
+            persona_cache.set(persona.nrodoc, persona)
+            metricas.busquedas.inc("base_datos")
+            resultados[persona.nrodoc] = (_con_vigencia(persona), "Datos obtenidos de la base de datos local", True)
+    
+    # 3. Caché negativa
+    faltantes = []
+    for nrodoc in pendientes:
+        if nrodoc in resultados:
+            continue
+        mensaje_no_encontrado = await buscar_no_encontrado(db, nrodoc)
+        if mensaje_no_encontrado:
+            metricas.busquedas.inc("cache_negativa")
+            resultados[nrodoc] = (None, mensaje_no_encontrado, True)
+        else:
+            faltantes.append(nrodoc)
+    
+    # 4. API externa con un máximo de consultas simultáneas
+    if faltantes:
+        semaforo = asyncio.Semaphore(concurrencia or get_settings().BATCH_UPSTREAM_CONCURRENCY)
+        intervalo = 1.0 / max_por_segundo if max_por_segundo else 0.0
+        loop = asyncio.get_running_loop()
+        proxima_salida = loop.time()
+        
+        async def consultar(nrodoc: str):
+            nonlocal proxima_salida
+            async with semaforo:
+                if intervalo:
+                    # Espaciar el inicio de cada consulta según el ritmo pedido
+                    ahora = loop.time()
+                    espera = proxima_salida - ahora
+                    proxima_salida = max(ahora, proxima_salida) + intervalo
+                    if espera > 0:
+                        await asyncio.sleep(espera)
+                resultados[nrodoc] = await consultas_en_curso.do(
+                    nrodoc, lambda: _consultar_api_externa(nrodoc)
+                )
+        
+        with tiempos.fase("apisperu"):
+            await asyncio.gather(*(consultar(nrodoc) for nrodoc in faltantes))
+    
+    return resultados
+
+
+async def _consultar_api_externa(nrodoc: str) -> tuple[Optional[PersonaResponse], str, bool]:
+    """
+    Consulta apisperu.com con una sesión propia: el resultado puede
+    compartirse entre varias peticiones concurrentes, cada una con su sesión.
+    """
+    async with AsyncSessionLocal() as db:
+        persona, mensaje, definitivo = await _consultar_y_guardar(db, nrodoc)
+    
+    # Una sola vez por llamada: las peticiones agrupadas no se cuentan
+    if persona is not None:
+        metricas.busquedas.inc("base_datos" if persona.desde_cache else "api_externa")
+    elif definitivo:
+        metricas.busquedas.inc("no_encontrado")
+    else:
+        metricas.busquedas.inc("error")
+    return persona, mensaje, definitivo
+
+
+async def _consultar_y_guardar(db: AsyncSession, nrodoc: str) -> tuple[Optional[PersonaResponse], str, bool]:
+    """
+    Consulta apisperu.com y guarda el resultado en la base de datos local.
+    El tercer valor es False si la consulta falló por un error pasajero
+    (sin token, timeout, circuito abierto, respuesta distinta de 200): el
+    DNI no se marca como no encontrado y se puede reintentar.
+    """
+    token = await obtener_token_apisperu(db)
     
     if not token:
-        return None, "Token de apisperu.com no configurado. Configure el token en Configuración."
+        return None, "Token de apisperu.com no configurado. Configure el token en Configuración.", False
     
     try:
         settings = get_settings()
         url = f"{settings.APISPERU_BASE_URL}/dni/{nrodoc}?token={token}"
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, timeout=10.0)
+        response = await upstream_service.obtener(url)
+
+        if response.status_code == 200:
+            data = response.json()
             
-            if response.status_code == 200:
-                data = response.json()
+            # Verificar si la respuesta tiene datos válidos
+            if data.get("success", True) and data.get("dni"):
+                # Guardar en base de datos
+                nueva_persona = Persona(
+                    tipodoc="DNI",
+                    nrodoc=data.get("dni", nrodoc),
+                    nombres=data.get("nombres", ""),
+                    apellido_paterno=data.get("apellidoPaterno", ""),
+                    apellido_materno=data.get("apellidoMaterno", ""),
+                    codigo_verificacion=data.get("codVerifica", ""),
+                    origen="apisperu"
+                )
+                db.add(nueva_persona)
+                try:
+                    await db.commit()
+                except IntegrityError:
+                    # Otro proceso insertó el mismo DNI entre la consulta y el commit
+                    await db.rollback()
+                    existente = await db.scalar(select(Persona).where(Persona.nrodoc == nueva_persona.nrodoc))
+                    if not existente:
+                        raise
+                    persona = _a_respuesta(existente, desde_cache=True)
+                    persona_cache.set(persona.nrodoc, persona)
+                    return persona, "Datos obtenidos de la base de datos local", True
+                await db.refresh(nueva_persona)
                 
-                # Verificar si la respuesta tiene datos válidos
-                if data.get("success", True) and data.get("dni"):
-                    # Guardar en base de datos
-                    nueva_persona = Persona(
-                        tipodoc="DNI",
-                        nrodoc=data.get("dni", nrodoc),
-                        nombres=data.get("nombres", ""),
-                        apellido_paterno=data.get("apellidoPaterno", ""),
-                        apellido_materno=data.get("apellidoMaterno", ""),
-                        codigo_verificacion=data.get("codVerifica", "")
-                    )
-                    db.add(nueva_persona)
-                    db.commit()
-                    db.refresh(nueva_persona)
-                    
-                    return PersonaResponse(
-                        id=nueva_persona.id,
-                        tipodoc=nueva_persona.tipodoc,
-                        nrodoc=nueva_persona.nrodoc,
-                        nombres=nueva_persona.nombres,
-                        apellido_paterno=nueva_persona.apellido_paterno,
-                        apellido_materno=nueva_persona.apellido_materno,
-                        codigo_verificacion=nueva_persona.codigo_verificacion,
-                        fecha_registro=nueva_persona.fecha_registro,
-                        desde_cache=False
-                    ), "Datos obtenidos de la API externa y guardados en base de datos"
-                else:
-                    return None, data.get("message", "DNI no encontrado en la API externa")
-            
-            elif response.status_code == 401:
-                return None, "Token de apisperu.com inválido o expirado"
+                persona = _a_respuesta(nueva_persona, desde_cache=False)
+                # Las siguientes consultas ya se sirven desde el caché local
+                persona_cache.set(
+                    persona.nrodoc,
+                    persona.model_copy(update={"desde_cache": True})
+                )
+                return persona, "Datos obtenidos de la API externa y guardados en base de datos", True
             else:
-                return None, f"Error en la API externa: {response.status_code}"
-                
+                mensaje = data.get("message", "DNI no encontrado en la API externa")
+                await registrar_no_encontrado(db, nrodoc, mensaje)
+                return None, mensaje, True
+        
+        elif response.status_code == 401:
+            return None, "Token de apisperu.com inválido o expirado", False
+        else:
+            return None, f"Error en la API externa: {response.status_code}", False
+            
+    except upstream_service.UpstreamNoDisponible:
+        return None, "API externa no disponible temporalmente, intente más tarde", False
     except httpx.TimeoutException:
-        return None, "Timeout al consultar la API externa"
+        return None, "Timeout al consultar la API externa", False
     except Exception as e:
-        return None, f"Error al consultar la API externa: {str(e)}"
+        return None, f"Error al consultar la API externa: {str(e)}", False
+
+
+def programar_refresco(nrodoc: str) -> bool:
+    """
+    Programa el refresco en segundo plano de un DNI desactualizado.
+    No hace nada si los refrescos están desactivados
+    (PERSONA_REFRESH_PER_MINUTE=0), si ya hay uno en curso para ese DNI, si
+    se agotó el presupuesto del minuto o si el circuito hacia la API externa
+    no está cerrado (las consultas nuevas tienen prioridad).
+    """
+    por_minuto = get_settings().PERSONA_REFRESH_PER_MINUTE
+    if por_minuto <= 0:
+        return False
+    if nrodoc in _refrescos_en_curso:
+        return False
+    if upstream_service.circuito.estado != upstream_service.CERRADO:
+        return False
+    
+    if not _presupuesto_refresco.consumir(por_minuto):
+        contadores_refresco["sin_presupuesto"] += 1
+        return False
+    
+    contadores_refresco["programados"] += 1
+    _refrescos_en_curso.add(nrodoc)
+    tarea = asyncio.create_task(_refrescar(nrodoc))
+    _tareas_refresco.add(tarea)
+    
+    def terminar(t: asyncio.Task) -> None:
+        _tareas_refresco.discard(t)
+        _refrescos_en_curso.discard(nrodoc)
+    
+    tarea.add_done_callback(terminar)
+    return True
+
+
+async def _refrescar(nrodoc: str) -> None:
+    """Vuelve a consultar un DNI en apisperu.com y actualiza el registro"""
+    global _semaforo_refresco
+    # Sigue después de la respuesta: no suma a los tiempos de la petición
+    tiempos.desactivar()
+    if _semaforo_refresco is None:
+        _semaforo_refresco = asyncio.Semaphore(get_settings().PERSONA_REFRESH_CONCURRENCY)
+    
+    async with _semaforo_refresco:
+        try:
+            async with AsyncSessionLocal() as db:
+                token = await obtener_token_apisperu(db)
+                if not token:
+                    return
+                
+                url = f"{get_settings().APISPERU_BASE_URL}/dni/{nrodoc}?token={token}"
+                response = await upstream_service.obtener(url)
+                if response.status_code != 200:
+                    contadores_refresco["errores"] += 1
+                    return
+                
+                data = response.json()
+                persona_db = await db.scalar(select(Persona).where(Persona.nrodoc == nrodoc))
+                # Si la API ya no lo encuentra se conservan los datos guardados
+                if not (data.get("success", True) and data.get("dni")) or persona_db is None:
+                    return
+                if not _es_refrescable(persona_db.origen):
+                    return
+                
+                persona_db.nombres = data.get("nombres", "")
+                persona_db.apellido_paterno = data.get("apellidoPaterno", "")
+                persona_db.apellido_materno = data.get("apellidoMaterno", "")
+                persona_db.codigo_verificacion = data.get("codVerifica", "")
+                # Se asigna siempre: si nada cambió no habría UPDATE
+                persona_db.fecha_actualizacion = datetime.utcnow()
+                await db.commit()
+                await db.refresh(persona_db)
+                
+                persona_cache.set(nrodoc, _a_respuesta(persona_db, desde_cache=True))
+                contadores_refresco["actualizados"] += 1
+        except upstream_service.UpstreamNoDisponible:
+            pass
+        except Exception:
+            contadores_refresco["errores"] += 1
+            logger.exception("Error refrescando el DNI %s", nrodoc)
+
+
+metricas.registrar(metricas.Recolector(
+    "dni_refreshes_total", "Refrescos de datos desactualizados por resultado", ("result",),
+    lambda: {(clave,): valor for clave, valor in contadores_refresco.items()}, tipo="counter"
+))
+
+
+def estado_refrescos() -> dict:
+    """Contadores de los refrescos en segundo plano"""
+    return {"en_curso": len(_refrescos_en_curso), **contadores_refresco}
+
+
+async def detener_refrescos() -> None:
+    """Cancela los refrescos en curso"""
+    for tarea in list(_tareas_refresco):
+        tarea.cancel()
+    await asyncio.gather(*_tareas_refresco, return_exceptions=True)
+
+
+async def buscar_no_encontrado(db: AsyncSession, nrodoc: str) -> Optional[str]:
+    """
+    Devuelve el mensaje guardado si el DNI está en la caché negativa
+    (memoria y, si está habilitado, la tabla dnis_no_encontrados)
+    """
+    mensaje = no_encontrado_cache.get(nrodoc)
+    if mensaje:
+        return mensaje
+    
+    settings = get_settings()
+    if not settings.NEGATIVE_CACHE_PERSIST:
+        return None
+    
+    ahora = datetime.utcnow()
+    registro = await db.scalar(select(DniNoEncontrado).where(
+        DniNoEncontrado.nrodoc == nrodoc,
+        DniNoEncontrado.fecha_expiracion > ahora
+    ))
+    
+    if not registro:
+        return None
+    
+    # Recordar en memoria solo por el tiempo que le queda al registro
+    restante = (registro.fecha_expiracion.replace(tzinfo=None) - ahora).total_seconds()
+    no_encontrado_cache.set(nrodoc, registro.mensaje, ttl=restante)
+    return registro.mensaje
+
+
+async def registrar_no_encontrado(db: AsyncSession, nrodoc: str, mensaje: str) -> None:
+    """Guarda un DNI no encontrado en la caché negativa"""
+    settings = get_settings()
+    no_encontrado_cache.set(nrodoc, mensaje)
+    
+    if not settings.NEGATIVE_CACHE_PERSIST:
+        return
+    
+    expiracion = datetime.utcnow() + timedelta(seconds=settings.NEGATIVE_CACHE_TTL_SECONDS)
+    registro = await db.scalar(select(DniNoEncontrado).where(DniNoEncontrado.nrodoc == nrodoc))
+    
+    if registro:
+        registro.mensaje = mensaje
+        registro.fecha_expiracion = expiracion
+    else:
+        db.add(DniNoEncontrado(nrodoc=nrodoc, mensaje=mensaje, fecha_expiracion=expiracion))
+    
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+
+
+async def invalidar_cache(db: AsyncSession, nrodoc: str) -> None:
+    """
+    Descarta lo que se sabe en caché de un DNI (positivo y negativo) y los
+    conteos de búsqueda, que pueden incluirlo. Se llama cuando una persona
+    se crea, modifica o elimina.
+    """
+    persona_cache.invalidate(nrodoc)
+    no_encontrado_cache.invalidate(nrodoc)
+    conteo_cache.clear()
+    
+    if get_settings().NEGATIVE_CACHE_PERSIST:
+        await db.execute(delete(DniNoEncontrado).where(DniNoEncontrado.nrodoc == nrodoc))
+        await db.commit()
+
+
+async def purgar_no_encontrados_expirados(db: AsyncSession) -> int:
+    """Elimina de la tabla los DNIs no encontrados cuyo TTL ya venció"""
+    resultado = await db.execute(delete(DniNoEncontrado).where(
+        DniNoEncontrado.fecha_expiracion <= datetime.utcnow()
+    ))
+    await db.commit()
+    return resultado.rowcount
 
 
-def obtener_token_apisperu(db: Session) -> Optional[str]:
+async def obtener_token_apisperu(db: AsyncSession) -> Optional[str]:
     """Obtiene el token de apisperu.com de la base de datos o de las variables de entorno"""
     # Primero buscar en la base de datos
-    config = db.query(Config).filter(Config.clave == "apisperu_token").first()
+    config = await db.scalar(select(Config).where(Config.clave == "apisperu_token"))
     
     if config and config.valor:
         return config.valor
@@ -101,9 +512,9 @@ def obtener_token_apisperu(db: Session) -> Optional[str]:
     return settings.APISPERU_TOKEN if settings.APISPERU_TOKEN else None
 
 
-def guardar_token_apisperu(db: Session, token: str) -> bool:
+async def guardar_token_apisperu(db: AsyncSession, token: str) -> bool:
     """Guarda o actualiza el token de apisperu.com"""
-    config = db.query(Config).filter(Config.clave == "apisperu_token").first()
+    config = await db.scalar(select(Config).where(Config.clave == "apisperu_token"))
     
     if config:
         config.valor = token
@@ -116,5 +527,5 @@ def guardar_token_apisperu(db: Session, token: str) -> bool:
         )
         db.add(config)
     
-    db.commit()
+    await db.commit()
     return True
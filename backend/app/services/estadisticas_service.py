@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..models import ContadorPersonas, Persona
+from .cache_service import conteo_cache
+
+# Triggers que mantienen contadores_personas al insertar, borrar o cambiar
+# el origen de una persona. Así el total y el resumen del panel se leen de
+# unas pocas filas en lugar de recorrer la tabla.
+_CLAVE_ORIGEN = "'origen:' || coalesce({fila}.origen, 'desconocido')"
+_CLAVE_DIA = "'dia:' || coalesce(date({fila}.fecha_registro), 'desconocido')"
+
+# Conteo de una búsqueda que se detiene en :limite coincidencias
+SQL_CONTAR_BUSQUEDA_ACOTADO = (
+    "SELECT count(*) FROM (SELECT 1 FROM personas_fts "
+    "WHERE personas_fts MATCH :q LIMIT :limite)"
+)
+
+
+def _sumar(clave: str, delta: int) -> str:
+    return (
+        f"INSERT INTO contadores_personas(clave, valor) VALUES ({clave}, {delta}) "
+        f"ON CONFLICT(clave) DO UPDATE SET valor = valor + ({delta});"
+    )
+
+
+_DDL_CONTADORES = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS contadores_personas_ai AFTER INSERT ON personas BEGIN
+        {_sumar("'total'", 1)}
+        {_sumar(_CLAVE_ORIGEN.format(fila="new"), 1)}
+        {_sumar(_CLAVE_DIA.format(fila="new"), 1)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS contadores_personas_ad AFTER DELETE ON personas BEGIN
+        {_sumar("'total'", -1)}
+        {_sumar(_CLAVE_ORIGEN.format(fila="old"), -1)}
+        {_sumar(_CLAVE_DIA.format(fila="old"), -1)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS contadores_personas_au
+    AFTER UPDATE OF origen ON personas
+    WHEN old.origen IS NOT new.origen BEGIN
+        {_sumar(_CLAVE_ORIGEN.format(fila="old"), -1)}
+        {_sumar(_CLAVE_ORIGEN.format(fila="new"), 1)}
+    END
+    """,
+]
+
+
+def crear_contadores(conn: Connection) -> None:
+    """
+    Crea los triggers de contadores si no existen. Si los contadores aún no
+    se han calculado (base de datos existente), los calcula una vez.
+    """
+    for ddl in _DDL_CONTADORES:
+        conn.execute(text(ddl))
+
+    calculado = conn.execute(
+        text("SELECT 1 FROM contadores_personas WHERE clave = 'total'")
+    ).first() is not None
+    if not calculado:
+        reconstruir_contadores(conn)
+
+
+def reconstruir_contadores(conn: Connection) -> None:
+    """Recalcula todos los contadores recorriendo la tabla personas"""
+    conn.execute(text("DELETE FROM contadores_personas"))
+    conn.execute(text(
+        "INSERT INTO contadores_personas(clave, valor) SELECT 'total', count(*) FROM personas"
+    ))
+    conn.execute(text(
+        f"INSERT INTO contadores_personas(clave, valor) "
+        f"SELECT {_CLAVE_ORIGEN.format(fila='personas')} AS clave, count(*) FROM personas GROUP BY clave"
+    ))
+    conn.execute(text(
+        f"INSERT INTO contadores_personas(clave, valor) "
+        f"SELECT {_CLAVE_DIA.format(fila='personas')} AS clave, count(*) FROM personas GROUP BY clave"
+    ))
+
+
+async def total_personas(db: AsyncSession) -> int:
+    """Total exacto de personas leído del contador (o con count() si no existe)"""
+    total = await db.scalar(
+        select(ContadorPersonas.valor).where(ContadorPersonas.clave == "total")
+    )
+    if total is None:
+        total = await db.scalar(select(func.count(Persona.id)))
+    return total
+
+
+async def contar_busqueda(
+    db: AsyncSession,
+    consulta: str,
+    exacto: bool = False
+) -> Tuple[int, bool]:
+    """
+    Cuenta los resultados de una búsqueda FTS.
+
+    Por defecto el conteo se guarda en caché unos segundos y se detiene en
+    COUNT_APPROX_LIMIT, así las búsquedas muy amplias no recorren todo el
+    índice en cada pulsación. Con exacto=True se cuenta todo y se actualiza
+    la caché. Devuelve (total, es_aproximado).
+    """
+    if not exacto:
+        guardado = conteo_cache.get(consulta)
+        if guardado is not None:
+            return guardado
+
+    limite: Optional[int] = None if exacto else get_settings().COUNT_APPROX_LIMIT
+    if limite:
+        total = await db.scalar(
+            text(SQL_CONTAR_BUSQUEDA_ACOTADO),
+            {"q": consulta, "limite": limite}
+        )
+    else:
+        total = await db.scalar(
+            text("SELECT count(*) FROM personas_fts WHERE personas_fts MATCH :q"),
+            {"q": consulta}
+        )
+
+    aproximado = bool(limite) and total >= limite
+    conteo_cache.set(consulta, (total, aproximado))
+    return total, aproximado
+
+
+async def resumen(db: AsyncSession, dias: int = 30) -> dict:
+    """Resumen para el panel: total, registros por origen y por día"""
+    filas = (await db.execute(select(ContadorPersonas.clave, ContadorPersonas.valor))).all()
+    contadores = {clave: valor for clave, valor in filas}
+
+    por_origen = {
+        clave.split(":", 1)[1]: valor
+        for clave, valor in contadores.items()
+        if clave.startswith("origen:") and valor
+    }
+
+    # fecha_registro se guarda en UTC (CURRENT_TIMESTAMP de SQLite)
+    hoy = datetime.now(timezone.utc).date()
+    por_dia = []
+    for i in range(dias - 1, -1, -1):
+        dia = (hoy - timedelta(days=i)).isoformat()
+        por_dia.append({"fecha": dia, "registros": contadores.get(f"dia:{dia}", 0)})
+
+    total = contadores.get("total")
+    if total is None:
+        total = await total_personas(db)
+
+    return {
+        "total_personas": total,
+        "por_origen": por_origen,
+        "por_dia": por_dia,
+    }
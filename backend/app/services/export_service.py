@@ -0,0 +1,122 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional, Sequence
+
+from sqlalchemy import String, literal, or_, select
+
+from ..database import AsyncReadSessionLocal
+from ..models import Persona
+
+FORMATOS = ("ndjson", "csv")
+
+COLUMNAS_EXPORTACION = [
+    "id", "tipodoc", "nrodoc", "nombres", "apellido_paterno", "apellido_materno",
+    "codigo_verificacion", "origen", "fecha_registro", "fecha_actualizacion",
+]
+
+_COLUMNAS = [getattr(Persona, nombre) for nombre in COLUMNAS_EXPORTACION]
+
+
+def _marca_sqlite(fecha: datetime):
+    """
+    Convierte una fecha del filtro al formato en que SQLite guarda las fechas
+    (texto UTC "AAAA-MM-DD HH:MM:SS", de CURRENT_TIMESTAMP). Se compara como
+    texto, por eso no debe llevar microsegundos ni zona horaria.
+    """
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return literal(fecha.strftime("%Y-%m-%d %H:%M:%S"), String)
+
+
+def _valor(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else valor
+
+
+def _ndjson(filas: Sequence) -> str:
+    return "".join(
+        json.dumps(dict(zip(COLUMNAS_EXPORTACION, map(_valor, fila))), ensure_ascii=False) + "\n"
+        for fila in filas
+    )
+
+
+def _csv(filas: Sequence, writer, buffer: io.StringIO) -> str:
+    writer.writerows([[_valor(v) if v is not None else "" for v in fila] for fila in filas])
+    texto = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return texto
+
+
+def consulta_exportacion(
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    actualizado_desde: Optional[datetime] = None
+):
+    """
+    Consulta de la exportación: desde/hasta filtran por fecha_registro y
+    actualizado_desde devuelve las personas registradas o actualizadas desde
+    esa fecha, incluido el mismo segundo (exportación incremental: en el
+    borde se pueden repetir filas, nunca perderlas).
+    """
+    # Sin ORDER BY cuando hay filtros: así SQLite puede usar los índices de
+    # fechas (incluido MULTI-INDEX OR) en lugar de recorrer la tabla por id
+    stmt = select(*_COLUMNAS)
+    if desde is None and hasta is None and actualizado_desde is None:
+        stmt = stmt.order_by(Persona.id)
+    if desde is not None:
+        stmt = stmt.where(Persona.fecha_registro >= _marca_sqlite(desde))
+    if hasta is not None:
+        stmt = stmt.where(Persona.fecha_registro < _marca_sqlite(hasta))
+    if actualizado_desde is not None:
+        marca = _marca_sqlite(actualizado_desde)
+        stmt = stmt.where(or_(
+            Persona.fecha_registro >= marca,
+            Persona.fecha_actualizacion >= marca
+        ))
+    return stmt
+
+
+async def generar_exportacion(
+    formato: str = "ndjson",
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    actualizado_desde: Optional[datetime] = None,
+    comprimir: bool = False,
+    tamano_bloque: int = 1000
+) -> AsyncIterator[bytes]:
+    """
+    Genera la exportación de personas (filtrada como en consulta_exportacion)
+    por bloques desde un cursor del servidor, así la memoria no depende del
+    tamaño de la tabla. Usa su propia sesión porque se consume mientras se
+    envía la respuesta.
+    """
+    stmt = consulta_exportacion(desde, hasta, actualizado_desde)
+
+    # gzip incremental: cada bloque se comprime al enviarse
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+
+    def salida(texto: str) -> bytes:
+        datos = texto.encode("utf-8")
+        return compresor.compress(datos) if compresor else datos
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if formato == "csv":
+        writer.writerow(COLUMNAS_EXPORTACION)
+
+    async with AsyncReadSessionLocal() as db:
+        resultado = await db.stream(stmt.execution_options(yield_per=tamano_bloque))
+        async for filas in resultado.partitions():
+            texto = _csv(filas, writer, buffer) if formato == "csv" else _ndjson(filas)
+            datos = salida(texto)
+            if datos:
+                yield datos
+
+    # Sin filas, el encabezado del CSV sigue en el buffer
+    if buffer.tell():
+        yield salida(_csv([], writer, buffer))
+    if compresor:
+        yield compresor.flush()
@@ -0,0 +1,78 @@
+import logging
+from typing import Optional
+
+import httpx
+
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Cliente HTTP compartido por toda la aplicación para llamar a apisperu.com.
+# Se crea al iniciar la app y se cierra al apagarla, de modo que las
+# conexiones TCP/TLS se reutilizan entre consultas (keep-alive).
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_disponible() -> bool:
+    """HTTP/2 en httpx requiere el paquete opcional 'h2'"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def crear_cliente(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """Construye un cliente con pool de conexiones y timeouts configurables"""
+    settings = get_settings()
+
+    http2 = settings.UPSTREAM_HTTP2
+    if http2 and not _http2_disponible():
+        logger.warning("UPSTREAM_HTTP2 activado pero el paquete 'h2' no está instalado; se usará HTTP/1.1")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=settings.UPSTREAM_CONNECT_TIMEOUT,
+        read=settings.UPSTREAM_READ_TIMEOUT,
+        write=settings.UPSTREAM_READ_TIMEOUT,
+        pool=settings.UPSTREAM_POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=timeout,
+        http2=http2,
+        transport=transport,
+    )
+
+
+async def iniciar_cliente(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """Crea el cliente compartido (se llama al iniciar la aplicación)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+    _client = crear_cliente(transport)
+    return _client
+
+
+async def cerrar_cliente() -> None:
+    """Cierra el cliente compartido y sus conexiones (al apagar la aplicación)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Devuelve el cliente compartido.
+    Si la app no lo inició (por ejemplo en scripts), se crea bajo demanda.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = crear_cliente()
+    return _client
@@ -0,0 +1,224 @@
+import codecs
+import csv
+import itertools
+import json
+import time
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..models import DniNoEncontrado, Persona
+from ..schemas import PersonaCreate
+from .cache_service import conteo_cache, persona_cache, no_encontrado_cache
+from .dni_service import validar_dni
+
+FORMATOS = ("csv", "ndjson")
+
+_CAMPOS = list(PersonaCreate.model_fields)
+
+# Líneas que puede ocupar un registro CSV con saltos de línea entre comillas
+_MAX_LINEAS_REGISTRO = 50
+
+
+def _upsert(columnas: Iterable[str]):
+    """
+    INSERT ... ON CONFLICT(nrodoc) DO UPDATE de las columnas que trae el
+    archivo: las que no vienen conservan su valor. La fila existente pasa a
+    origen importacion (así cuadran los contadores por origen y el refresco
+    no la pisa), salvo las de origen manual, que no se tocan.
+    """
+    stmt = sqlite_insert(Persona)
+    set_ = {columna: stmt.excluded[columna] for columna in columnas if columna != "nrodoc"}
+    set_.update({"origen": stmt.excluded.origen, "fecha_actualizacion": func.now()})
+    return stmt.on_conflict_do_update(
+        index_elements=[Persona.nrodoc],
+        set_=set_,
+        where=Persona.origen.is_distinct_from("manual"),
+    )
+
+
+async def _guardar_bloque(db: AsyncSession, filas: List[dict]) -> Tuple[int, int]:
+    """
+    Guarda un bloque en una sola transacción y devuelve cuántas personas
+    ya existían y cuántas de ellas se omitieron por ser de origen manual.
+    Los DNIs importados dejan de figurar como no encontrados y los conteos
+    de búsqueda guardados se descartan.
+    """
+    nrodocs = list({fila["nrodoc"] for fila in filas})
+    existentes, manuales = (await db.execute(
+        select(func.count(), func.count().filter(Persona.origen == "manual"))
+        .select_from(Persona).where(Persona.nrodoc.in_(nrodocs))
+    )).one()
+    # Un upsert por tramo de filas con las mismas columnas, en el orden del archivo
+    for columnas, tramo in itertools.groupby(filas, key=lambda fila: tuple(fila)):
+        await db.execute(_upsert(columnas), list(tramo))
+    await db.execute(delete(DniNoEncontrado).where(DniNoEncontrado.nrodoc.in_(nrodocs)))
+    await db.commit()
+
+    for nrodoc in nrodocs:
+        persona_cache.invalidate(nrodoc)
+        no_encontrado_cache.invalidate(nrodoc)
+    conteo_cache.clear()
+    return existentes, manuales
+
+
+async def _lineas(contenido: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Líneas del cuerpo, con su salto de línea, a medida que llegan"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    resto = ""
+    async for chunk in contenido:
+        *lineas, resto = (resto + decoder.decode(chunk)).split("\n")
+        for linea in lineas:
+            yield linea + "\n"
+    resto += decoder.decode(b"", final=True)
+    if resto:
+        yield resto
+
+
+async def _registros_csv(lineas: AsyncIterator[str]) -> AsyncIterator[Tuple[int, List[str], bool]]:
+    """
+    Agrupa las líneas de cada registro CSV: un campo entre comillas puede
+    tener saltos de línea, y el registro sigue mientras queden comillas sin
+    cerrar (las comillas escapadas van de a dos, así que al cerrar el campo
+    la cantidad es par). Devuelve (número de la primera línea, líneas,
+    completo); un registro de más de _MAX_LINEAS_REGISTRO líneas se da por
+    incompleto para no acumular el resto del archivo por una comilla suelta.
+    """
+    numero = 0
+    pendientes: List[str] = []
+    comillas = 0
+    async for linea in lineas:
+        numero += 1
+        pendientes.append(linea)
+        comillas += linea.count('"')
+        if comillas % 2 and len(pendientes) < _MAX_LINEAS_REGISTRO:
+            continue
+        yield numero - len(pendientes) + 1, pendientes, comillas % 2 == 0
+        pendientes, comillas = [], 0
+    if pendientes:
+        yield numero - len(pendientes) + 1, pendientes, comillas % 2 == 0
+
+
+async def importar_personas(
+    db: AsyncSession,
+    contenido: AsyncIterator[bytes],
+    formato: str = "csv"
+) -> dict:
+    """
+    Importa personas desde un CSV (con encabezado) o NDJSON leído por partes.
+
+    Cada fila se valida con PersonaCreate y con el formato de DNI; las
+    válidas se guardan con upsert por nrodoc en bloques de IMPORT_BATCH_SIZE
+    filas por transacción. Solo se actualizan las columnas presentes en el
+    archivo y las personas de origen manual se omiten. Devuelve el resumen
+    con los errores por fila (hasta IMPORT_MAX_ERRORES) y el rendimiento.
+    """
+    settings = get_settings()
+    inicio = time.perf_counter()
+
+    filas: List[dict] = []
+    errores: List[dict] = []
+    resumen = {"filas": 0, "insertadas": 0, "actualizadas": 0, "omitidas": 0, "con_error": 0}
+    encabezado: Optional[List[str]] = None
+    numero_linea = 0
+
+    def registrar_error(nrodoc, mensaje: str) -> None:
+        resumen["con_error"] += 1
+        if len(errores) < settings.IMPORT_MAX_ERRORES:
+            errores.append({"linea": numero_linea, "nrodoc": nrodoc, "error": mensaje})
+
+    async def guardar() -> None:
+        existentes, manuales = await _guardar_bloque(db, filas)
+        resumen["actualizadas"] += existentes - manuales
+        resumen["omitidas"] += manuales
+        resumen["insertadas"] += len({f["nrodoc"] for f in filas}) - existentes
+        filas.clear()
+
+    async def procesar(datos: dict) -> None:
+        resumen["filas"] += 1
+        datos = {
+            campo: (valor.strip() or None) if isinstance(valor, str) else valor
+            for campo, valor in datos.items() if campo in _CAMPOS
+        }
+        nrodoc = datos.get("nrodoc")
+        if datos.get("tipodoc") is None:
+            datos.pop("tipodoc", None)
+
+        try:
+            persona = PersonaCreate(**datos)
+        except ValidationError as e:
+            detalle = "; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+            )
+            registrar_error(nrodoc, detalle)
+            return
+
+        error = validar_dni(persona.nrodoc)
+        if error:
+            registrar_error(persona.nrodoc, error)
+            return
+
+        filas.append({**persona.model_dump(exclude_unset=True), "origen": "importacion"})
+        if len(filas) >= settings.IMPORT_BATCH_SIZE:
+            await guardar()
+
+    async def procesar_csv(lineas: List[str], completo: bool) -> None:
+        nonlocal encabezado
+        if len(lineas) == 1 and not lineas[0].strip():
+            return
+        if not completo:
+            resumen["filas"] += 1
+            registrar_error(None, "Comillas sin cerrar")
+            return
+
+        try:
+            valores = next(csv.reader(lineas))
+        except csv.Error as e:
+            resumen["filas"] += 1
+            registrar_error(None, f"CSV inválido: {e}")
+            return
+        if encabezado is None:
+            encabezado = [columna.strip().lower() for columna in valores]
+            if "nrodoc" not in encabezado:
+                raise ValueError("El CSV debe tener encabezado con la columna nrodoc")
+            return
+        await procesar(dict(zip(encabezado, valores)))
+
+    async def procesar_ndjson(linea: str) -> None:
+        if not linea.strip():
+            return
+        try:
+            datos = json.loads(linea)
+        except ValueError:
+            resumen["filas"] += 1
+            registrar_error(None, "JSON inválido")
+            return
+        if not isinstance(datos, dict):
+            resumen["filas"] += 1
+            registrar_error(None, "Se esperaba un objeto JSON")
+            return
+        await procesar(datos)
+
+    if formato == "csv":
+        async for numero_linea, lineas, completo in _registros_csv(_lineas(contenido)):
+            await procesar_csv(lineas, completo)
+    else:
+        async for linea in _lineas(contenido):
+            numero_linea += 1
+            await procesar_ndjson(linea)
+
+    if filas:
+        await guardar()
+
+    duracion = time.perf_counter() - inicio
+    resumen.update({
+        "duracion_segundos": round(duracion, 3),
+        "filas_por_segundo": round(resumen["filas"] / duracion, 1) if duracion > 0 else 0.0,
+        "errores": errores,
+        "errores_omitidos": resumen["con_error"] - len(errores),
+    })
+    return resumen
@@ -0,0 +1,433 @@
+import asyncio
+import codecs
+import csv
+import io
+import logging
+import re
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional
+
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import AsyncSessionLocal, AsyncReadSessionLocal
+from ..models import Persona, TrabajoLote, TrabajoLoteItem
+from . import dni_service
+
+logger = logging.getLogger(__name__)
+
+# Separadores admitidos en cada línea del archivo (CSV, TSV o ';')
+_SEPARADORES = re.compile(r"[,;\t]")
+
+# Filas insertadas por sentencia al registrar un trabajo
+_FILAS_POR_INSERT = 5000
+
+_tarea_worker: Optional[asyncio.Task] = None
+_nuevo_trabajo = asyncio.Event()
+
+
+def _extraer_dni(linea: str) -> str:
+    """Toma la primera columna de la línea, sin comillas ni espacios"""
+    return _SEPARADORES.split(linea, 1)[0].strip().strip('"\'').strip()
+
+
+async def crear_trabajo(
+    db: AsyncSession, contenido: AsyncIterator[bytes]
+) -> tuple[Optional[TrabajoLote], str]:
+    """
+    Registra un trabajo a partir de un archivo con un DNI por línea
+    (se usa la primera columna si es CSV). El archivo se lee por partes,
+    sin cargarlo completo en memoria.
+
+    Returns:
+        (TrabajoLote, message) o (None, error_message)
+    """
+    settings = get_settings()
+    # El trabajo queda en estado "cargando" mientras se recibe el archivo;
+    # cada bloque de DNIs se confirma por separado para no retener el
+    # bloqueo de escritura de SQLite mientras se espera al cliente.
+    trabajo_id = uuid.uuid4().hex
+    db.add(TrabajoLote(id=trabajo_id, estado="cargando"))
+    await db.commit()
+
+    filas: List[dict] = []
+    total = 0
+    invalidos = 0
+    resto = ""
+    primera_linea = True
+
+    async def procesar_linea(linea: str) -> Optional[str]:
+        nonlocal total, invalidos, primera_linea
+        dni = _extraer_dni(linea)
+        if not dni:
+            return None
+
+        # Ignorar una cabecera tipo "dni" en la primera línea
+        if primera_linea:
+            primera_linea = False
+            if not any(c.isdigit() for c in dni):
+                return None
+
+        total += 1
+        if total > settings.JOB_MAX_DNIS:
+            return f"El archivo supera el máximo de {settings.JOB_MAX_DNIS} DNIs"
+
+        error = dni_service.validar_dni(dni)
+        if error:
+            invalidos += 1
+        filas.append({
+            "trabajo_id": trabajo_id,
+            "posicion": total,
+            "nrodoc": dni[:20],
+            "estado": "invalido" if error else "pendiente",
+            "mensaje": error,
+        })
+        if len(filas) >= _FILAS_POR_INSERT:
+            await db.execute(insert(TrabajoLoteItem), filas)
+            await db.commit()
+            filas.clear()
+        return None
+
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    error = None
+    try:
+        async for chunk in contenido:
+            *lineas, resto = (resto + decoder.decode(chunk)).split("\n")
+            for linea in lineas:
+                error = await procesar_linea(linea)
+                if error:
+                    break
+            if error:
+                break
+        else:
+            resto += decoder.decode(b"", final=True)
+            if resto:
+                error = await procesar_linea(resto)
+    except BaseException:
+        # Cliente desconectado u otro fallo durante la carga
+        await _descartar_trabajo(db, trabajo_id)
+        raise
+
+    if not error and total == 0:
+        error = "El archivo no contiene DNIs"
+
+    if error:
+        await _descartar_trabajo(db, trabajo_id)
+        return None, error
+
+    if filas:
+        await db.execute(insert(TrabajoLoteItem), filas)
+
+    trabajo = await obtener_trabajo(db, trabajo_id)
+    trabajo.estado = "pendiente"
+    trabajo.total = total
+    trabajo.invalidos = invalidos
+    trabajo.procesados = invalidos
+    await db.commit()
+    await db.refresh(trabajo)
+
+    _nuevo_trabajo.set()
+    return trabajo, "Trabajo registrado correctamente"
+
+
+async def _descartar_trabajo(db: AsyncSession, trabajo_id: str) -> None:
+    """Elimina un trabajo cuya carga no se completó"""
+    await db.rollback()
+    await db.execute(delete(TrabajoLoteItem).where(TrabajoLoteItem.trabajo_id == trabajo_id))
+    await db.execute(delete(TrabajoLote).where(TrabajoLote.id == trabajo_id))
+    await db.commit()
+
+
+async def obtener_trabajo(db: AsyncSession, trabajo_id: str) -> Optional[TrabajoLote]:
+    """Obtiene un trabajo por su ID"""
+    return await db.get(TrabajoLote, trabajo_id)
+
+
+def trabajo_a_dict(trabajo: TrabajoLote) -> dict:
+    """Estado de un trabajo con su porcentaje de avance"""
+    return {
+        "id": trabajo.id,
+        "estado": trabajo.estado,
+        "total": trabajo.total,
+        "procesados": trabajo.procesados,
+        "encontrados": trabajo.encontrados,
+        "no_encontrados": trabajo.no_encontrados,
+        "invalidos": trabajo.invalidos,
+        "errores": trabajo.errores,
+        "porcentaje": round(100 * trabajo.procesados / trabajo.total, 2) if trabajo.total else 0.0,
+        "mensaje": trabajo.mensaje,
+        "fecha_creacion": trabajo.fecha_creacion,
+        "fecha_inicio": trabajo.fecha_inicio,
+        "fecha_fin": trabajo.fecha_fin,
+    }
+
+
+# Columnas del archivo de resultados
+COLUMNAS_RESULTADO = [
+    "posicion", "dni", "estado", "mensaje", "nombres",
+    "apellido_paterno", "apellido_materno", "codigo_verificacion"
+]
+
+
+async def generar_resultados_csv(trabajo_id: str, tamano_bloque: int = 2000) -> AsyncIterator[str]:
+    """
+    Genera el CSV de resultados por bloques, paginando por posición.
+    Usa su propia sesión porque se consume mientras se envía la respuesta.
+    """
+    async with AsyncReadSessionLocal() as db:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(COLUMNAS_RESULTADO)
+
+        ultima_posicion = 0
+        while True:
+            filas = (await db.execute(
+                select(TrabajoLoteItem, Persona)
+                .outerjoin(Persona, Persona.id == TrabajoLoteItem.persona_id)
+                .where(
+                    TrabajoLoteItem.trabajo_id == trabajo_id,
+                    TrabajoLoteItem.posicion > ultima_posicion
+                )
+                .order_by(TrabajoLoteItem.posicion)
+                .limit(tamano_bloque)
+            )).all()
+            if not filas:
+                break
+
+            for item, persona in filas:
+                writer.writerow([
+                    item.posicion,
+                    item.nrodoc,
+                    item.estado,
+                    item.mensaje or "",
+                    persona.nombres if persona else "",
+                    persona.apellido_paterno if persona else "",
+                    persona.apellido_materno if persona else "",
+                    persona.codigo_verificacion if persona else "",
+                ])
+            ultima_posicion = filas[-1][0].posicion
+            # Soltar los objetos ya escritos para mantener la memoria acotada
+            db.expunge_all()
+
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue()
+
+
+# ==================== Worker ====================
+
+async def _procesar_bloque(db: AsyncSession, trabajo: TrabajoLote, items: List[TrabajoLoteItem]) -> None:
+    """Resuelve un bloque de DNIs pendientes y guarda sus resultados"""
+    settings = get_settings()
+    dnis = list(dict.fromkeys(item.nrodoc for item in items))
+
+    # Aciertos locales con una sola consulta; los faltantes van a la API
+    # externa a ritmo controlado para no agotar la cuota
+    resultados = await dni_service.buscar_personas_lote(
+        db,
+        dnis,
+        concurrencia=settings.JOB_UPSTREAM_CONCURRENCY,
+        max_por_segundo=settings.JOB_UPSTREAM_RATE_PER_SECOND
+    )
+
+    ahora = datetime.utcnow()
+    cambios = []
+    encontrados = no_encontrados = errores = 0
+    for item in items:
+        persona, mensaje, definitivo = resultados[item.nrodoc]
+        cambio = {
+            "id": item.id, "mensaje": mensaje[:255], "persona_id": None,
+            "intentos": item.intentos, "reintentar_desde": None,
+        }
+        if persona:
+            encontrados += 1
+            cambio.update(estado="encontrado", mensaje=None, persona_id=persona.id)
+        elif definitivo:
+            no_encontrados += 1
+            cambio["estado"] = "no_encontrado"
+        elif item.intentos + 1 < settings.JOB_RETRY_MAX_ATTEMPTS:
+            # Error pasajero: sigue pendiente hasta que venza la espera
+            espera = _espera_reintento(item.intentos + 1)
+            cambio.update(
+                estado="pendiente", intentos=item.intentos + 1,
+                reintentar_desde=ahora + timedelta(seconds=espera)
+            )
+        else:
+            errores += 1
+            cambio.update(estado="error", intentos=item.intentos + 1)
+        cambios.append(cambio)
+
+    await db.execute(update(TrabajoLoteItem), cambios)
+    trabajo.procesados += encontrados + no_encontrados + errores
+    trabajo.encontrados += encontrados
+    trabajo.no_encontrados += no_encontrados
+    trabajo.errores += errores
+    await db.commit()
+
+
+def _espera_reintento(intento: int) -> float:
+    """Backoff exponencial del reintento número `intento` de un DNI"""
+    settings = get_settings()
+    return min(
+        settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (intento - 1),
+        settings.JOB_RETRY_BACKOFF_MAX_SECONDS
+    )
+
+
+async def _procesar_trabajo(db: AsyncSession, trabajo: TrabajoLote) -> None:
+    """
+    Procesa los DNIs pendientes de un trabajo. Si quedan DNIs esperando un
+    reintento, el trabajo se suelta con la reserva hasta el más próximo:
+    así el worker atiende otros trabajos y lo retoma cuando venza.
+    """
+    settings = get_settings()
+
+    if trabajo.fecha_inicio is None:
+        trabajo.fecha_inicio = datetime.utcnow()
+        await db.commit()
+
+    while True:
+        items = list(await db.scalars(
+            select(TrabajoLoteItem)
+            .where(
+                TrabajoLoteItem.trabajo_id == trabajo.id,
+                TrabajoLoteItem.estado == "pendiente",
+                or_(
+                    TrabajoLoteItem.reintentar_desde.is_(None),
+                    TrabajoLoteItem.reintentar_desde <= datetime.utcnow()
+                )
+            )
+            .order_by(TrabajoLoteItem.posicion)
+            .limit(settings.JOB_CHUNK_SIZE)
+        ))
+        if not items:
+            break
+        await _procesar_bloque(db, trabajo, items)
+        # Renovar la reserva para que otro proceso no lo tome
+        trabajo.reservado_hasta = _fin_reserva()
+        await db.commit()
+        for item in items:
+            db.expunge(item)
+
+    proximo_reintento = await db.scalar(
+        select(func.min(TrabajoLoteItem.reintentar_desde)).where(
+            TrabajoLoteItem.trabajo_id == trabajo.id,
+            TrabajoLoteItem.estado == "pendiente"
+        )
+    )
+    if proximo_reintento is not None:
+        trabajo.reservado_hasta = proximo_reintento
+        await db.commit()
+        return
+
+    trabajo.estado = "completado"
+    trabajo.reservado_hasta = None
+    trabajo.fecha_fin = datetime.utcnow()
+    await db.commit()
+
+
+def _fin_reserva() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=get_settings().JOB_LEASE_SECONDS)
+
+
+async def _reservar_siguiente_trabajo(db: AsyncSession) -> Optional[TrabajoLote]:
+    """
+    Reserva el trabajo más antiguo sin terminar. Incluye los que quedaron
+    interrumpidos por un reinicio (su reserva ya venció). La reserva es un
+    UPDATE condicional, así que con varios procesos solo uno lo toma.
+    """
+    ahora = datetime.utcnow()
+    disponibles = or_(
+        TrabajoLote.estado == "pendiente",
+        and_(
+            TrabajoLote.estado == "procesando",
+            or_(TrabajoLote.reservado_hasta.is_(None), TrabajoLote.reservado_hasta < ahora)
+        )
+    )
+    candidatos = list(await db.scalars(
+        select(TrabajoLote.id)
+        .where(disponibles)
+        .order_by(TrabajoLote.fecha_creacion, TrabajoLote.id)
+        .limit(5)
+    ))
+    for trabajo_id in candidatos:
+        resultado = await db.execute(
+            update(TrabajoLote)
+            .where(TrabajoLote.id == trabajo_id, disponibles)
+            .values(estado="procesando", reservado_hasta=_fin_reserva())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if resultado.rowcount:
+            return await obtener_trabajo(db, trabajo_id)
+    return None
+
+
+async def _descartar_cargas_abandonadas(db: AsyncSession) -> None:
+    """Elimina trabajos cuya carga quedó a medias (por ejemplo, por un reinicio)"""
+    limite = datetime.utcnow() - timedelta(hours=1)
+    abandonados = list(await db.scalars(
+        select(TrabajoLote.id).where(
+            TrabajoLote.estado == "cargando",
+            TrabajoLote.fecha_creacion < limite
+        )
+    ))
+    for trabajo_id in abandonados:
+        await _descartar_trabajo(db, trabajo_id)
+
+
+async def _worker() -> None:
+    """Bucle principal: procesa los trabajos de uno en uno"""
+    settings = get_settings()
+
+    async with AsyncSessionLocal() as db:
+        await _descartar_cargas_abandonadas(db)
+
+    while True:
+        _nuevo_trabajo.clear()
+        async with AsyncSessionLocal() as db:
+            trabajo = await _reservar_siguiente_trabajo(db)
+            if trabajo:
+                try:
+                    await _procesar_trabajo(db, trabajo)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.exception("Error procesando el trabajo %s", trabajo.id)
+                    await db.rollback()
+                    trabajo.estado = "error"
+                    trabajo.mensaje = str(e)[:255]
+                    trabajo.reservado_hasta = None
+                    trabajo.fecha_fin = datetime.utcnow()
+                    await db.commit()
+                continue
+
+        # Sin trabajos: esperar un aviso de nuevo trabajo o el intervalo de sondeo
+        try:
+            await asyncio.wait_for(_nuevo_trabajo.wait(), timeout=settings.JOB_POLL_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def iniciar_worker() -> None:
+    """Inicia el worker de trabajos en segundo plano"""
+    global _tarea_worker
+    if _tarea_worker is None or _tarea_worker.done():
+        _tarea_worker = asyncio.create_task(_worker())
+
+
+async def detener_worker() -> None:
+    """Detiene el worker; los trabajos sin terminar se retoman al reiniciar"""
+    global _tarea_worker
+    if _tarea_worker is not None:
+        _tarea_worker.cancel()
+        try:
+            await _tarea_worker
+        except asyncio.CancelledError:
+            pass
+        _tarea_worker = None
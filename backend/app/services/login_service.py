@@ -0,0 +1,112 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import case, delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..models import IntentoLogin
+from .cache_service import login_bloqueo_cache, login_cache
+
+
+def _vigente(ultimo: float, ahora: float) -> bool:
+    return ahora - ultimo < get_settings().LOGIN_LOCKOUT_SECONDS
+
+
+async def segundos_bloqueado(db: AsyncSession, ip: str) -> int:
+    """
+    Segundos que le quedan de bloqueo a una IP (0 si puede intentar).
+    Con persistencia activa se consulta SQLite si la IP no está bloqueada en
+    memoria, así se respetan los bloqueos de otros workers y de antes de
+    reiniciar.
+    """
+    settings = get_settings()
+    ahora = time.time()
+    bloqueo = login_bloqueo_cache.get(ip)
+    if bloqueo is not None and _vigente(bloqueo, ahora):
+        return int(settings.LOGIN_LOCKOUT_SECONDS - (ahora - bloqueo)) + 1
+
+    entrada = login_cache.get(ip)
+
+    if settings.LOGIN_THROTTLE_PERSIST and (entrada is None or entrada[0] < settings.LOGIN_MAX_ATTEMPTS):
+        fila = await db.get(IntentoLogin, ip)
+        if fila is not None:
+            # ultimo_intento se guarda en UTC sin zona horaria
+            ultimo = fila.ultimo_intento.replace(tzinfo=timezone.utc).timestamp()
+            if _vigente(ultimo, ahora):
+                entrada = (fila.intentos, ultimo)
+                _recordar(ip, entrada, ahora)
+
+    if entrada is None:
+        return 0
+
+    intentos, ultimo = entrada
+    if intentos >= settings.LOGIN_MAX_ATTEMPTS and _vigente(ultimo, ahora):
+        return int(settings.LOGIN_LOCKOUT_SECONDS - (ahora - ultimo)) + 1
+    return 0
+
+
+async def registrar_fallo(db: AsyncSession, ip: str) -> int:
+    """
+    Registra un intento fallido y devuelve los intentos acumulados en la
+    ventana actual. La ventana se reinicia si pasó LOGIN_LOCKOUT_SECONDS
+    desde el último intento.
+    """
+    settings = get_settings()
+    ahora = time.time()
+    # Limpieza incremental de IPs cuya ventana ya venció
+    login_cache.purgar_expirados()
+    login_bloqueo_cache.purgar_expirados()
+
+    entrada = login_cache.get(ip)
+    intentos = entrada[0] + 1 if entrada and _vigente(entrada[1], ahora) else 1
+
+    if settings.LOGIN_THROTTLE_PERSIST:
+        # Un solo upsert atómico: los fallos de varios workers se suman
+        fecha = datetime.utcnow()
+        limite = fecha - timedelta(seconds=settings.LOGIN_LOCKOUT_SECONDS)
+        stmt = sqlite_insert(IntentoLogin).values(ip=ip, intentos=1, ultimo_intento=fecha)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[IntentoLogin.ip],
+            set_={
+                "intentos": case(
+                    (IntentoLogin.ultimo_intento < limite, 1),
+                    else_=IntentoLogin.intentos + 1
+                ),
+                "ultimo_intento": fecha,
+            },
+        )
+        await db.execute(stmt)
+        intentos = await db.scalar(select(IntentoLogin.intentos).where(IntentoLogin.ip == ip))
+        await db.commit()
+
+    _recordar(ip, (intentos, ahora), ahora)
+    return intentos
+
+
+def _recordar(ip: str, entrada: tuple, ahora: float) -> None:
+    """Guarda los intentos de una IP y, si quedó bloqueada, el bloqueo aparte"""
+    settings = get_settings()
+    intentos, ultimo = entrada
+    ttl = settings.LOGIN_LOCKOUT_SECONDS - (ahora - ultimo)
+    login_cache.set(ip, entrada, ttl=ttl)
+    if intentos >= settings.LOGIN_MAX_ATTEMPTS:
+        login_bloqueo_cache.set(ip, ultimo, ttl=ttl)
+
+
+async def limpiar(db: AsyncSession, ip: str) -> None:
+    """Olvida los intentos de una IP tras un login exitoso"""
+    login_cache.invalidate(ip)
+    login_bloqueo_cache.invalidate(ip)
+    if get_settings().LOGIN_THROTTLE_PERSIST:
+        await db.execute(delete(IntentoLogin).where(IntentoLogin.ip == ip))
+        await db.commit()
+
+
+async def purgar_expirados(db: AsyncSession) -> int:
+    """Elimina de la tabla los intentos cuya ventana ya venció"""
+    limite = datetime.utcnow() - timedelta(seconds=get_settings().LOGIN_LOCKOUT_SECONDS)
+    resultado = await db.execute(delete(IntentoLogin).where(IntentoLogin.ultimo_intento < limite))
+    await db.commit()
+    return resultado.rowcount
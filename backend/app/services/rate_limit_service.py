@@ -0,0 +1,164 @@
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from ..config import get_settings
+
+_EPOCH = date(1970, 1, 1).toordinal()
+
+# Posiciones de cada entrada: se usa una lista en lugar de un objeto para
+# que cada token ocupe poco y el acceso sea rápido
+_FICHAS, _ULTIMO, _DIA, _BASE, _LOCAL = range(5)
+
+# Cubeta llena: consumir la recorta al límite del token
+_LLENA = float("inf")
+
+
+def dia_a_fecha(dia: int) -> date:
+    """Día desde 1970-01-01 (UTC) a fecha"""
+    return date.fromordinal(_EPOCH + dia)
+
+
+def fecha_a_dia(fecha: date) -> int:
+    """Fecha a día desde 1970-01-01"""
+    return fecha.toordinal() - _EPOCH
+
+
+class LimitadorTokens:
+    """
+    Limitador por token de API: cubeta de fichas (token bucket) por minuto
+    y cuota diaria (día UTC).
+
+    Los contadores están repartidos en shards, cada uno con su propio lock,
+    para que los tokens no compitan entre sí. El uso diario se guarda como
+    base (último total conocido en SQLite) más local (peticiones aún no
+    sincronizadas); al sincronizar, el local se suma en la base de datos y la
+    base se actualiza con el total leído, que incluye el de otros procesos.
+    """
+
+    def __init__(self, shards: int = 16):
+        self._shards: List[Tuple[Dict[int, list], threading.Lock]] = [
+            ({}, threading.Lock()) for _ in range(max(1, shards))
+        ]
+
+    def _shard(self, token_id: int) -> Tuple[Dict[int, list], threading.Lock]:
+        return self._shards[token_id % len(self._shards)]
+
+    def consumir(
+        self,
+        token_id: int,
+        por_minuto: int,
+        cuota_diaria: int,
+        ahora: Optional[float] = None
+    ) -> Tuple[bool, int, float, int]:
+        """
+        Registra una petición si está permitida.
+
+        por_minuto o cuota_diaria en 0 significan sin límite.
+        Devuelve (permitida, fichas_restantes, segundos_para_reintentar,
+        cuota_restante); fichas_restantes y cuota_restante son -1 si no hay
+        límite.
+        """
+        if ahora is None:
+            ahora = time.time()
+        dia = int(ahora // 86400)
+        datos, lock = self._shard(token_id)
+
+        with lock:
+            e = datos.get(token_id)
+            if e is None:
+                e = datos[token_id] = [_LLENA, ahora, dia, 0, 0]
+            elif e[_DIA] != dia:
+                e[_DIA] = dia
+                e[_BASE] = 0
+                e[_LOCAL] = 0
+
+            usados = e[_BASE] + e[_LOCAL]
+            if cuota_diaria and usados >= cuota_diaria:
+                return False, 0, 86400 - ahora % 86400, 0
+
+            if por_minuto:
+                tasa = por_minuto / 60.0
+                fichas = e[_FICHAS] + (ahora - e[_ULTIMO]) * tasa
+                if fichas > por_minuto:
+                    fichas = por_minuto
+                e[_ULTIMO] = ahora
+                if fichas < 1:
+                    e[_FICHAS] = fichas
+                    restante = cuota_diaria - usados if cuota_diaria else -1
+                    return False, 0, (1 - fichas) / tasa, restante
+                e[_FICHAS] = fichas - 1
+
+            e[_LOCAL] += 1
+            return (
+                True,
+                int(e[_FICHAS]) if por_minuto else -1,
+                0.0,
+                (cuota_diaria - usados - 1) if cuota_diaria else -1,
+            )
+
+    def cargar(self, token_id: int, dia: int, usados: int) -> None:
+        """Incorpora el uso diario guardado en SQLite (no lo reduce)"""
+        datos, lock = self._shard(token_id)
+        with lock:
+            e = datos.get(token_id)
+            if e is None:
+                ahora = time.time()
+                if dia == int(ahora // 86400):
+                    datos[token_id] = [_LLENA, ahora, dia, usados, 0]
+            elif e[_DIA] == dia and usados > e[_BASE]:
+                e[_BASE] = usados
+
+    def tomar_pendientes(self) -> List[Tuple[int, int, int]]:
+        """
+        Devuelve [(token_id, dia, peticiones)] sin sincronizar y los pasa a
+        la base, como si ya estuvieran guardados.
+        """
+        pendientes = []
+        for datos, lock in self._shards:
+            with lock:
+                for token_id, e in datos.items():
+                    if e[_LOCAL]:
+                        pendientes.append((token_id, e[_DIA], e[_LOCAL]))
+                        e[_BASE] += e[_LOCAL]
+                        e[_LOCAL] = 0
+        return pendientes
+
+    def devolver_pendientes(self, pendientes: List[Tuple[int, int, int]]) -> None:
+        """Revierte tomar_pendientes si no se pudieron guardar"""
+        for token_id, dia, peticiones in pendientes:
+            datos, lock = self._shard(token_id)
+            with lock:
+                e = datos.get(token_id)
+                if e is not None and e[_DIA] == dia:
+                    e[_BASE] -= peticiones
+                    e[_LOCAL] += peticiones
+
+    def olvidar(self, token_id: int) -> None:
+        """Elimina los contadores de un token"""
+        datos, lock = self._shard(token_id)
+        with lock:
+            datos.pop(token_id, None)
+
+    def __len__(self) -> int:
+        return sum(len(datos) for datos, _ in self._shards)
+
+
+limitador = LimitadorTokens(get_settings().RATE_LIMIT_SHARDS)
+
+
+def cabeceras(por_minuto: int, cuota_diaria: int, resultado: Tuple[bool, int, float, int]) -> Dict[str, str]:
+    """Cabeceras X-RateLimit-* para una petición"""
+    permitida, fichas, espera, cuota_restante = resultado
+    headers = {}
+    if por_minuto:
+        headers["X-RateLimit-Limit"] = str(por_minuto)
+        headers["X-RateLimit-Remaining"] = str(max(0, fichas))
+    if cuota_diaria:
+        headers["X-RateLimit-Quota-Limit"] = str(cuota_diaria)
+        headers["X-RateLimit-Quota-Remaining"] = str(max(0, cuota_restante))
+        headers["X-RateLimit-Quota-Reset"] = str(int(86400 - time.time() % 86400))
+    if not permitida:
+        headers["Retry-After"] = str(max(1, int(espera + 0.999)))
+    return headers
@@ -0,0 +1,46 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave en una sola ejecución.
+
+    La primera llamada para una clave ejecuta la función; las que llegan
+    mientras sigue en curso esperan el mismo resultado en lugar de repetir
+    el trabajo. La ejecución corre en su propia tarea para que la
+    cancelación de un llamador no afecte a los demás.
+    """
+
+    def __init__(self):
+        self._en_curso: Dict[Hashable, asyncio.Task] = {}
+        self.llamadas = 0
+        self.ejecuciones = 0
+        self.fusionadas = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecuta fn() una sola vez por clave entre llamadas concurrentes"""
+        self.llamadas += 1
+        tarea = self._en_curso.get(key)
+
+        if tarea is None:
+            self.ejecuciones += 1
+            tarea = asyncio.ensure_future(fn())
+            self._en_curso[key] = tarea
+            tarea.add_done_callback(lambda _t: self._en_curso.pop(key, None))
+        else:
+            self.fusionadas += 1
+
+        return await asyncio.shield(tarea)
+
+    def en_curso(self) -> int:
+        return len(self._en_curso)
+
+    def stats(self) -> dict:
+        """Devuelve cuántas llamadas se ejecutaron y cuántas se fusionaron"""
+        return {
+            "calls": self.llamadas,
+            "executions": self.ejecuciones,
+            "merged": self.fusionadas,
+            "in_flight": len(self._en_curso),
+        }
@@ -1,9 +1,36 @@
+import asyncio
+import logging
 import secrets
-from sqlalchemy.orm import Session
-from typing import Optional, List
+import threading
+from dataclasses import dataclass
+from sqlalchemy import Date, bindparam, case, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, List, Dict
 from datetime import datetime
 
+from ..config import get_settings
+from ..database import AsyncSessionLocal
 from ..models import ApiToken
+from .cache_service import token_cache
+from .rate_limit_service import limitador, fecha_a_dia, dia_a_fecha
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TokenActivo:
+    """Datos mínimos de un token válido, guardados en caché"""
+    id: int
+    token: str
+    nombre: str
+    limite_por_minuto: int
+    cuota_diaria: int
+
+
+# Uso de tokens pendiente de guardar: token_id -> [ultimo_uso, peticiones]
+_uso_pendiente: Dict[int, list] = {}
+_uso_lock = threading.Lock()
+_tarea_guardado: Optional[asyncio.Task] = None
 
 
 def generar_token() -> str:
@@ -11,64 +38,253 @@ def generar_token() -> str:
     return secrets.token_hex(32)
 
 
-def crear_token(db: Session, nombre: str, descripcion: Optional[str] = None) -> ApiToken:
+async def crear_token(
+    db: AsyncSession,
+    nombre: str,
+    descripcion: Optional[str] = None,
+    limite_por_minuto: Optional[int] = None,
+    cuota_diaria: Optional[int] = None
+) -> ApiToken:
     """Crea un nuevo token de API"""
     nuevo_token = ApiToken(
         token=generar_token(),
         nombre=nombre,
         descripcion=descripcion,
-        activo=True
+        activo=True,
+        limite_por_minuto=limite_por_minuto,
+        cuota_diaria=cuota_diaria
     )
     db.add(nuevo_token)
-    db.commit()
-    db.refresh(nuevo_token)
+    await db.commit()
+    await db.refresh(nuevo_token)
+    token_cache.invalidate(nuevo_token.token)
     return nuevo_token
 
 
-def listar_tokens(db: Session) -> List[ApiToken]:
+async def listar_tokens(db: AsyncSession) -> List[ApiToken]:
     """Lista todos los tokens"""
-    return db.query(ApiToken).order_by(ApiToken.fecha_creacion.desc()).all()
+    return list(await db.scalars(select(ApiToken).order_by(ApiToken.fecha_creacion.desc())))
 
 
-def obtener_token(db: Session, token_id: int) -> Optional[ApiToken]:
+async def obtener_token(db: AsyncSession, token_id: int) -> Optional[ApiToken]:
     """Obtiene un token por su ID"""
-    return db.query(ApiToken).filter(ApiToken.id == token_id).first()
+    return await db.get(ApiToken, token_id)
+
+
+async def validar_token(db: AsyncSession, token: str) -> Optional[TokenActivo]:
+    """
+    Valida un token y registra su uso.
+    Los tokens activos se guardan en caché, así que la mayoría de las
+    peticiones no consultan la base de datos; el último uso y el contador
+    de peticiones se guardan en bloque cada pocos segundos.
+    """
+    activo = token_cache.get(token)
+    
+    if activo is None:
+        api_token = await db.scalar(select(ApiToken).where(
+            ApiToken.token == token,
+            ApiToken.activo == True
+        ))
+        
+        if not api_token:
+            return None
+        
+        activo = _a_token_activo(api_token)
+        token_cache.set(token, activo)
+        if api_token.fecha_uso_diario:
+            limitador.cargar(api_token.id, fecha_a_dia(api_token.fecha_uso_diario), api_token.uso_diario)
+    
+    registrar_uso(activo.id)
+    return activo
+
+
+def _a_token_activo(api_token: ApiToken) -> TokenActivo:
+    """Datos en caché del token con sus límites efectivos"""
+    settings = get_settings()
+    return TokenActivo(
+        id=api_token.id,
+        token=api_token.token,
+        nombre=api_token.nombre,
+        limite_por_minuto=(
+            settings.TOKEN_RATE_LIMIT_PER_MINUTE if api_token.limite_por_minuto is None
+            else api_token.limite_por_minuto
+        ),
+        cuota_diaria=(
+            settings.TOKEN_DAILY_QUOTA if api_token.cuota_diaria is None
+            else api_token.cuota_diaria
+        ),
+    )
 
 
-def validar_token(db: Session, token: str) -> Optional[ApiToken]:
-    """Valida un token y actualiza su último uso"""
-    api_token = db.query(ApiToken).filter(
-        ApiToken.token == token,
-        ApiToken.activo == True
-    ).first()
+def registrar_uso(token_id: int) -> None:
+    """Acumula en memoria el uso de un token hasta el próximo guardado"""
+    ahora = datetime.utcnow()
+    with _uso_lock:
+        pendiente = _uso_pendiente.get(token_id)
+        if pendiente:
+            pendiente[0] = ahora
+            pendiente[1] += 1
+        else:
+            _uso_pendiente[token_id] = [ahora, 1]
+
+
+async def guardar_uso_pendiente(db: AsyncSession) -> int:
+    """
+    Guarda el último uso y el número de peticiones acumuladas de cada token
+    en un único UPDATE por lotes, junto con el uso diario de las cuotas.
+    Devuelve cuántos tokens se actualizaron.
+    """
+    global _uso_pendiente
+    with _uso_lock:
+        pendiente, _uso_pendiente = _uso_pendiente, {}
+    cuotas = limitador.tomar_pendientes()
+    
+    if not pendiente and not cuotas:
+        return 0
+    
+    tabla = ApiToken.__table__
+    try:
+        if pendiente:
+            stmt = (
+                update(tabla)
+                .where(tabla.c.id == bindparam("b_id"))
+                .values(
+                    ultimo_uso=bindparam("b_ultimo_uso"),
+                    total_peticiones=tabla.c.total_peticiones + bindparam("b_peticiones")
+                )
+            )
+            await db.execute(stmt, [
+                {"b_id": token_id, "b_ultimo_uso": ultimo_uso, "b_peticiones": peticiones}
+                for token_id, (ultimo_uso, peticiones) in pendiente.items()
+            ])
+        
+        totales = []
+        if cuotas:
+            # Se suma lo de este proceso al total del día en la base de datos
+            # y se lee el resultado, que incluye el uso de otros procesos
+            fecha = bindparam("b_fecha", type_=Date)
+            stmt = (
+                update(tabla)
+                .where(tabla.c.id == bindparam("b_id"))
+                .values(
+                    uso_diario=case(
+                        (tabla.c.fecha_uso_diario == fecha, tabla.c.uso_diario + bindparam("b_peticiones")),
+                        else_=bindparam("b_peticiones")
+                    ),
+                    fecha_uso_diario=fecha
+                )
+            )
+            await db.execute(stmt, [
+                {"b_id": token_id, "b_fecha": dia_a_fecha(dia), "b_peticiones": peticiones}
+                for token_id, dia, peticiones in cuotas
+            ])
+            totales = (await db.execute(
+                select(tabla.c.id, tabla.c.uso_diario, tabla.c.fecha_uso_diario)
+                .where(tabla.c.id.in_([token_id for token_id, _, _ in cuotas]))
+            )).all()
+        
+        await db.commit()
+    except Exception:
+        # Devolver lo acumulado para reintentarlo en el siguiente guardado
+        await db.rollback()
+        limitador.devolver_pendientes(cuotas)
+        with _uso_lock:
+            for token_id, (ultimo_uso, peticiones) in pendiente.items():
+                actual = _uso_pendiente.get(token_id)
+                if actual:
+                    actual[0] = max(actual[0], ultimo_uso)
+                    actual[1] += peticiones
+                else:
+                    _uso_pendiente[token_id] = [ultimo_uso, peticiones]
+        raise
     
-    if api_token:
-        api_token.ultimo_uso = datetime.utcnow()
-        db.commit()
+    for token_id, uso_diario, fecha_uso in totales:
+        limitador.cargar(token_id, fecha_a_dia(fecha_uso), uso_diario)
     
-    return api_token
+    return len(set(pendiente) | {token_id for token_id, _, _ in cuotas})
 
 
-def eliminar_token(db: Session, token_id: int) -> bool:
+async def _guardar_uso_con_sesion() -> None:
+    async with AsyncSessionLocal() as db:
+        await guardar_uso_pendiente(db)
+
+
+async def _guardado_periodico() -> None:
+    """Guarda el uso de los tokens cada TOKEN_USAGE_FLUSH_SECONDS"""
+    intervalo = get_settings().TOKEN_USAGE_FLUSH_SECONDS
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            await _guardar_uso_con_sesion()
+        except Exception:
+            logger.exception("Error guardando el uso de los tokens")
+
+
+def iniciar_guardado_uso() -> None:
+    """Inicia la tarea que guarda periódicamente el uso de los tokens"""
+    global _tarea_guardado
+    if _tarea_guardado is None or _tarea_guardado.done():
+        _tarea_guardado = asyncio.create_task(_guardado_periodico())
+
+
+async def detener_guardado_uso() -> None:
+    """Detiene la tarea periódica y guarda lo que quede pendiente"""
+    global _tarea_guardado
+    if _tarea_guardado is not None:
+        _tarea_guardado.cancel()
+        try:
+            await _tarea_guardado
+        except asyncio.CancelledError:
+            pass
+        _tarea_guardado = None
+    await _guardar_uso_con_sesion()
+
+
+async def eliminar_token(db: AsyncSession, token_id: int) -> bool:
     """Elimina un token por su ID"""
-    token = db.query(ApiToken).filter(ApiToken.id == token_id).first()
+    token = await db.get(ApiToken, token_id)
     
     if token:
-        db.delete(token)
-        db.commit()
+        await db.delete(token)
+        await db.commit()
+        token_cache.invalidate(token.token)
+        with _uso_lock:
+            _uso_pendiente.pop(token_id, None)
+        limitador.olvidar(token_id)
         return True
     
     return False
 
 
-def toggle_token(db: Session, token_id: int) -> Optional[ApiToken]:
+async def toggle_token(db: AsyncSession, token_id: int) -> Optional[ApiToken]:
     """Activa/desactiva un token"""
-    token = db.query(ApiToken).filter(ApiToken.id == token_id).first()
+    token = await db.get(ApiToken, token_id)
     
     if token:
         token.activo = not token.activo
-        db.commit()
-        db.refresh(token)
+        await db.commit()
+        await db.refresh(token)
+        token_cache.invalidate(token.token)
+        return token
+    
+    return None
+
+
+async def actualizar_limites(
+    db: AsyncSession,
+    token_id: int,
+    limite_por_minuto: Optional[int],
+    cuota_diaria: Optional[int]
+) -> Optional[ApiToken]:
+    """Cambia los límites de un token (None = usar los valores por defecto)"""
+    token = await db.get(ApiToken, token_id)
+    
+    if token:
+        token.limite_por_minuto = limite_por_minuto
+        token.cuota_diaria = cuota_diaria
+        await db.commit()
+        await db.refresh(token)
+        token_cache.invalidate(token.token)
         return token
     
     return None
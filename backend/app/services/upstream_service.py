@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import httpx
+
+from .. import metricas
+from ..config import get_settings
+from .http_client import get_client
+
+logger = logging.getLogger(__name__)
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+# Respuestas que indican un problema pasajero de la API externa: se
+# reintentan y cuentan como fallo para el circuito
+_ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+
+class UpstreamNoDisponible(Exception):
+    """El circuito está abierto: no se consulta la API externa"""
+
+
+class CircuitBreaker:
+    """
+    Circuito de protección para la API externa.
+
+    Cerrado: las consultas pasan y se cuentan los fallos seguidos. Al llegar
+    a `fallos_para_abrir` se abre: durante `segundos_abierto` las consultas
+    fallan de inmediato sin esperar a la API. Luego pasa a semiabierto y deja
+    pasar `pruebas` consultas a la vez; si una funciona se cierra y si falla
+    vuelve a abrirse.
+    """
+
+    def __init__(self, fallos_para_abrir: int, segundos_abierto: float, pruebas: int = 1):
+        self.fallos_para_abrir = fallos_para_abrir
+        self.segundos_abierto = segundos_abierto
+        self.pruebas = pruebas
+        self._estado = CERRADO
+        self._fallos_seguidos = 0
+        self._abierto_desde = 0.0
+        self._pruebas_en_curso = 0
+        self._lock = threading.Lock()
+        self.aperturas = 0
+        self.rechazadas = 0
+
+    def permitir(self) -> bool:
+        """Indica si se puede consultar ahora (y reserva la prueba en semiabierto)"""
+        with self._lock:
+            if self._estado == ABIERTO:
+                if time.monotonic() - self._abierto_desde < self.segundos_abierto:
+                    self.rechazadas += 1
+                    return False
+                self._estado = SEMIABIERTO
+                self._pruebas_en_curso = 0
+
+            if self._estado == SEMIABIERTO:
+                if self._pruebas_en_curso >= self.pruebas:
+                    self.rechazadas += 1
+                    return False
+                self._pruebas_en_curso += 1
+            return True
+
+    def exito(self) -> None:
+        with self._lock:
+            if self._estado != CERRADO:
+                logger.info("Circuito de la API externa cerrado")
+            self._estado = CERRADO
+            self._fallos_seguidos = 0
+            self._pruebas_en_curso = 0
+
+    def liberar(self) -> None:
+        """Devuelve la prueba reservada en semiabierto sin juzgar a la API (consulta cancelada)"""
+        with self._lock:
+            if self._estado == SEMIABIERTO and self._pruebas_en_curso > 0:
+                self._pruebas_en_curso -= 1
+
+    def fallo(self) -> None:
+        with self._lock:
+            self._fallos_seguidos += 1
+            if self._estado == SEMIABIERTO or self._fallos_seguidos >= self.fallos_para_abrir:
+                if self._estado != ABIERTO:
+                    self.aperturas += 1
+                    logger.warning(
+                        "Circuito de la API externa abierto tras %d fallos seguidos", self._fallos_seguidos
+                    )
+                self._estado = ABIERTO
+                self._abierto_desde = time.monotonic()
+                self._pruebas_en_curso = 0
+
+    @property
+    def estado(self) -> str:
+        with self._lock:
+            if self._estado == ABIERTO and time.monotonic() - self._abierto_desde >= self.segundos_abierto:
+                return SEMIABIERTO
+            return self._estado
+
+    def stats(self) -> dict:
+        estado = self.estado
+        with self._lock:
+            reintento = None
+            if estado == ABIERTO:
+                reintento = round(self.segundos_abierto - (time.monotonic() - self._abierto_desde), 1)
+            return {
+                "estado": estado,
+                "fallos_seguidos": self._fallos_seguidos,
+                "aperturas": self.aperturas,
+                "rechazadas": self.rechazadas,
+                "segundos_para_probar": reintento,
+            }
+
+
+class LatenciaAdaptativa:
+    """
+    Latencias recientes de la API externa y timeout de lectura derivado de
+    ellas: p99 * factor, acotado entre un mínimo y el timeout configurado.
+    Con pocas muestras se usa el timeout configurado. Los intentos que
+    vencen se registran con el timeout vigente, así una API que se vuelve
+    lenta sube los percentiles en lugar de quedar fuera de la muestra.
+    """
+
+    _MIN_MUESTRAS = 20
+
+    def __init__(self, muestras: int, factor: float, minimo: float, maximo: float):
+        self.factor = factor
+        self.minimo = minimo
+        self.maximo = maximo
+        self._muestras = deque(maxlen=muestras)
+        self._lock = threading.Lock()
+        self._percentiles: Optional[dict] = None
+        self._nuevas = 0
+
+    def registrar(self, segundos: float) -> None:
+        with self._lock:
+            self._muestras.append(segundos)
+            # Los percentiles se recalculan cada 10 muestras nuevas (la
+            # ventana deja de crecer al llenarse, no sirve su longitud)
+            self._nuevas += 1
+            if self._nuevas >= 10:
+                self._nuevas = 0
+                self._percentiles = None
+
+    def percentiles(self) -> Optional[dict]:
+        with self._lock:
+            if len(self._muestras) < self._MIN_MUESTRAS:
+                return None
+            if self._percentiles is None:
+                ordenadas = sorted(self._muestras)
+                ultimo = len(ordenadas) - 1
+                self._percentiles = {
+                    p: ordenadas[min(ultimo, int(round(ultimo * p / 100)))] for p in (50, 95, 99)
+                }
+            return self._percentiles
+
+    def timeout(self) -> float:
+        percentiles = self.percentiles()
+        if percentiles is None:
+            return self.maximo
+        return max(self.minimo, min(self.maximo, percentiles[99] * self.factor))
+
+    def stats(self) -> dict:
+        percentiles = self.percentiles()
+        return {
+            "muestras": len(self._muestras),
+            "p50_ms": round(percentiles[50] * 1000, 1) if percentiles else None,
+            "p95_ms": round(percentiles[95] * 1000, 1) if percentiles else None,
+            "p99_ms": round(percentiles[99] * 1000, 1) if percentiles else None,
+            "timeout_lectura_s": round(self.timeout(), 3),
+        }
+
+
+_settings = get_settings()
+
+circuito = CircuitBreaker(
+    fallos_para_abrir=_settings.UPSTREAM_BREAKER_FAILURES,
+    segundos_abierto=_settings.UPSTREAM_BREAKER_OPEN_SECONDS,
+    pruebas=_settings.UPSTREAM_BREAKER_HALF_OPEN_PROBES,
+)
+latencias = LatenciaAdaptativa(
+    muestras=_settings.UPSTREAM_LATENCY_SAMPLES,
+    factor=_settings.UPSTREAM_TIMEOUT_FACTOR,
+    minimo=_settings.UPSTREAM_TIMEOUT_MIN,
+    maximo=_settings.UPSTREAM_READ_TIMEOUT,
+)
+
+# Contadores de llamadas a la API externa
+contadores = {"llamadas": 0, "reintentos": 0, "timeouts": 0, "errores": 0}
+# Llamadas esperando respuesta en este momento
+en_curso = 0
+
+
+def _espera_reintento(intento: int) -> float:
+    """Backoff exponencial con jitter completo"""
+    settings = get_settings()
+    tope = min(settings.UPSTREAM_RETRY_BACKOFF_MAX, settings.UPSTREAM_RETRY_BACKOFF * (2 ** intento))
+    return random.uniform(0, tope)
+
+
+async def obtener(url: str) -> httpx.Response:
+    """
+    GET a la API externa protegido por el circuito.
+
+    Reintenta (la consulta es idempotente) los errores de conexión, los
+    timeouts y las respuestas 429/5xx con backoff y jitter; el timeout de
+    lectura se ajusta a la latencia observada. Lanza UpstreamNoDisponible si
+    el circuito está abierto, o la última excepción de httpx si se agotan
+    los reintentos.
+    """
+    global en_curso
+    settings = get_settings()
+    client = get_client()
+    intentos = settings.UPSTREAM_RETRIES + 1
+
+    for intento in range(intentos):
+        if not circuito.permitir():
+            metricas.llamadas_upstream.inc("circuito_abierto")
+            raise UpstreamNoDisponible()
+
+        lectura = latencias.timeout()
+        timeout = httpx.Timeout(
+            connect=settings.UPSTREAM_CONNECT_TIMEOUT,
+            read=lectura,
+            write=lectura,
+            pool=settings.UPSTREAM_POOL_TIMEOUT,
+        )
+        contadores["llamadas"] += 1
+        en_curso += 1
+        inicio = time.perf_counter()
+        try:
+            response = await client.get(url, timeout=timeout)
+        except httpx.TransportError as e:
+            circuito.fallo()
+            es_timeout = isinstance(e, httpx.TimeoutException)
+            if es_timeout:
+                latencias.registrar(lectura)
+            contadores["timeouts" if es_timeout else "errores"] += 1
+            metricas.llamadas_upstream.inc("timeout" if es_timeout else "error_conexion")
+            if intento + 1 >= intentos:
+                raise
+        except Exception:
+            # Respuesta que no se pudo leer (gzip inválido, demasiadas
+            # redirecciones...): falla la consulta, sin reintento
+            circuito.fallo()
+            contadores["errores"] += 1
+            metricas.llamadas_upstream.inc("error")
+            raise
+        except BaseException:
+            # Cancelada: no dice nada de la API, pero la prueba en
+            # semiabierto debe quedar libre para la siguiente consulta
+            circuito.liberar()
+            raise
+        else:
+            metricas.llamadas_upstream.inc(str(response.status_code))
+            latencias.registrar(time.perf_counter() - inicio)
+            if response.status_code not in _ESTADOS_REINTENTABLES:
+                circuito.exito()
+                return response
+            circuito.fallo()
+            contadores["errores"] += 1
+            if intento + 1 >= intentos:
+                return response
+        finally:
+            en_curso -= 1
+            metricas.duracion_upstream.observar(time.perf_counter() - inicio)
+
+        contadores["reintentos"] += 1
+        await asyncio.sleep(_espera_reintento(intento))
+
+    raise RuntimeError("No se realizó ninguna consulta")  # pragma: no cover
+
+
+def estado() -> dict:
+    """Estado del circuito, latencias y contadores de la API externa"""
+    return {
+        "circuito": circuito.stats(),
+        "latencia": latencias.stats(),
+        **contadores,
+    }
+
+
+metricas.registrar(metricas.Recolector(
+    "dni_upstream_circuit_state", "Estado del circuito hacia apisperu.com (1 en el estado actual)", ("state",),
+    lambda: {(e,): int(circuito.estado == e) for e in (CERRADO, SEMIABIERTO, ABIERTO)}
+))
+metricas.registrar(metricas.Recolector(
+    "dni_upstream_circuit_opens_total", "Veces que se abrió el circuito", (),
+    lambda: {(): circuito.aperturas}, tipo="counter"
+))
+metricas.registrar(metricas.Recolector(
+    "dni_upstream_retries_total", "Reintentos de llamadas a apisperu.com", (),
+    lambda: {(): contadores["reintentos"]}, tipo="counter"
+))
+metricas.registrar(metricas.Recolector(
+    "dni_upstream_in_flight", "Llamadas a apisperu.com en curso", (), lambda: {(): en_curso}
+))
+metricas.registrar(metricas.Recolector(
+    "dni_upstream_read_timeout_seconds", "Timeout de lectura adaptativo vigente", (), lambda: {(): latencias.timeout()}
+))
@@ -0,0 +1,64 @@
+"""
+Tiempos por fase de cada petición (cabecera Server-Timing).
+
+El middleware abre un diccionario de fases por petición en una variable de
+contexto; el código mide sus fases con `with fase("nombre"):` o sumando con
+`sumar()`. Fuera de una petición (tareas en segundo plano, scripts) no se
+mide nada. Las fases pueden solaparse: el tiempo de SQLite durante la
+validación del token cuenta en "auth" y en "db".
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Dict, Iterator, Optional
+
+_fases: ContextVar[Optional[Dict[str, float]]] = ContextVar("fases_peticion", default=None)
+
+
+def iniciar() -> Token:
+    """Empieza a medir las fases de la petición actual"""
+    return _fases.set({})
+
+
+def terminar(token: Token) -> None:
+    _fases.reset(token)
+
+
+def actuales() -> Optional[Dict[str, float]]:
+    """Fases medidas hasta ahora en la petición actual (segundos)"""
+    return _fases.get()
+
+
+def desactivar() -> None:
+    """
+    Deja de medir en el contexto actual. Lo usan las tareas lanzadas desde
+    una petición que siguen después de la respuesta.
+    """
+    _fases.set(None)
+
+
+def sumar(nombre: str, segundos: float) -> None:
+    fases = _fases.get()
+    if fases is not None:
+        fases[nombre] = fases.get(nombre, 0.0) + segundos
+
+
+@contextmanager
+def fase(nombre: str) -> Iterator[None]:
+    """Mide el bloque y lo suma a la fase indicada"""
+    fases = _fases.get()
+    if fases is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        fases[nombre] = fases.get(nombre, 0.0) + time.perf_counter() - inicio
+
+
+def server_timing(fases: Dict[str, float], total: float) -> str:
+    """Valor de la cabecera Server-Timing (duraciones en milisegundos)"""
+    partes = [f"{nombre};dur={segundos * 1000:.2f}" for nombre, segundos in fases.items()]
+    partes.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(partes)
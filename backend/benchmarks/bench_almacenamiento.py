@@ -0,0 +1,397 @@
+"""
+Benchmark de almacenamiento de la tabla personas a distintas escalas.
+
+Para cada escala (por defecto 1, 10 y 30 millones de filas) hace crecer una
+base SQLite sintética con generar_personas.py y mide, con los PRAGMAs de
+la aplicación:
+
+- las consultas de la aplicación: búsqueda por nrodoc (existente e
+  inexistente), búsquedas de listar_personas (apellido frecuente, nombre y
+  apellido, apellido poco frecuente, prefijo, DNI parcial, conteo acotado),
+  paginación por número de página en la primera página, la del medio y la
+  última, paginación por cursor a la misma profundidad y la exportación
+  incremental completa (las sentencias de cursor y de exportación son las
+  que arman busqueda_service y export_service);
+- la velocidad de inserción por lotes y de a una fila por transacción, con
+  los índices y triggers de la aplicación activos;
+- el tamaño del archivo, de la tabla, de cada índice y del índice de texto
+  completo (dbstat).
+
+Para cada consulta guarda p50/p95/p99, las instrucciones de la máquina
+virtual de SQLite de una ejecución (crecen con las filas que recorre) y el
+plan de EXPLAIN QUERY PLAN. En "alertas" quedan las consultas cuyo plan
+recorre la tabla (SCAN sin índice) o que ordenan en un B-tree temporal; las
+que además recorren una fracción grande de la tabla se marcan con gravedad
+"alta".
+
+La base queda en --db para repetir la medición sin volver a generarla (la
+escala solo puede crecer); --borrar la elimina al terminar. 30 millones de
+filas ocupan varios GB y tardan unos minutos en generarse.
+
+Uso (desde el directorio backend):
+    python benchmarks/bench_almacenamiento.py [--escalas 1000000,10000000,30000000]
+        [--db ./data/bench_almacenamiento.db] [--repeticiones 200]
+        [--tiempo-max 10] [--inserciones 10000] [--salida informe.json] [--borrar]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, ".."))
+sys.path.insert(0, BENCHMARKS)
+
+from sqlalchemy import bindparam, select  # noqa: E402
+from sqlalchemy.dialects import sqlite  # noqa: E402
+
+import generar_personas  # noqa: E402
+from app.config import get_settings  # noqa: E402
+from app.database import _pragmas_sqlite  # noqa: E402
+from app.models import Persona  # noqa: E402
+from app.services.busqueda_service import SQL_BUSCAR, consulta_cursor, consulta_fts, sql_cursor_fts  # noqa: E402
+from app.services.estadisticas_service import SQL_CONTAR_BUSQUEDA_ACOTADO  # noqa: E402
+from app.services.export_service import consulta_exportacion  # noqa: E402
+
+POR_PAGINA = 20
+# Recorrer una fila cuesta unas 2 instrucciones de la máquina virtual: una
+# consulta que ejecuta más de 0,5 por fila de la tabla recorre una parte
+# grande de ella en lugar de cortar en el LIMIT
+_UMBRAL_RECORRIDO = 0.5
+_DIALECTO = sqlite.dialect(paramstyle="named")
+
+
+def _sql(stmt) -> str:
+    return str(stmt.compile(dialect=_DIALECTO))
+
+
+def _sql_con_parametros(stmt) -> tuple:
+    """SQL de una consulta de los servicios y los valores que ya trae"""
+    compilada = stmt.compile(dialect=_DIALECTO)
+    return str(compilada), dict(compilada.params)
+
+
+_SQL_NRODOC = _sql(select(Persona).where(Persona.nrodoc == bindparam("nrodoc")))
+_SQL_LISTADO = _sql(
+    select(Persona).order_by(Persona.id.desc()).offset(bindparam("offset")).limit(bindparam("limit"))
+)
+# Página siguiente de una búsqueda, como en busqueda_service.listar_por_cursor
+_SQL_CURSOR_BUSQUEDA = sql_cursor_fts(con_referencia=True, hacia_atras=False)
+
+
+def _percentil(ordenadas: List[float], p: float) -> float:
+    return ordenadas[min(len(ordenadas) - 1, int(round((len(ordenadas) - 1) * p / 100)))]
+
+
+def _version() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS, capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {"commit": commit or None, "sqlite": sqlite3.sqlite_version}
+
+
+def _conectar(ruta: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(ruta, isolation_level=None)
+    for pragma in _pragmas_sqlite():
+        conn.execute(pragma)
+    return conn
+
+
+def _consultas(filas: int) -> Dict[str, tuple]:
+    """nombre -> (descripción, sql, función que devuelve los parámetros)"""
+    medio = filas // 2
+    marca = generar_personas.FECHA_INICIAL + timedelta(
+        seconds=int(filas * 0.99 * 86400 / generar_personas.REGISTROS_POR_DIA)
+    )
+    # Las mismas sentencias que ejecutan la paginación por cursor y la
+    # exportación (que lee todo el resultado por bloques de yield_per)
+    sql_cursor, parametros_cursor = _sql_con_parametros(consulta_cursor(medio, False, POR_PAGINA + 1))
+    sql_exportar, parametros_exportar = _sql_con_parametros(consulta_exportacion(actualizado_desde=marca))
+    comunes = generar_personas.APELLIDOS[:5]
+    raros = generar_personas.APELLIDOS[-20:]
+    nombres = generar_personas.NOMBRES_MASCULINOS[:10] + generar_personas.NOMBRES_FEMENINOS[:10]
+    limite_conteo = get_settings().COUNT_APPROX_LIMIT
+
+    def buscar(q: str, offset: int = 0) -> dict:
+        return {"q": consulta_fts(q), "limit": POR_PAGINA, "offset": offset}
+
+    return {
+        "nrodoc_existente": (
+            "Búsqueda de un DNI guardado (dni_service)", _SQL_NRODOC,
+            lambda: {"nrodoc": generar_personas.dni(random.randrange(filas))},
+        ),
+        "nrodoc_inexistente": (
+            "Búsqueda de un DNI que no está en la tabla", _SQL_NRODOC,
+            lambda: {"nrodoc": generar_personas.dni(random.randrange(filas, generar_personas.MAXIMO_FILAS))},
+        ),
+        "busqueda_apellido_frecuente": (
+            "listar_personas?q=<apellido frecuente>, primera página", SQL_BUSCAR,
+            lambda: buscar(random.choice(comunes)),
+        ),
+        "busqueda_apellido_frecuente_pagina_50": (
+            "listar_personas?q=<apellido frecuente>&page=50", SQL_BUSCAR,
+            lambda: buscar(random.choice(comunes), 49 * POR_PAGINA),
+        ),
+        "busqueda_nombre_apellido": (
+            "listar_personas?q=<nombre> <apellido>", SQL_BUSCAR,
+            lambda: buscar(f"{random.choice(nombres)} {random.choice(comunes)}"),
+        ),
+        "busqueda_apellido_raro": (
+            "listar_personas?q=<apellido poco frecuente>", SQL_BUSCAR,
+            lambda: buscar(random.choice(raros)),
+        ),
+        "busqueda_prefijo": (
+            "listar_personas?q=<3 letras> (búsqueda mientras se escribe)", SQL_BUSCAR,
+            lambda: buscar(random.choice(generar_personas.APELLIDOS)[:3]),
+        ),
+        "busqueda_dni_parcial": (
+            "listar_personas?q=<4 primeros dígitos de un DNI>", SQL_BUSCAR,
+            lambda: buscar(generar_personas.dni(random.randrange(filas))[:4]),
+        ),
+        "conteo_busqueda_acotado": (
+            "Total aproximado de una búsqueda (COUNT_APPROX_LIMIT)", SQL_CONTAR_BUSQUEDA_ACOTADO,
+            lambda: {"q": consulta_fts(random.choice(comunes)), "limite": limite_conteo},
+        ),
+        "listado_primera_pagina": (
+            "listar_personas?page=1", _SQL_LISTADO,
+            lambda: {"offset": 0, "limit": POR_PAGINA},
+        ),
+        "listado_pagina_media": (
+            "listar_personas?page=<mitad de la tabla>", _SQL_LISTADO,
+            lambda: {"offset": medio, "limit": POR_PAGINA},
+        ),
+        "listado_ultima_pagina": (
+            "listar_personas?page=<última>", _SQL_LISTADO,
+            lambda: {"offset": max(0, filas - POR_PAGINA), "limit": POR_PAGINA},
+        ),
+        "cursor_pagina_media": (
+            "listar_personas?cursor=<mitad de la tabla>", sql_cursor,
+            lambda: parametros_cursor,
+        ),
+        "cursor_busqueda_pagina_media": (
+            "listar_personas?q=<apellido frecuente>&cursor=<mitad de la tabla>", _SQL_CURSOR_BUSQUEDA,
+            lambda: {"q": consulta_fts(random.choice(comunes)), "ref": medio, "limit": POR_PAGINA + 1},
+        ),
+        "exportacion_incremental": (
+            "exportar?actualizado_desde=<último 1 %>, todas las filas", sql_exportar,
+            lambda: parametros_exportar,
+        ),
+    }
+
+
+def _plan(conn: sqlite3.Connection, sql: str, parametros: dict) -> List[str]:
+    return [fila[3] for fila in conn.execute(f"EXPLAIN QUERY PLAN {sql}", parametros)]
+
+
+def _recorre_tabla(detalle: str) -> bool:
+    """
+    SCAN de una tabla sin índice (las tablas virtuales de FTS usan su propio
+    índice y "SCAN (subquery-N)" recorre el resultado de una subconsulta)
+    """
+    return (
+        detalle.startswith("SCAN ")
+        and not detalle.startswith("SCAN (")
+        and " USING " not in detalle
+        and "VIRTUAL TABLE" not in detalle
+    )
+
+
+def _instrucciones(conn: sqlite3.Connection, sql: str, parametros: dict) -> int:
+    """Instrucciones de la máquina virtual de SQLite de una ejecución (de a 100)"""
+    contador = [0]
+
+    def contar() -> int:
+        contador[0] += 1
+        return 0
+
+    conn.set_progress_handler(contar, 100)
+    try:
+        conn.execute(sql, parametros).fetchall()
+    finally:
+        conn.set_progress_handler(None, 0)
+    return contador[0] * 100
+
+
+def medir_consulta(conn: sqlite3.Connection, sql: str, parametros: Callable[[], dict],
+                   repeticiones: int, tiempo_max: float) -> dict:
+    primeros = parametros()
+    conn.execute(sql, primeros).fetchall()  # calentamiento
+
+    tiempos, devueltas = [], 0
+    limite = time.perf_counter() + tiempo_max
+    while len(tiempos) < repeticiones and (len(tiempos) < 3 or time.perf_counter() < limite):
+        valores = parametros()
+        inicio = time.perf_counter()
+        devueltas = len(conn.execute(sql, valores).fetchall())
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+
+    plan = _plan(conn, sql, primeros)
+    return {
+        "ejecuciones": len(tiempos),
+        "p50_ms": round(_percentil(tiempos, 50) * 1000, 3),
+        "p95_ms": round(_percentil(tiempos, 95) * 1000, 3),
+        "p99_ms": round(_percentil(tiempos, 99) * 1000, 3),
+        "filas_devueltas": devueltas,
+        "instrucciones_vm": _instrucciones(conn, sql, primeros),
+        "plan": plan,
+        "recorre_tabla": any(_recorre_tabla(d) for d in plan),
+        "ordenamiento_temporal": any("USE TEMP B-TREE" in d for d in plan),
+    }
+
+
+def medir_inserciones(conn: sqlite3.Connection, cantidad: int, lote: int) -> dict:
+    """
+    Inserta filas nuevas con los índices y triggers de la aplicación: por
+    lotes (como una importación) y de a una por transacción (como al guardar
+    una consulta a apisperu.com).
+    """
+    rnd = random.Random(cantidad)
+    resultado = {}
+    for modo, tamano, total in (("lote", lote, cantidad), ("individual", 1, max(1, cantidad // 20))):
+        inicio_id = conn.execute("SELECT coalesce(max(id), 0) FROM personas").fetchone()[0]
+        filas = generar_personas.generar_filas(inicio_id, total, rnd)
+        inicio = time.perf_counter()
+        for desde in range(0, total, tamano):
+            conn.execute("BEGIN")
+            conn.executemany(generar_personas.SQL_INSERTAR, filas[desde:desde + tamano])
+            conn.execute("COMMIT")
+        duracion = time.perf_counter() - inicio
+        resultado[modo] = {
+            "filas": total,
+            "filas_por_transaccion": tamano,
+            "filas_por_segundo": round(total / duracion),
+            "ms_por_transaccion": round(duracion / -(-total // tamano) * 1000, 3),
+        }
+    return resultado
+
+
+def medir_tamanos(ruta: str, conn: sqlite3.Connection) -> dict:
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    por_objeto = dict(conn.execute("SELECT name, pgsize FROM dbstat WHERE aggregate = TRUE"))
+    indices = {
+        nombre: por_objeto.get(nombre, 0)
+        for (nombre,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'personas' ORDER BY name"
+        )
+    }
+    return {
+        "archivo_bytes": os.path.getsize(ruta),
+        "tabla_bytes": por_objeto.get("personas", 0),
+        "indices_bytes": indices,
+        "indices_total_bytes": sum(indices.values()),
+        "fts_bytes": sum(v for k, v in por_objeto.items() if k.startswith("personas_fts")),
+    }
+
+
+def medir_escala(ruta: str, escala: int, args) -> dict:
+    carga = generar_personas.cargar(ruta, escala, semilla=args.semilla)
+    conn = _conectar(ruta)
+    try:
+        filas = conn.execute("SELECT count(*) FROM personas").fetchone()[0]
+        consultas = {}
+        for nombre, (descripcion, sql, parametros) in _consultas(filas).items():
+            consultas[nombre] = {"descripcion": descripcion, **medir_consulta(
+                conn, sql, parametros, args.repeticiones, args.tiempo_max
+            )}
+            # Una consulta que recorre la tabla crece con ella: trabajo por fila
+            consultas[nombre]["instrucciones_por_fila"] = round(consultas[nombre]["instrucciones_vm"] / filas, 3)
+        tamanos = medir_tamanos(ruta, conn)
+        inserciones = medir_inserciones(conn, args.inserciones, args.lote_insercion) if args.inserciones else {}
+    finally:
+        conn.close()
+    return {
+        "escala": escala,
+        "filas": filas,
+        "carga": carga,
+        "tamanos": tamanos,
+        "bytes_por_fila": round(tamanos["archivo_bytes"] / filas, 1),
+        "consultas": consultas,
+        "inserciones": inserciones,
+    }
+
+
+def alertas(escalas: List[dict]) -> List[dict]:
+    """Consultas que recorren la tabla u ordenan en un B-tree temporal"""
+    encontradas = []
+    for escala in escalas:
+        for nombre, consulta in escala["consultas"].items():
+            motivos = []
+            if consulta["recorre_tabla"]:
+                motivos.append("recorre la tabla (SCAN sin índice)")
+            if consulta["ordenamiento_temporal"]:
+                motivos.append("ordena los resultados en un B-tree temporal")
+            if not motivos:
+                continue
+            encontradas.append({
+                "filas": escala["filas"],
+                "consulta": nombre,
+                "gravedad": "alta" if consulta["instrucciones_por_fila"] >= _UMBRAL_RECORRIDO else "baja",
+                "motivos": motivos,
+                "p50_ms": consulta["p50_ms"],
+                "plan": consulta["plan"],
+            })
+    return encontradas
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escalas", default="1000000,10000000,30000000")
+    parser.add_argument("--db", default="./data/bench_almacenamiento.db")
+    parser.add_argument("--repeticiones", type=int, default=200, help="Ejecuciones por consulta")
+    parser.add_argument("--tiempo-max", type=float, default=10.0,
+                        help="Segundos máximos por consulta (al menos 3 ejecuciones)")
+    parser.add_argument("--inserciones", type=int, default=10000, help="Filas insertadas por lotes en cada escala")
+    parser.add_argument("--lote-insercion", type=int, default=500)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--salida", help="Además de imprimirlo, guarda el JSON en este archivo")
+    parser.add_argument("--borrar", action="store_true", help="Eliminar la base al terminar")
+    args = parser.parse_args()
+    random.seed(args.semilla)
+
+    escalas = sorted(int(e) for e in args.escalas.split(","))
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+
+    resultados = []
+    try:
+        for escala in escalas:
+            if os.path.exists(args.db) and generar_personas.total_filas(args.db) > escala:
+                print(f"Escala {escala} omitida: la base ya tiene más filas", file=sys.stderr)
+                continue
+            print(f"Midiendo {escala} filas...", file=sys.stderr)
+            resultados.append(medir_escala(args.db, escala, args))
+    finally:
+        if args.borrar:
+            for sufijo in ("", "-wal", "-shm"):
+                if os.path.exists(args.db + sufijo):
+                    os.remove(args.db + sufijo)
+
+    informe = {
+        "fecha": datetime.now(timezone.utc).isoformat(),
+        "version": _version(),
+        "configuracion": {k: v for k, v in vars(args).items() if k not in ("salida", "borrar")},
+        "resumen_p50_ms": {
+            nombre: {str(r["filas"]): r["consultas"][nombre]["p50_ms"] for r in resultados}
+            for nombre in (resultados[0]["consultas"] if resultados else {})
+        },
+        "alertas": alertas(resultados),
+        "escalas": resultados,
+    }
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    print(texto)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(texto + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Benchmark de carga de la API contra una base SQLite temporal y una API
+falsa de apisperu.com en el mismo proceso.
+
+Carga --semilla personas (las mismas que devolvería la API falsa), crea un
+token de API sin límites y lanza --peticiones por escenario con
+--concurrencia clientes simultáneos:
+
+    persona   GET /api/persona/{dni} con token de API
+    buscar    GET /api/buscar/{dni} con credenciales de administrador
+    personas  GET /api/personas con búsquedas y páginas variadas
+
+En persona y buscar una fracción --aciertos de los DNIs está en la base
+local, --no-encontrados no existe en la API externa y el resto se trae de
+la API externa. En personas, --aciertos de las búsquedas encuentran
+resultados.
+
+Imprime un JSON con p50/p95/p99, throughput, códigos HTTP, llamadas a la
+API falsa y el resultado de las búsquedas (memoria, base_datos, api_externa,
+...) por escenario, para comparar entre versiones. La configuración del
+backend se puede cambiar con variables de entorno (por ejemplo
+PERSONA_CACHE_MAX_SIZE=0 para medir sin caché en memoria). El límite por
+IP de slowapi se desactiva durante la prueba.
+
+Uso (desde el directorio backend):
+    python benchmarks/bench_carga.py [--peticiones 2000] [--concurrencia 32]
+        [--escenarios persona,buscar,personas] [--semilla 20000]
+        [--aciertos 0.8] [--no-encontrados 0.05] [--latencia-ms 80]
+        [--jitter-ms 40] [--tasa-error 0.0] [--salida resultado.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_apisperu import FakeApisPeru, datos_persona  # noqa: E402
+
+ADMIN = ("bench", "bench")
+_APELLIDOS_BUSQUEDA = ["QUISPE", "FLORES", "SANCHEZ", "GARCIA", "MAMANI", "HUAMAN", "CHAVEZ", "RODRIGUEZ"]
+
+
+def _percentil(ordenadas: list, p: float) -> float:
+    if not ordenadas:
+        return 0.0
+    return ordenadas[min(len(ordenadas) - 1, int(round((len(ordenadas) - 1) * p / 100)))]
+
+
+def _version() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {"commit": commit or None, "python": platform.python_version()}
+
+
+class GeneradorDnis:
+    """DNIs para las consultas según la mezcla de aciertos y no encontrados"""
+
+    def __init__(self, semilla: int, aciertos: float, no_encontrados: float):
+        self.semilla = semilla
+        self.aciertos = aciertos
+        self.no_encontrados = no_encontrados
+        # Los nuevos no se repiten: cada uno es una consulta real a la API
+        self._nuevo = 40000000
+        self._no_encontrado = 91000000
+
+    def siguiente(self) -> str:
+        r = random.random()
+        if r < self.aciertos:
+            return str(10000000 + random.randrange(self.semilla))
+        if r < self.aciertos + self.no_encontrados:
+            self._no_encontrado += 1
+            return str(self._no_encontrado)
+        self._nuevo += 1
+        return str(self._nuevo)
+
+
+def _consulta_listado(aciertos: float) -> str:
+    if random.random() < aciertos:
+        q = random.choice(_APELLIDOS_BUSQUEDA)
+    else:
+        q = "".join(random.choices("bcdfghjkvwxz", k=6))
+    modo = random.random()
+    if modo < 0.5:
+        return f"/api/personas?q={q}&page={random.randint(1, 3)}&per_page=20"
+    if modo < 0.75:
+        return f"/api/personas?page={random.randint(1, 50)}&per_page=20"
+    return "/api/personas?cursor=&per_page=50"
+
+
+async def _sembrar(semilla: int) -> None:
+    from sqlalchemy import insert
+
+    from app.database import AsyncSessionLocal
+    from app.models import Persona
+
+    lote = 5000
+    async with AsyncSessionLocal() as db:
+        for inicio in range(0, semilla, lote):
+            filas = []
+            for i in range(inicio, min(semilla, inicio + lote)):
+                datos = datos_persona(str(10000000 + i))
+                filas.append({
+                    "tipodoc": "DNI",
+                    "nrodoc": datos["dni"],
+                    "nombres": datos["nombres"],
+                    "apellido_paterno": datos["apellidoPaterno"],
+                    "apellido_materno": datos["apellidoMaterno"],
+                    "codigo_verificacion": datos["codVerifica"],
+                    "origen": "apisperu",
+                })
+            await db.execute(insert(Persona), filas)
+            await db.commit()
+
+
+async def _escenario(cliente, nombre: str, rutas, cabeceras: dict, auth, args, fake) -> dict:
+    from app import metricas
+
+    busquedas_antes = dict(metricas.busquedas.valores)
+    llamadas_antes = fake.llamadas["total"]
+    latencias = []
+    codigos: dict = {}
+    restantes = args.peticiones
+
+    async def trabajador():
+        nonlocal restantes
+        while restantes > 0:
+            restantes -= 1
+            ruta = rutas()
+            inicio = time.perf_counter()
+            try:
+                respuesta = await cliente.get(ruta, headers=cabeceras, auth=auth)
+                codigo = str(respuesta.status_code)
+            except Exception as e:
+                codigo = type(e).__name__
+            latencias.append(time.perf_counter() - inicio)
+            codigos[codigo] = codigos.get(codigo, 0) + 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(args.concurrencia)))
+    duracion = time.perf_counter() - inicio
+
+    latencias.sort()
+    busquedas = {
+        clave[0]: valor - busquedas_antes.get(clave, 0)
+        for clave, valor in metricas.busquedas.valores.items()
+        if valor - busquedas_antes.get(clave, 0)
+    }
+    return {
+        "peticiones": len(latencias),
+        "duracion_s": round(duracion, 3),
+        "throughput_rps": round(len(latencias) / duracion, 1) if duracion else 0.0,
+        "p50_ms": round(_percentil(latencias, 50) * 1000, 2),
+        "p95_ms": round(_percentil(latencias, 95) * 1000, 2),
+        "p99_ms": round(_percentil(latencias, 99) * 1000, 2),
+        "max_ms": round(latencias[-1] * 1000, 2) if latencias else 0.0,
+        "codigos": dict(sorted(codigos.items())),
+        "llamadas_upstream": fake.llamadas["total"] - llamadas_antes,
+        "busquedas": busquedas,
+    }
+
+
+async def ejecutar(args) -> dict:
+    import httpx
+
+    from app.database import AsyncSessionLocal
+    from app.main import app, limiter
+    from app.services import http_client, token_service
+
+    fake = FakeApisPeru(latencia_ms=args.latencia_ms, jitter_ms=args.jitter_ms, tasa_error=args.tasa_error)
+    limiter.enabled = False
+
+    await app.router.startup()
+    try:
+        await http_client.iniciar_cliente(fake.transporte())
+        await _sembrar(args.semilla)
+        async with AsyncSessionLocal() as db:
+            token = (await token_service.crear_token(db, "bench", limite_por_minuto=0, cuota_diaria=0)).token
+
+        dnis = GeneradorDnis(args.semilla, args.aciertos, args.no_encontrados)
+        escenarios = {
+            "persona": (lambda: f"/api/persona/{dnis.siguiente()}", {"Authorization": f"Bearer {token}"}, None),
+            "buscar": (lambda: f"/api/buscar/{dnis.siguiente()}", {}, ADMIN),
+            "personas": (lambda: _consulta_listado(args.aciertos), {}, ADMIN),
+        }
+
+        resultados = {}
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=60) as cliente:
+            for nombre in args.escenarios.split(","):
+                nombre = nombre.strip()
+                if nombre not in escenarios:
+                    raise SystemExit(f"Escenario desconocido: {nombre}")
+                rutas, cabeceras, auth = escenarios[nombre]
+                resultados[nombre] = await _escenario(cliente, nombre, rutas, cabeceras, auth, args, fake)
+        return resultados
+    finally:
+        await app.router.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peticiones", type=int, default=2000, help="Peticiones por escenario")
+    parser.add_argument("--concurrencia", type=int, default=32)
+    parser.add_argument("--escenarios", default="persona,buscar,personas")
+    parser.add_argument("--semilla", type=int, default=20000, help="Personas cargadas antes de empezar")
+    parser.add_argument("--aciertos", type=float, default=0.8)
+    parser.add_argument("--no-encontrados", type=float, default=0.05)
+    parser.add_argument("--latencia-ms", type=float, default=80.0)
+    parser.add_argument("--jitter-ms", type=float, default=40.0)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--salida", help="Además de imprimirlo, guarda el JSON en este archivo")
+    parser.add_argument("--seed", type=int, default=1, help="Semilla de random para repetir la misma mezcla")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    directorio = tempfile.mkdtemp(prefix="bench_carga_")
+    salida = os.path.abspath(args.salida) if args.salida else None
+    os.chdir(directorio)
+    # Antes de importar app: la configuración se lee una sola vez
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directorio, 'bench.db')}"
+    os.environ["BACKUP_DIR"] = os.path.join(directorio, "backups")
+    os.environ["BACKUP_INTERVAL_HOURS"] = "0"
+    os.environ["APISPERU_TOKEN"] = "bench"
+    os.environ["APISPERU_BASE_URL"] = "http://apisperu.bench/api/v1"
+    os.environ["ADMIN_USER"], os.environ["ADMIN_PASSWORD"] = ADMIN
+    os.environ.setdefault("TOKEN_RATE_LIMIT_PER_MINUTE", "0")
+    os.environ.setdefault("SLOW_REQUEST_MS", "0")
+
+    try:
+        resultados = asyncio.run(ejecutar(args))
+    finally:
+        os.chdir(BACKEND)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    informe = {
+        "fecha": datetime.now(timezone.utc).isoformat(),
+        "version": _version(),
+        "configuracion": {k: v for k, v in vars(args).items() if k != "salida"},
+        "escenarios": resultados,
+    }
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    print(texto)
+    if salida:
+        with open(salida, "w", encoding="utf-8") as archivo:
+            archivo.write(texto + "\n")
+
+
+if __name__ == "__main__":
+    main()
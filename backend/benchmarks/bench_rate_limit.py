@@ -0,0 +1,52 @@
+"""
+Micro-benchmark del limitador por token.
+
+Mide el costo por petición de consumir() (cubeta por minuto + cuota diaria)
+y de armar las cabeceras X-RateLimit-*, con uno o muchos tokens.
+
+Uso (desde el directorio backend):
+    python benchmarks/bench_rate_limit.py [--repeticiones 200000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.rate_limit_service import LimitadorTokens, cabeceras  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=200000)
+    parser.add_argument("--tokens", type=int, default=10000, help="Tokens distintos en el caso 'muchos_tokens'")
+    args = parser.parse_args()
+
+    # Límites altos para que todas las peticiones se acepten (camino normal)
+    por_minuto, cuota = 10 ** 9, 10 ** 12
+    limitador = LimitadorTokens(16)
+    resultado = limitador.consumir(1, por_minuto, cuota)
+
+    ids = iter(range(10 ** 9))
+    n_tokens = args.tokens
+
+    casos = {
+        "consumir_un_token": lambda: limitador.consumir(1, por_minuto, cuota),
+        "consumir_muchos_tokens": lambda: limitador.consumir(next(ids) % n_tokens, por_minuto, cuota),
+        "consumir_sin_limites": lambda: limitador.consumir(2, 0, 0),
+        "cabeceras": lambda: cabeceras(por_minuto, cuota, resultado),
+    }
+
+    resultados = {}
+    for nombre, fn in casos.items():
+        segundos = min(timeit.repeat(fn, number=args.repeticiones, repeat=3))
+        resultados[nombre] = {"us_por_peticion": round(segundos / args.repeticiones * 1e6, 3)}
+    resultados["tokens_en_memoria"] = len(limitador)
+
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Micro-benchmark de la serialización de respuestas.
+
+Compara el camino anterior (model_validate + model_to_dict con conversión
+manual de fechas + JSONResponse con json estándar) con el camino rápido de
+app.serializacion, para una búsqueda por DNI y una página del listado.
+
+Uso (desde el directorio backend):
+    python benchmarks/bench_serializacion.py [--repeticiones 20000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from app.models import Persona  # noqa: E402
+from app.schemas import PersonaResponse  # noqa: E402
+from app.serializacion import Sobres, fila_a_dict, filas_a_dict, orjson  # noqa: E402
+
+DESCRIPCIONES = {200: "OK - Solicitud procesada exitosamente"}
+
+
+# ---------- Camino anterior (copia de la implementación original) ----------
+
+def _model_to_dict_anterior(obj):
+    if hasattr(obj, "model_dump"):
+        data = obj.model_dump()
+    elif hasattr(obj, "__dict__"):
+        data = {k: v for k, v in obj.__dict__.items() if not k.startswith('_')}
+    else:
+        return obj
+    for key, value in data.items():
+        if isinstance(value, datetime):
+            data[key] = value.isoformat()
+    return data
+
+
+def _respuesta_anterior(code, message, data):
+    content = {
+        "success": True,
+        "code": code,
+        "code_description": DESCRIPCIONES.get(code, "Desconocido"),
+        "message": message,
+    }
+    if hasattr(data, "model_dump") or hasattr(data, "__dict__"):
+        content["data"] = _model_to_dict_anterior(data)
+    elif isinstance(data, dict):
+        processed = {}
+        for k, v in data.items():
+            if isinstance(v, list):
+                processed[k] = [_model_to_dict_anterior(i) for i in v]
+            elif isinstance(v, datetime):
+                processed[k] = v.isoformat()
+            else:
+                processed[k] = v
+        content["data"] = processed
+    return JSONResponse(status_code=code, content=content)
+
+
+# ---------- Datos ----------
+
+def _persona(i: int) -> Persona:
+    return Persona(
+        id=i, tipodoc="DNI", nrodoc=f"{10000000 + i}", nombres="JOSÉ ANTONIO",
+        apellido_paterno="PÉREZ", apellido_materno="QUISPE", codigo_verificacion="3",
+        origen="apisperu", fecha_registro=datetime(2024, 5, 1, 12, 30), fecha_actualizacion=None,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=20000)
+    args = parser.parse_args()
+
+    sobres = Sobres(DESCRIPCIONES)
+    respuesta = PersonaResponse(
+        id=1, tipodoc="DNI", nrodoc="12345678", nombres="JOSÉ ANTONIO", apellido_paterno="PÉREZ",
+        apellido_materno="QUISPE", codigo_verificacion="3",
+        fecha_registro=datetime(2024, 5, 1, 12, 30), desde_cache=True,
+    )
+    pagina = [_persona(i) for i in range(100)]
+    listado = {"items": pagina, "total": 1000, "page": 1, "per_page": 100, "total_pages": 10}
+
+    # Ambos caminos deben producir el mismo JSON
+    assert json.loads(_respuesta_anterior(200, "ok", PersonaResponse.model_validate(respuesta)).body) == \
+        json.loads(sobres.respuesta(True, 200, "ok", fila_a_dict(respuesta)).body)
+    assert json.loads(_respuesta_anterior(200, "ok", listado).body) == json.loads(sobres.respuesta(
+        True, 200, "ok", {k: filas_a_dict(v) if isinstance(v, list) else v for k, v in listado.items()}
+    ).body)
+
+    casos = {
+        "busqueda_dni": (
+            lambda: _respuesta_anterior(200, "Persona encontrada", PersonaResponse.model_validate(respuesta)),
+            lambda: sobres.respuesta(True, 200, "Persona encontrada", fila_a_dict(respuesta)),
+            args.repeticiones,
+        ),
+        "listado_100": (
+            lambda: _respuesta_anterior(200, "Personas listadas", listado),
+            lambda: sobres.respuesta(True, 200, "Personas listadas", {
+                k: filas_a_dict(v) if isinstance(v, list) else v for k, v in listado.items()
+            }),
+            max(1, args.repeticiones // 50),
+        ),
+    }
+
+    resultados = {"codificador": "orjson" if orjson is not None else "json", "casos": {}}
+    for nombre, (anterior, rapido, n) in casos.items():
+        t_anterior = min(timeit.repeat(anterior, number=n, repeat=3)) / n * 1e6
+        t_rapido = min(timeit.repeat(rapido, number=n, repeat=3)) / n * 1e6
+        resultados["casos"][nombre] = {
+            "anterior_us": round(t_anterior, 2),
+            "rapido_us": round(t_rapido, 2),
+            "ahorro_us": round(t_anterior - t_rapido, 2),
+            "aceleracion": round(t_anterior / t_rapido, 2),
+        }
+
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+API falsa de apisperu.com para pruebas locales y benchmarks.
+
+Responde GET /api/v1/dni/{nrodoc}?token=... con datos generados a partir del
+DNI, con latencia, errores 503, cuelgues y respuestas corruptas
+configurables, para ejercitar los reintentos, el circuito y el timeout
+adaptativo sin salir a internet.
+
+Los DNIs que empiezan con 9 se reportan como no encontrados. El token
+"invalido" responde 401.
+
+Uso como servidor (desde el directorio backend):
+    python benchmarks/fake_apisperu.py [--puerto 8900] [--latencia-ms 80]
+        [--jitter-ms 40] [--tasa-error 0.0] [--tasa-cuelgue 0.0]
+
+    y en el backend: APISPERU_BASE_URL=http://127.0.0.1:8900/api/v1
+
+    El comportamiento se cambia en caliente con
+        curl -X POST localhost:8900/_control -d '{"caida": true}'
+    y GET /_stats devuelve las llamadas recibidas.
+
+Uso dentro del mismo proceso (sin red):
+    fake = FakeApisPeru(latencia_ms=5)
+    await http_client.iniciar_cliente(fake.transporte())
+"""
+import argparse
+import asyncio
+import json
+import random
+from dataclasses import asdict, dataclass, field
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+_NOMBRES = ["JUAN", "MARIA", "LUIS", "ROSA", "CARLOS", "ANA", "JOSE", "CARMEN"]
+_APELLIDOS = ["QUISPE", "FLORES", "SANCHEZ", "GARCIA", "RODRIGUEZ", "MAMANI", "HUAMAN", "CHAVEZ"]
+
+# Cuerpo que dice ser gzip y no lo es: httpx lanza DecodingError al leerlo
+_CABECERAS_CORRUPTA = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+_CUERPO_CORRUPTO = b"no es gzip"
+
+
+def datos_persona(nrodoc: str) -> dict:
+    """Respuesta de apisperu.com para un DNI (siempre la misma para el mismo DNI)"""
+    n = int(nrodoc) if nrodoc.isdigit() else 0
+    return {
+        "dni": nrodoc,
+        "nombres": _NOMBRES[n % len(_NOMBRES)],
+        "apellidoPaterno": _APELLIDOS[(n // 7) % len(_APELLIDOS)],
+        "apellidoMaterno": _APELLIDOS[(n // 13) % len(_APELLIDOS)],
+        "codVerifica": str(n % 10),
+    }
+
+
+@dataclass
+class FakeApisPeru:
+    latencia_ms: float = 80.0
+    jitter_ms: float = 40.0
+    # Fracción de consultas que responden 503
+    tasa_error: float = 0.0
+    # Fracción de consultas que tardan cuelgue_s (para provocar timeouts)
+    tasa_cuelgue: float = 0.0
+    cuelgue_s: float = 30.0
+    # Todas las consultas responden 503
+    caida: bool = False
+    # Todas las consultas responden 200 con un cuerpo gzip inválido
+    respuesta_corrupta: bool = False
+    llamadas: dict = field(default_factory=lambda: {
+        "total": 0, "ok": 0, "no_encontrado": 0, "error": 0, "cuelgue": 0, "corrupta": 0
+    })
+
+    def configurar(self, **cambios) -> None:
+        for clave, valor in cambios.items():
+            if clave != "llamadas" and hasattr(self, clave):
+                setattr(self, clave, valor)
+
+    def configuracion(self) -> dict:
+        return {k: v for k, v in asdict(self).items() if k != "llamadas"}
+
+    async def responder(self, nrodoc: str, token: str) -> tuple:
+        """Devuelve (status, cuerpo) para una consulta; cuerpo None = respuesta corrupta"""
+        self.llamadas["total"] += 1
+        if random.random() < self.tasa_cuelgue:
+            self.llamadas["cuelgue"] += 1
+            await asyncio.sleep(self.cuelgue_s)
+        else:
+            await asyncio.sleep(max(0.0, self.latencia_ms + random.uniform(-1, 1) * self.jitter_ms) / 1000)
+
+        if self.respuesta_corrupta:
+            self.llamadas["corrupta"] += 1
+            return 200, None
+        if self.caida or random.random() < self.tasa_error:
+            self.llamadas["error"] += 1
+            return 503, {"message": "Service Unavailable"}
+        if token == "invalido":
+            return 401, {"message": "Token inválido"}
+        if nrodoc.startswith("9"):
+            self.llamadas["no_encontrado"] += 1
+            return 200, {"success": False, "message": "No se encontraron resultados."}
+
+        self.llamadas["ok"] += 1
+        return 200, datos_persona(nrodoc)
+
+    async def _manejar(self, request: httpx.Request) -> httpx.Response:
+        nrodoc = request.url.path.rstrip("/").rsplit("/", 1)[-1]
+        status, cuerpo = await self.responder(nrodoc, request.url.params.get("token", ""))
+        if cuerpo is None:
+            return httpx.Response(status, headers=_CABECERAS_CORRUPTA, content=_CUERPO_CORRUPTO)
+        return httpx.Response(status, json=cuerpo)
+
+    def transporte(self) -> httpx.MockTransport:
+        """Transporte de httpx que responde en el mismo proceso"""
+        return httpx.MockTransport(self._manejar)
+
+    def app(self) -> Starlette:
+        """Aplicación ASGI para servirla con uvicorn"""
+
+        async def dni(request: Request) -> JSONResponse:
+            status, cuerpo = await self.responder(
+                request.path_params["nrodoc"], request.query_params.get("token", "")
+            )
+            if cuerpo is None:
+                return Response(_CUERPO_CORRUPTO, status_code=status, headers=_CABECERAS_CORRUPTA)
+            return JSONResponse(cuerpo, status_code=status)
+
+        async def control(request: Request) -> JSONResponse:
+            self.configurar(**(await request.json()))
+            return JSONResponse(self.configuracion())
+
+        async def stats(request: Request) -> JSONResponse:
+            return JSONResponse({"configuracion": self.configuracion(), "llamadas": self.llamadas})
+
+        return Starlette(routes=[
+            Route("/api/v1/dni/{nrodoc}", dni),
+            Route("/_control", control, methods=["POST"]),
+            Route("/_stats", stats),
+        ])
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--puerto", type=int, default=8900)
+    parser.add_argument("--latencia-ms", type=float, default=80.0)
+    parser.add_argument("--jitter-ms", type=float, default=40.0)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--tasa-cuelgue", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeApisPeru(
+        latencia_ms=args.latencia_ms,
+        jitter_ms=args.jitter_ms,
+        tasa_error=args.tasa_error,
+        tasa_cuelgue=args.tasa_cuelgue,
+    )
+    print(json.dumps(fake.configuracion()))
+    uvicorn.run(fake.app(), host="127.0.0.1", port=args.puerto, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Generador de personas sintéticas para pruebas de volumen.
+
+Carga en una base SQLite con el esquema de app.models (incluidos el índice
+de texto completo y los contadores) personas con nombres y apellidos
+peruanos frecuentes y DNIs de 8 dígitos únicos. Los apellidos y nombres
+siguen una distribución de frecuencias parecida a la real (QUISPE, FLORES,
+SANCHEZ... son mucho más comunes que el resto), así las búsquedas tienen una
+selectividad realista.
+
+La fila con id N siempre tiene el DNI dni(N - 1): los DNIs no se repiten,
+están desordenados respecto del id y, como dni() es una permutación, se
+puede saber cuáles existen y cuáles no sin consultar la base. Se puede
+volver a ejecutar sobre la misma base para hacerla crecer.
+
+La carga masiva quita los índices y triggers de personas, inserta por lotes
+y los vuelve a crear al final (además de llenar el índice de texto completo
+y recalcular los contadores), que es mucho más rápido que insertar con los
+índices puestos.
+
+Uso (desde el directorio backend):
+    python benchmarks/generar_personas.py --filas 1000000
+        [--db ./data/personas_sinteticas.db] [--lote 50000] [--semilla 1]
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# Ordenados de más a menos frecuente; el peso de cada uno es 1 / (puesto + k)
+APELLIDOS = [
+    "QUISPE", "FLORES", "SANCHEZ", "RODRIGUEZ", "GARCIA", "ROJAS", "HUAMAN", "MAMANI",
+    "CHAVEZ", "RAMOS", "TORRES", "DIAZ", "VASQUEZ", "CASTILLO", "MENDOZA", "LOPEZ",
+    "GONZALES", "PEREZ", "RUIZ", "ESPINOZA", "CRUZ", "GUTIERREZ", "RAMIREZ", "CONDORI",
+    "CASTRO", "VARGAS", "ROMERO", "SALAZAR", "REYES", "FERNANDEZ", "MORALES", "HERRERA",
+    "ALVAREZ", "MEDINA", "AGUILAR", "CORDOVA", "SOTO", "SILVA", "PAREDES", "RIOS",
+    "RIVERA", "ORTIZ", "GOMEZ", "MARTINEZ", "HERNANDEZ", "CARDENAS", "APAZA", "TICONA",
+    "CHOQUE", "VILLANUEVA", "JIMENEZ", "NUÑEZ", "CHAMBI", "CAHUANA", "CCAHUANA", "PALOMINO",
+    "ZAPATA", "TELLO", "RENGIFO", "CUEVA", "VEGA", "CABRERA", "CAMPOS", "LEON",
+    "NAVARRO", "MIRANDA", "MORENO", "SAAVEDRA", "CHUQUIMIA", "HUAYTA", "CCORI", "HUANCA",
+    "PUMA", "CUTIPA", "COAQUIRA", "YUPANQUI", "INGA", "PACHECO", "ACOSTA", "LUNA",
+    "PAUCAR", "LLANOS", "ZEGARRA", "PEÑA", "MUÑOZ", "VILCA", "ARIAS", "BRAVO",
+    "DELGADO", "SUAREZ", "VALDIVIA", "BENITES", "OBLITAS", "HUARCAYA", "ALIAGA", "ACHO",
+    "AYALA", "BARRIENTOS", "CANALES", "DAVILA", "ESCOBAR", "FIGUEROA", "GUERRERO", "IBAÑEZ",
+    "LAURA", "MAYTA", "NINA", "OCHOA", "PINEDO", "QUINTANA", "RUPAY", "SULCA",
+    "TAIPE", "UCHARICO", "VALENCIA", "YAURI", "ZAVALETA", "ALARCON", "BELTRAN", "CUSI",
+    "ESTRADA", "FARFAN", "GAMARRA", "HUILLCA", "LIMACHI", "MACEDO", "OVIEDO", "POMA",
+]
+NOMBRES_MASCULINOS = [
+    "JUAN", "JOSE", "LUIS", "CARLOS", "JORGE", "CESAR", "MIGUEL", "VICTOR",
+    "PEDRO", "JESUS", "MANUEL", "ANGEL", "FRANCISCO", "WILLIAM", "DAVID", "JULIO",
+    "RAUL", "ALEX", "ANTONIO", "EDWIN", "FERNANDO", "MARIO", "ROBERTO", "HUGO",
+    "RICARDO", "OSCAR", "WALTER", "ALBERTO", "EDGAR", "JAVIER", "ALFREDO", "DANIEL",
+    "SEGUNDO", "ELMER", "PERCY", "WILBER", "FREDY", "HECTOR", "ENRIQUE", "ROGER",
+    "JHON", "KEVIN", "DIEGO", "SEBASTIAN", "MATEO", "SANTIAGO", "THIAGO", "GAEL",
+]
+NOMBRES_FEMENINOS = [
+    "MARIA", "ROSA", "CARMEN", "ANA", "JUANA", "LUZ", "ELIZABETH", "GLADYS",
+    "MARTHA", "NANCY", "LOURDES", "ISABEL", "SONIA", "PATRICIA", "NELLY", "SANTOS",
+    "ELENA", "CARMELA", "VICTORIA", "YOLANDA", "DORIS", "ROCIO", "MILAGROS", "JULIA",
+    "FLOR", "LUCIA", "SILVIA", "TERESA", "MERCEDES", "SUSANA", "JESSICA", "KARINA",
+    "ESTHER", "MARGARITA", "BEATRIZ", "GRACIELA", "HILDA", "NORMA", "RUTH", "SANDRA",
+    "CAMILA", "VALERIA", "XIMENA", "LUCERO", "ALESSANDRA", "FERNANDA", "MIA", "ZOE",
+]
+
+# Fracciones de la tabla por origen
+ORIGENES = [("apisperu", 0.90), ("importacion", 0.09), ("manual", 0.01)]
+
+# Permutación de 0..10^8-1 (multiplicador coprimo con 10^8): DNIs únicos y desordenados
+_MODULO = 10 ** 8
+_MULTIPLICADOR = 73939133
+_DESPLAZAMIENTO = 12345679
+
+_COLUMNAS = (
+    "id", "tipodoc", "nrodoc", "nombres", "apellido_paterno", "apellido_materno",
+    "codigo_verificacion", "origen", "fecha_registro", "fecha_actualizacion",
+)
+SQL_INSERTAR = (
+    f"INSERT INTO personas ({', '.join(_COLUMNAS)}) "
+    f"VALUES ({', '.join('?' for _ in _COLUMNAS)})"
+)
+MAXIMO_FILAS = _MODULO
+
+# Fechas de registro (30 millones de filas cubren unos tres años)
+FECHA_INICIAL = datetime(2022, 1, 1)
+REGISTROS_POR_DIA = 30000
+
+
+def _acumulados(cantidad: int, k: float) -> List[float]:
+    return list(itertools.accumulate(1 / (puesto + k) for puesto in range(1, cantidad + 1)))
+
+
+_PESOS_APELLIDOS = _acumulados(len(APELLIDOS), 8)
+_PESOS_MASCULINOS = _acumulados(len(NOMBRES_MASCULINOS), 5)
+_PESOS_FEMENINOS = _acumulados(len(NOMBRES_FEMENINOS), 5)
+
+
+def dni(indice: int) -> str:
+    """DNI de la persona número indice (0 <= indice < 10^8)"""
+    return f"{(indice * _MULTIPLICADOR + _DESPLAZAMIENTO) % _MODULO:08d}"
+
+
+def generar_filas(inicio: int, cantidad: int, rnd: random.Random) -> List[Tuple]:
+    """
+    Filas de personas con id inicio+1 .. inicio+cantidad, listas para
+    SQL_INSERTAR. Las fechas de registro crecen con el id a razón de
+    REGISTROS_POR_DIA desde FECHA_INICIAL, como en una tabla real; una de
+    cada diez tiene fecha de actualización.
+    """
+    masculinos = rnd.choices(NOMBRES_MASCULINOS, cum_weights=_PESOS_MASCULINOS, k=2 * cantidad)
+    femeninos = rnd.choices(NOMBRES_FEMENINOS, cum_weights=_PESOS_FEMENINOS, k=2 * cantidad)
+    apellidos = rnd.choices(APELLIDOS, cum_weights=_PESOS_APELLIDOS, k=2 * cantidad)
+    origenes = rnd.choices([o for o, _ in ORIGENES], weights=[p for _, p in ORIGENES], k=cantidad)
+    paso = 86400 / REGISTROS_POR_DIA
+
+    filas = []
+    for j in range(cantidad):
+        indice = inicio + j
+        nombres = femeninos if rnd.random() < 0.5 else masculinos
+        nombre = nombres[2 * j]
+        if rnd.random() < 0.6 and nombres[2 * j + 1] != nombre:
+            nombre = f"{nombre} {nombres[2 * j + 1]}"
+        registro = FECHA_INICIAL + timedelta(seconds=int(indice * paso))
+        actualizacion = None
+        if rnd.random() < 0.1:
+            actualizacion = registro + timedelta(seconds=rnd.randrange(365 * 86400))
+            actualizacion = actualizacion.strftime("%Y-%m-%d %H:%M:%S")
+        filas.append((
+            indice + 1,
+            "DNI",
+            dni(indice),
+            nombre,
+            apellidos[2 * j],
+            apellidos[2 * j + 1],
+            str(rnd.randrange(10)),
+            origenes[j],
+            registro.strftime("%Y-%m-%d %H:%M:%S"),
+            actualizacion,
+        ))
+    return filas
+
+
+def crear_esquema(ruta: str) -> None:
+    """Crea las tablas, el índice de texto completo y los contadores de la aplicación"""
+    from sqlalchemy import create_engine
+
+    from app import models  # noqa: F401  (registra los modelos en Base)
+    from app.database import Base
+    from app.services.busqueda_service import crear_indice_fts
+    from app.services.estadisticas_service import crear_contadores
+
+    motor = create_engine(f"sqlite:///{ruta}")
+    try:
+        Base.metadata.create_all(bind=motor)
+        with motor.begin() as conn:
+            crear_indice_fts(conn)
+            crear_contadores(conn)
+    finally:
+        motor.dispose()
+
+
+def total_filas(ruta: str) -> int:
+    with sqlite3.connect(ruta) as conn:
+        return conn.execute("SELECT coalesce(max(id), 0) FROM personas").fetchone()[0]
+
+
+def _lotes(inicio: int, cantidad: int, lote: int, rnd: random.Random) -> Iterator[List[Tuple]]:
+    for desde in range(inicio, inicio + cantidad, lote):
+        yield generar_filas(desde, min(lote, inicio + cantidad - desde), rnd)
+
+
+def cargar(ruta: str, filas: int, lote: int = 50000, semilla: Optional[int] = 1) -> dict:
+    """
+    Agrega personas hasta que la tabla tenga `filas` filas. Devuelve los
+    tiempos de cada paso de la carga.
+    """
+    if filas > MAXIMO_FILAS:
+        raise ValueError(f"No hay más de {MAXIMO_FILAS} DNIs de 8 dígitos")
+    crear_esquema(ruta)
+    inicio = total_filas(ruta)
+    nuevas = max(0, filas - inicio)
+    resultado = {"filas_previas": inicio, "filas_nuevas": nuevas, "filas": inicio + nuevas}
+    if not nuevas:
+        return resultado
+    rnd = random.Random(None if semilla is None else semilla + inicio)
+
+    conn = sqlite3.connect(ruta, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA cache_size=-524288")
+
+        # Índices (salvo la clave primaria) y triggers de personas
+        objetos = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master "
+            "WHERE tbl_name = 'personas' AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+        ).fetchall()
+        for tipo, nombre, _ in objetos:
+            conn.execute(f'DROP {tipo.upper()} "{nombre}"')
+
+        t0 = time.perf_counter()
+        generacion = 0.0
+        lotes = _lotes(inicio, nuevas, lote, rnd)
+        while True:
+            g0 = time.perf_counter()
+            filas_lote = next(lotes, None)
+            generacion += time.perf_counter() - g0
+            if filas_lote is None:
+                break
+            conn.execute("BEGIN")
+            conn.executemany(SQL_INSERTAR, filas_lote)
+            conn.execute("COMMIT")
+        insercion = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for tipo, _, sql in objetos:
+            if tipo == "index":
+                conn.execute(sql)
+        indices = time.perf_counter() - t0
+
+        # Lo que habrían hecho los triggers, en una sola pasada
+        t0 = time.perf_counter()
+        conn.execute("BEGIN")
+        conn.execute(
+            "INSERT INTO personas_fts(rowid, nrodoc, nombres, apellido_paterno, apellido_materno) "
+            "SELECT id, nrodoc, nombres, apellido_paterno, apellido_materno FROM personas WHERE id > ?",
+            (inicio,)
+        )
+        conn.execute("COMMIT")
+        fts = time.perf_counter() - t0
+
+        for tipo, _, sql in objetos:
+            if tipo == "trigger":
+                conn.execute(sql)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+    from sqlalchemy import create_engine
+
+    from app.services.estadisticas_service import reconstruir_contadores
+
+    t0 = time.perf_counter()
+    motor = create_engine(f"sqlite:///{ruta}")
+    try:
+        with motor.begin() as c:
+            reconstruir_contadores(c)
+    finally:
+        motor.dispose()
+    contadores = time.perf_counter() - t0
+
+    resultado.update({
+        "generacion_s": round(generacion, 2),
+        "insercion_s": round(insercion - generacion, 2),
+        "filas_por_segundo": round(nuevas / max(insercion - generacion, 1e-9)),
+        "indices_s": round(indices, 2),
+        "fts_s": round(fts, 2),
+        "contadores_s": round(contadores, 2),
+    })
+    return resultado
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, required=True, help="Total de personas que debe tener la tabla")
+    parser.add_argument("--db", default="./data/personas_sinteticas.db")
+    parser.add_argument("--lote", type=int, default=50000)
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    print(json.dumps(cargar(args.db, args.filas, args.lote, args.semilla), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Configuración común de las pruebas: la app usa una base SQLite y un
+directorio de datos temporales (se definen antes de importarla) y la
+fixture base_vacia deja las tablas, contadores y cachés en cero.
+
+Uso (desde el directorio backend):
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+_DIRECTORIO = tempfile.mkdtemp(prefix="dni-pruebas-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_DIRECTORIO, 'personas.db')}",
+    "BACKUP_DIR": os.path.join(_DIRECTORIO, "backups"),
+    "PROFILE_DIR": os.path.join(_DIRECTORIO, "perfiles"),
+    "APISPERU_TOKEN": "",
+    "ADMIN_USER": "admin",
+    "ADMIN_PASSWORD": "clave-admin",
+    "DB_BACKUP_USER": "backup",
+    "DB_BACKUP_PASSWORD": "clave-backup",
+    "PROFILE_TOKEN": "perfil-pruebas",
+})
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from app import database  # noqa: E402
+from app.services import cache_service, token_service  # noqa: E402
+from app.services.rate_limit_service import limitador  # noqa: E402
+from app.services.estadisticas_service import reconstruir_contadores  # noqa: E402
+
+
+@pytest.fixture
+def base_vacia():
+    """
+    Tablas vacías (los triggers dejan el índice FTS a la par), cachés limpias
+    y sin uso de tokens en memoria
+    """
+    database.init_db()
+    with database.engine.begin() as conn:
+        for tabla in reversed(database.Base.metadata.sorted_tables):
+            conn.execute(tabla.delete())
+        reconstruir_contadores(conn)
+    for cache in cache_service._caches.values():
+        cache.clear()
+    token_service._uso_pendiente.clear()
+    for datos, _ in limitador._shards:
+        datos.clear()
+    yield
+    # Cada prueba corre su propio event loop: no reutilizar conexiones
+    asyncio.run(database.async_engine.dispose())
+    asyncio.run(database.async_read_engine.dispose())
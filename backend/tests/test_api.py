@@ -0,0 +1,143 @@
+"""
+Pruebas de la API con TestClient: rechazos 429 del login y de los tokens,
+cabeceras del middleware y endpoints de personas, exportación y backup.
+
+Uso (desde el directorio backend):
+    python -m pytest tests
+"""
+import asyncio
+import gzip
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.database import AsyncSessionLocal
+from app.main import app, limiter
+from app.middleware import CABECERAS_SEGURIDAD
+from app.models import Persona
+from app.services import token_service
+from app.services.rate_limit_service import limitador
+
+ADMIN = ("admin", "clave-admin")
+
+
+@pytest.fixture
+def cliente(base_vacia):
+    """Cliente sin eventos de inicio (base_vacia ya crea las tablas)"""
+    limiter.reset()
+
+    async def guardar():
+        async with AsyncSessionLocal() as db:
+            db.add_all([
+                Persona(nrodoc="10000001", nombres="ANA", apellido_paterno="PÉREZ", origen="manual"),
+                Persona(nrodoc="10000002", nombres="LUIS", apellido_paterno="RAMOS", origen="manual"),
+            ])
+            await db.commit()
+
+    asyncio.run(guardar())
+    return TestClient(app)
+
+
+def _token(limite_por_minuto: int = None, cuota_diaria: int = None) -> str:
+    async def crear():
+        async with AsyncSessionLocal() as db:
+            token = await token_service.crear_token(db, "pruebas", None, limite_por_minuto, cuota_diaria)
+            limitador.olvidar(token.id)
+            return token.token
+
+    return asyncio.run(crear())
+
+
+def test_cabeceras_de_seguridad_y_server_timing(cliente):
+    respuesta = cliente.get("/health")
+
+    for nombre, valor in CABECERAS_SEGURIDAD.items():
+        assert respuesta.headers[nombre] == valor
+    assert "total;dur=" in respuesta.headers["Server-Timing"]
+
+
+def test_login_bloqueado_tras_intentos_fallidos(cliente):
+    for _ in range(5):
+        respuesta = cliente.post("/api/login", json={"username": "admin", "password": "mala"})
+        assert respuesta.status_code == 401
+
+    # Bloqueado aunque ahora la clave sea la correcta
+    respuesta = cliente.post("/api/login", json={"username": "admin", "password": "clave-admin"})
+    assert respuesta.status_code == 429
+    assert respuesta.json()["message"].startswith("Demasiados intentos fallidos")
+
+
+def test_token_limite_por_minuto(cliente):
+    token = _token(limite_por_minuto=2)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    respuesta = cliente.get("/api/persona/10000001", headers=headers)
+    assert respuesta.status_code == 200
+    assert respuesta.json()["data"]["nombres"] == "ANA"
+    assert (respuesta.headers["X-RateLimit-Limit"], respuesta.headers["X-RateLimit-Remaining"]) == ("2", "1")
+    assert "auth" in respuesta.headers["Server-Timing"]
+
+    assert cliente.get("/api/persona/10000001", headers=headers).status_code == 200
+    respuesta = cliente.get("/api/persona/10000001", headers=headers)
+    assert respuesta.status_code == 429
+    assert respuesta.json()["detail"] == "Límite de peticiones por minuto del token excedido"
+    assert respuesta.headers["X-RateLimit-Remaining"] == "0"
+    assert int(respuesta.headers["Retry-After"]) >= 1
+
+
+def test_token_cuota_diaria(cliente):
+    token = _token(limite_por_minuto=0, cuota_diaria=1)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    respuesta = cliente.get("/api/persona/10000001", headers=headers)
+    assert respuesta.status_code == 200
+    assert respuesta.headers["X-RateLimit-Quota-Remaining"] == "0"
+    assert "X-RateLimit-Limit" not in respuesta.headers
+
+    respuesta = cliente.get("/api/persona/10000001", headers=headers)
+    assert respuesta.status_code == 429
+    assert respuesta.json()["detail"] == "Cuota diaria del token agotada"
+    assert int(respuesta.headers["Retry-After"]) >= 1
+
+
+def test_token_invalido(cliente):
+    respuesta = cliente.get("/api/persona/10000001", headers={"Authorization": "Bearer otro"})
+    assert respuesta.status_code == 401
+    assert cliente.get("/api/persona/10000001").status_code == 401
+
+
+def test_personas_por_cursor_y_busqueda(cliente):
+    respuesta = cliente.get("/api/personas", params={"cursor": "", "per_page": 1}, auth=ADMIN)
+    data = respuesta.json()["data"]
+    assert [p["nrodoc"] for p in data["items"]] == ["10000002"]
+    assert data["prev_cursor"] is None
+
+    data = cliente.get(
+        "/api/personas", params={"cursor": data["next_cursor"], "per_page": 1}, auth=ADMIN
+    ).json()["data"]
+    assert [p["nrodoc"] for p in data["items"]] == ["10000001"]
+    assert data["next_cursor"] is None
+
+    assert cliente.get("/api/personas", params={"cursor": "roto"}, auth=ADMIN).status_code == 400
+
+    respuesta = cliente.get("/api/personas", params={"q": "pere"}, auth=ADMIN).json()
+    assert [p["nrodoc"] for p in respuesta["data"]["items"]] == ["10000001"]
+
+
+def test_exportar_ndjson_gzip(cliente):
+    respuesta = cliente.get("/api/personas/exportar", params={"gzip": "true"}, auth=ADMIN)
+
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"] == "application/gzip"
+    assert "X-Exportacion-Marca" in respuesta.headers
+    filas = [json.loads(linea) for linea in gzip.decompress(respuesta.content).splitlines()]
+    assert [fila["nrodoc"] for fila in filas] == ["10000001", "10000002"]
+
+    assert cliente.get("/api/personas/exportar", params={"formato": "xml"}, auth=ADMIN).status_code == 400
+
+
+def test_snapshots_requieren_administrador(cliente):
+    assert cliente.get("/api/backup/snapshots").status_code == 401
+    respuesta = cliente.get("/api/backup/snapshots/..%2Fpersonas.db", auth=ADMIN)
+    assert respuesta.status_code == 404
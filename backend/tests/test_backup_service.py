@@ -0,0 +1,104 @@
+"""
+Pruebas del backup por partes y de los snapshots con manifiesto de
+backup_service.
+
+Uso (desde el directorio backend):
+    python -m pytest tests
+"""
+import asyncio
+import gzip
+import hashlib
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.models import Persona
+from app.services import backup_service
+
+
+@pytest.fixture
+def personas(base_vacia):
+    async def guardar():
+        async with AsyncSessionLocal() as db:
+            db.add_all([Persona(nrodoc="10000001"), Persona(nrodoc="10000002")])
+            await db.commit()
+
+    asyncio.run(guardar())
+
+
+@pytest.fixture
+def directorio(tmp_path, monkeypatch):
+    """BACKUP_DIR propio y un reloj que avanza un segundo por snapshot"""
+    monkeypatch.setattr(get_settings(), "BACKUP_DIR", str(tmp_path))
+    inicio = datetime(2024, 5, 1, 12, 0, 0, tzinfo=timezone.utc)
+    segundos = iter(range(1000))
+
+    class Reloj(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return inicio + timedelta(seconds=next(segundos))
+
+    monkeypatch.setattr(backup_service, "datetime", Reloj)
+    return tmp_path
+
+
+def _personas_en(ruta: str) -> int:
+    conexion = sqlite3.connect(ruta)
+    try:
+        return conexion.execute("SELECT count(*) FROM personas").fetchone()[0]
+    finally:
+        conexion.close()
+
+
+def test_backup_gzip_es_una_base_completa(personas, tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+
+    async def descargar():
+        return b"".join([parte async for parte in backup_service.generar_backup(comprimir=True)])
+
+    copia = tmp_path / "copia.db"
+    copia.write_bytes(gzip.decompress(asyncio.run(descargar())))
+
+    assert _personas_en(str(copia)) == 2
+    # El snapshot temporal no queda en disco
+    assert os.listdir(tmp_path) == ["copia.db"]
+
+
+def test_snapshots_con_manifiesto_y_retencion(personas, directorio, monkeypatch):
+    monkeypatch.setattr(get_settings(), "BACKUP_RETENTION", 2)
+    monkeypatch.setattr(get_settings(), "BACKUP_COMPRESS", True)
+
+    entradas = [asyncio.run(backup_service.tomar_snapshot_async()) for _ in range(3)]
+
+    manifiesto = backup_service.leer_manifiesto()
+    assert [e["archivo"] for e in manifiesto] == [entradas[2]["archivo"], entradas[1]["archivo"]]
+    # El más antiguo se elimina y no quedan temporales
+    assert sorted(os.listdir(directorio)) == sorted(
+        [e["archivo"] for e in manifiesto] + ["manifest.json"]
+    )
+
+    ruta = backup_service.ruta_snapshot(manifiesto[0]["archivo"])
+    with open(ruta, "rb") as archivo:
+        contenido = archivo.read()
+    assert hashlib.sha256(contenido).hexdigest() == manifiesto[0]["sha256"]
+    assert len(contenido) == manifiesto[0]["tamano"]
+
+    sin_comprimir = directorio / "restaurada.db"
+    sin_comprimir.write_bytes(gzip.decompress(contenido))
+    assert _personas_en(str(sin_comprimir)) == 2
+
+
+def test_snapshot_solo_por_nombre_valido(personas, directorio, monkeypatch):
+    monkeypatch.setattr(get_settings(), "BACKUP_COMPRESS", False)
+    entrada = asyncio.run(backup_service.tomar_snapshot_async())
+
+    assert entrada["archivo"] == "personas_20240501_120000.db"
+    assert backup_service.ruta_snapshot(entrada["archivo"]) == str(directorio / entrada["archivo"])
+    assert backup_service.ruta_snapshot("personas_20240501_120001.db") is None
+    assert backup_service.ruta_snapshot("../personas.db") is None
+    assert backup_service.ruta_snapshot("manifest.json") is None
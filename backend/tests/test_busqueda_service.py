@@ -0,0 +1,115 @@
+"""
+Pruebas de la búsqueda con el índice FTS y de la paginación por cursor de
+busqueda_service.
+
+Uso (desde el directorio backend):
+    python -m pytest tests
+"""
+import asyncio
+
+from sqlalchemy import delete, update
+
+from app.database import AsyncSessionLocal
+from app.models import Persona
+from app.services import busqueda_service
+from app.services.busqueda_service import ANTERIOR, SIGUIENTE
+
+
+def _guardar(*personas: Persona) -> list:
+    """Guarda las personas y devuelve sus ids"""
+    async def guardar():
+        async with AsyncSessionLocal() as db:
+            db.add_all(personas)
+            await db.flush()
+            ids = [persona.id for persona in personas]
+            await db.commit()
+            return ids
+
+    return asyncio.run(guardar())
+
+
+def _buscar(q: str, offset: int = 0, limit: int = 10) -> list:
+    async def buscar():
+        async with AsyncSessionLocal() as db:
+            return await busqueda_service.buscar(db, busqueda_service.consulta_fts(q), offset, limit)
+
+    return [p.nrodoc for p in asyncio.run(buscar())]
+
+
+def _pagina(cursor: str = None, limit: int = 2, q: str = "") -> tuple:
+    async def listar():
+        async with AsyncSessionLocal() as db:
+            referencia = busqueda_service.decodificar_cursor(cursor) if cursor else None
+            consulta = busqueda_service.consulta_fts(q) if q else None
+            return await busqueda_service.listar_por_cursor(db, consulta, referencia, limit)
+
+    personas, siguiente, anterior = asyncio.run(listar())
+    return [p.id for p in personas], siguiente, anterior
+
+
+def test_consulta_fts_busca_cada_palabra_como_prefijo():
+    assert busqueda_service.consulta_fts("juan per") == '"juan"* "per"*'
+    assert busqueda_service.consulta_fts('"; DROP') == '"DROP"*'
+    assert busqueda_service.consulta_fts(" -- ") is None
+
+
+def test_busqueda_ignora_tildes_y_sigue_los_cambios(base_vacia):
+    _guardar(
+        Persona(nrodoc="10000001", nombres="JOSÉ", apellido_paterno="PÉREZ"),
+        Persona(nrodoc="10000002", nombres="JOSEFA", apellido_paterno="RAMOS"),
+        Persona(nrodoc="10000003", nombres="ANA", apellido_paterno="PEREYRA"),
+    )
+
+    assert sorted(_buscar("jose")) == ["10000001", "10000002"]
+    assert _buscar("jose perez") == ["10000001"]
+    assert sorted(_buscar("pere")) == ["10000001", "10000003"]
+    assert _buscar("10000003") == ["10000003"]
+    assert len(_buscar("jose", offset=1, limit=1)) == 1
+
+    # Los triggers mantienen el índice al actualizar y borrar
+    async def cambiar():
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(Persona).where(Persona.nrodoc == "10000001").values(nombres="LUIS"))
+            await db.execute(delete(Persona).where(Persona.nrodoc == "10000002"))
+            await db.commit()
+
+    asyncio.run(cambiar())
+    assert _buscar("jose") == []
+    assert _buscar("luis") == ["10000001"]
+
+
+def test_cursor_recorre_hacia_adelante_y_hacia_atras(base_vacia):
+    ids = sorted(_guardar(*(Persona(nrodoc=f"1000000{i}", nombres="LUIS") for i in range(5))), reverse=True)
+
+    primera, siguiente, anterior = _pagina()
+    assert (primera, anterior) == (ids[:2], None)
+    segunda, siguiente, anterior = _pagina(siguiente)
+    assert segunda == ids[2:4]
+    tercera, fin, anterior_tercera = _pagina(siguiente)
+    assert (tercera, fin) == (ids[4:], None)
+
+    # Volver desde la tercera página reproduce la segunda y luego la primera
+    atras, siguiente_atras, anterior = _pagina(anterior_tercera)
+    assert atras == segunda
+    assert busqueda_service.decodificar_cursor(siguiente_atras) == (segunda[-1], SIGUIENTE)
+    assert _pagina(anterior)[0] == primera
+    assert _pagina(anterior)[2] is None
+
+
+def test_cursor_con_busqueda_usa_el_indice_fts(base_vacia):
+    ids = _guardar(*(
+        Persona(nrodoc=f"1000000{i}", nombres="LUIS" if i % 2 else "ANA")
+        for i in range(6)
+    ))
+
+    primera, siguiente, _ = _pagina(q="luis")
+    segunda, fin, anterior = _pagina(siguiente, q="luis")
+    assert primera + segunda == sorted(ids[1::2], reverse=True)
+    assert fin is None
+    assert busqueda_service.decodificar_cursor(anterior) == (segunda[0], ANTERIOR)
+
+
+def test_cursor_invalido():
+    assert busqueda_service.decodificar_cursor("no-es-un-cursor") is None
+    assert busqueda_service.decodificar_cursor(busqueda_service.codificar_cursor(5, "otra")) is None
+    assert busqueda_service.decodificar_cursor(busqueda_service.codificar_cursor(5, ANTERIOR)) == (5, ANTERIOR)
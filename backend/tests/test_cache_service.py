@@ -0,0 +1,73 @@
+"""
+Pruebas de TTLCache de cache_service.
+
+Uso (desde el directorio backend):
+    python -m pytest tests
+"""
+from types import SimpleNamespace
+
+from app.services import cache_service
+from app.services.cache_service import TTLCache
+
+
+def test_purgar_expirados_sigue_el_vencimiento_y_no_el_ultimo_uso():
+    cache = TTLCache(max_size=100, ttl=60)
+    cache.set("vigente", 1)
+    cache.set("vencida", 2, ttl=0)
+    cache.set("reemplazada", 3, ttl=0)
+    cache.set("reemplazada", 4)
+
+    # "vigente" es la de uso más antiguo y no frena la purga de "vencida"
+    assert cache.purgar_expirados() == 1
+    assert cache.get("vencida") is None
+    assert cache.get("vigente") == 1
+    assert cache.get("reemplazada") == 4
+    assert cache.expirations == 1
+
+
+def test_purgar_expirados_respeta_el_limite():
+    cache = TTLCache(max_size=100, ttl=0)
+    for i in range(10):
+        cache.set(i, i)
+
+    assert cache.purgar_expirados(limite=4) == 4
+    assert len(cache) == 6
+    assert cache.purgar_expirados() == 6
+    assert len(cache) == 0
+
+
+def test_la_rueda_de_vencimientos_sigue_a_las_entradas(monkeypatch):
+    reloj = [0.0]
+    monkeypatch.setattr(cache_service, "time", SimpleNamespace(monotonic=lambda: reloj[0]))
+    cache = TTLCache(max_size=10, ttl=60)
+    for i in range(30):
+        cache.set(i % 20, i)
+    cache.invalidate(9)
+    cache.invalidate(8)
+
+    # Reemplazos, expulsiones e invalidaciones no dejan claves en la rueda
+    assert len(cache) == 8
+    assert sum(len(cubo) for cubo in cache._cubos.values()) == 8
+
+    # Mucho después todo está vencido y se purga en una llamada
+    reloj[0] = 10_000
+    assert cache.purgar_expirados() == 8
+    assert not cache._cubos
+
+
+def test_sin_expulsion_las_entradas_vigentes_no_se_pierden_por_claves_nuevas(monkeypatch):
+    reloj = [0.0]
+    monkeypatch.setattr(cache_service, "time", SimpleNamespace(monotonic=lambda: reloj[0]))
+    cache = TTLCache(max_size=2, ttl=60, expulsar=False)
+    assert cache.set("a", 1)
+    assert cache.set("b", 2)
+
+    assert not cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, 2, None)
+    assert cache.stats()["rejected"] == 1
+    # Una clave existente se puede renovar
+    assert cache.set("a", 10)
+
+    reloj[0] = 61
+    assert cache.set("c", 3)
+    assert cache.get("c") == 3
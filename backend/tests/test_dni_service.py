@@ -0,0 +1,33 @@
+"""
+Pruebas del refresco en segundo plano de dni_service.
+
+Uso (desde el directorio backend):
+    python -m pytest tests
+"""
+from app.config import get_settings
+from app.services import dni_service
+from app.services.dni_service import _PresupuestoRefresco
+
+
+def test_presupuesto_de_refresco_repone_las_fichas_por_minuto():
+    presupuesto = _PresupuestoRefresco()
+    assert presupuesto.consumir(2, ahora=0)
+    assert presupuesto.consumir(2, ahora=0)
+    assert not presupuesto.consumir(2, ahora=0)
+    # Una ficha cada 30 segundos con 2 por minuto
+    assert not presupuesto.consumir(2, ahora=20)
+    assert presupuesto.consumir(2, ahora=30)
+    # No acumula más que el máximo por minuto
+    assert presupuesto.consumir(2, ahora=1000)
+    assert presupuesto.consumir(2, ahora=1000)
+    assert not presupuesto.consumir(2, ahora=1000)
+
+
+def test_sin_refrescos_por_minuto_no_se_programa_ninguno(monkeypatch):
+    monkeypatch.setattr(get_settings(), "PERSONA_REFRESH_PER_MINUTE", 0)
+    programados = dni_service.contadores_refresco["programados"]
+
+    # Sin event loop: si intentara crear la tarea fallaría
+    assert dni_service.programar_refresco("10000001") is False
+    assert dni_service.contadores_refresco["programados"] == programados
+    assert not dni_service._refrescos_en_curso
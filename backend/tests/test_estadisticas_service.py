@@ -0,0 +1,82 @@
+"""
+Pruebas de los contadores por triggers y el conteo de búsquedas de
+estadisticas_service.
+
+Uso (desde el directorio backend):
+    python -m pytest tests
+"""
+import asyncio
+
+from sqlalchemy import delete, update
+
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.models import Persona
+from app.services import estadisticas_service
+
+
+def _guardar(*personas: Persona) -> None:
+    async def guardar():
+        async with AsyncSessionLocal() as db:
+            db.add_all(personas)
+            await db.commit()
+
+    asyncio.run(guardar())
+
+
+def _contar(consulta: str, exacto: bool = False) -> tuple:
+    async def contar():
+        async with AsyncSessionLocal() as db:
+            return await estadisticas_service.contar_busqueda(db, consulta, exacto)
+
+    return asyncio.run(contar())
+
+
+def test_conteo_exacto_en_cache_no_pasa_a_aproximado(base_vacia):
+    _guardar(Persona(nrodoc="10000001", nombres="ANA"), Persona(nrodoc="10000002", nombres="ANA MARIA"))
+
+    assert _contar('"ana"*') == (2, False)
+    assert _contar('"ana"*') == (2, False)
+
+
+def test_conteo_acotado_se_marca_aproximado(base_vacia, monkeypatch):
+    monkeypatch.setattr(get_settings(), "COUNT_APPROX_LIMIT", 2)
+    _guardar(*(Persona(nrodoc=f"1000000{i}", nombres="LUIS") for i in range(3)))
+
+    assert _contar('"luis"*') == (2, True)
+    assert _contar('"luis"*') == (2, True)
+    assert _contar('"luis"*', exacto=True) == (3, False)
+    assert _contar('"luis"*') == (3, False)
+
+
+def test_triggers_mantienen_los_contadores_del_resumen(base_vacia):
+    _guardar(
+        Persona(nrodoc="10000001", origen="apisperu"),
+        Persona(nrodoc="10000002", origen="apisperu"),
+        Persona(nrodoc="10000003", origen="manual"),
+    )
+
+    async def cambiar():
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(Persona).where(Persona.nrodoc == "10000001").values(origen="importacion"))
+            await db.execute(delete(Persona).where(Persona.nrodoc == "10000003"))
+            await db.commit()
+
+    def resumen() -> dict:
+        async def leer():
+            async with AsyncSessionLocal() as db:
+                return await estadisticas_service.resumen(db, dias=2)
+
+        return asyncio.run(leer())
+
+    datos = resumen()
+    assert datos["total_personas"] == 3
+    assert datos["por_origen"] == {"apisperu": 2, "manual": 1}
+    assert datos["por_dia"][-1]["registros"] == 3
+    assert len(datos["por_dia"]) == 2
+
+    asyncio.run(cambiar())
+    datos = resumen()
+    assert datos["total_personas"] == 2
+    assert datos["por_origen"] == {"apisperu": 1, "importacion": 1}
+    assert datos["por_dia"][-1]["registros"] == 2
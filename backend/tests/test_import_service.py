@@ -0,0 +1,126 @@
+"""
+Pruebas de import_service: lectura por partes del cuerpo y upsert por nrodoc.
+
+Uso (desde el directorio backend):
+    python -m pytest tests
+"""
+import asyncio
+import csv
+
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal
+from app.models import Persona
+from app.services.estadisticas_service import contar_busqueda
+from app.services.import_service import (
+    _MAX_LINEAS_REGISTRO, _lineas, _registros_csv, importar_personas,
+)
+
+
+def _registros(*chunks: bytes) -> list:
+    async def contenido():
+        for chunk in chunks:
+            yield chunk
+
+    async def leer():
+        return [
+            (numero, next(csv.reader(lineas)) if completo else None)
+            async for numero, lineas, completo in _registros_csv(_lineas(contenido()))
+        ]
+
+    return asyncio.run(leer())
+
+
+def test_campo_entre_comillas_con_saltos_de_linea_es_un_solo_registro():
+    registros = _registros(
+        b'nrodoc,nombres\r\n12345678,"JUAN\r\nCAR', b'LOS ""EL ', b'GRANDE"""\n87654321,ANA'
+    )
+    assert registros == [
+        (1, ["nrodoc", "nombres"]),
+        (2, ["12345678", 'JUAN\r\nCARLOS "EL GRANDE"']),
+        (4, ["87654321", "ANA"]),
+    ]
+
+
+def test_comilla_sin_cerrar_no_acumula_el_resto_del_archivo():
+    filas = b"".join(b"%08d,ANA\n" % i for i in range(_MAX_LINEAS_REGISTRO + 5))
+    registros = _registros(b'nrodoc,nombres\n12345678,"JUAN\n' + filas)
+
+    # La comilla suelta se reporta una vez y la lectura sigue normal
+    assert registros[1] == (2, None)
+    assert registros[2][0] == 2 + _MAX_LINEAS_REGISTRO
+    assert registros[-1] == (
+        2 + _MAX_LINEAS_REGISTRO + 5, ["%08d" % (_MAX_LINEAS_REGISTRO + 4), "ANA"]
+    )
+
+
+def _importar(cuerpo: bytes, formato: str) -> dict:
+    async def contenido():
+        yield cuerpo
+
+    async def importar():
+        async with AsyncSessionLocal() as db:
+            return await importar_personas(db, contenido(), formato)
+
+    return asyncio.run(importar())
+
+
+def _personas() -> dict:
+    async def leer():
+        async with AsyncSessionLocal() as db:
+            return {p.nrodoc: p for p in await db.scalars(select(Persona))}
+
+    return asyncio.run(leer())
+
+
+def _guardar(*personas: Persona) -> None:
+    async def guardar():
+        async with AsyncSessionLocal() as db:
+            db.add_all(personas)
+            await db.commit()
+
+    asyncio.run(guardar())
+
+
+def test_importar_solo_actualiza_las_columnas_del_archivo_y_omite_las_manuales(base_vacia):
+    _guardar(
+        Persona(nrodoc="10000001", nombres="ANA", apellido_materno="ROJAS", origen="apisperu"),
+        Persona(nrodoc="10000002", nombres="CORREGIDO", apellido_materno="DIAZ", origen="manual"),
+    )
+
+    resumen = _importar(b"nrodoc,nombres\n10000001,ANA MARIA\n10000002,PISADO\n10000003,LUIS\n", "csv")
+
+    assert (resumen["insertadas"], resumen["actualizadas"], resumen["omitidas"]) == (1, 1, 1)
+    personas = _personas()
+    actualizada = personas["10000001"]
+    assert (actualizada.nombres, actualizada.apellido_materno) == ("ANA MARIA", "ROJAS")
+    assert actualizada.origen == "importacion"
+    manual = personas["10000002"]
+    assert (manual.nombres, manual.apellido_materno, manual.origen) == ("CORREGIDO", "DIAZ", "manual")
+    assert personas["10000003"].tipodoc == "DNI"
+
+
+def test_importar_ndjson_con_columnas_distintas_por_fila(base_vacia):
+    _guardar(Persona(nrodoc="10000001", nombres="ANA", apellido_paterno="PEREZ", origen="apisperu"))
+
+    resumen = _importar(
+        b'{"nrodoc": "10000001", "apellido_materno": "ROJAS"}\n'
+        b'{"nrodoc": "10000002", "nombres": "LUIS", "apellido_paterno": "SOTO"}\n',
+        "ndjson",
+    )
+
+    assert (resumen["insertadas"], resumen["actualizadas"], resumen["con_error"]) == (1, 1, 0)
+    personas = _personas()
+    assert (personas["10000001"].nombres, personas["10000001"].apellido_paterno,
+            personas["10000001"].apellido_materno) == ("ANA", "PEREZ", "ROJAS")
+    assert (personas["10000002"].nombres, personas["10000002"].apellido_paterno) == ("LUIS", "SOTO")
+
+
+def test_importar_descarta_los_conteos_de_busqueda_guardados(base_vacia):
+    async def contar():
+        async with AsyncSessionLocal() as db:
+            return await contar_busqueda(db, '"rosa"*')
+
+    assert asyncio.run(contar()) == (0, False)
+    _importar(b"nrodoc,nombres\n10000001,ROSA\n", "csv")
+    assert asyncio.run(contar()) == (1, False)
@@ -0,0 +1,168 @@
+"""
+Pruebas de los trabajos por lotes de job_service contra la API falsa de
+benchmarks/fake_apisperu.py (sin red).
+
+Uso (desde el directorio backend):
+    python -m pytest tests
+"""
+import asyncio
+import csv
+import io
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select, update
+
+from fake_apisperu import FakeApisPeru
+
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.models import TrabajoLote, TrabajoLoteItem
+from app.services import http_client, job_service, upstream_service
+from app.services.upstream_service import CircuitBreaker, LatenciaAdaptativa
+
+
+@pytest.fixture
+def fake(base_vacia, monkeypatch):
+    """API falsa sin latencia, token configurado y sin esperas entre consultas"""
+    settings = get_settings()
+    monkeypatch.setattr(settings, "APISPERU_TOKEN", "prueba")
+    monkeypatch.setattr(settings, "JOB_UPSTREAM_RATE_PER_SECOND", 0)
+    monkeypatch.setattr(upstream_service, "circuito", CircuitBreaker(1000, 30))
+    monkeypatch.setattr(upstream_service, "latencias", LatenciaAdaptativa(20, 3.0, 1.0, 10.0))
+    monkeypatch.setattr(upstream_service, "_espera_reintento", lambda intento: 0)
+    fake = FakeApisPeru(latencia_ms=0, jitter_ms=0)
+    asyncio.run(http_client.iniciar_cliente(fake.transporte()))
+    yield fake
+    asyncio.run(http_client.cerrar_cliente())
+
+
+def _crear_trabajo(cuerpo: bytes) -> str:
+    async def contenido():
+        yield cuerpo
+
+    async def crear():
+        async with AsyncSessionLocal() as db:
+            trabajo, _ = await job_service.crear_trabajo(db, contenido())
+            return trabajo.id
+
+    return asyncio.run(crear())
+
+
+def _procesar() -> None:
+    """Una vuelta del worker: reserva el siguiente trabajo disponible y lo procesa"""
+    async def procesar():
+        async with AsyncSessionLocal() as db:
+            trabajo = await job_service._reservar_siguiente_trabajo(db)
+            if trabajo:
+                await job_service._procesar_trabajo(db, trabajo)
+
+    asyncio.run(procesar())
+
+
+def _estado(trabajo_id: str) -> tuple:
+    async def leer():
+        async with AsyncSessionLocal() as db:
+            trabajo = await job_service.obtener_trabajo(db, trabajo_id)
+            items = {
+                item.nrodoc: item for item in await db.scalars(
+                    select(TrabajoLoteItem).where(TrabajoLoteItem.trabajo_id == trabajo_id)
+                )
+            }
+            return trabajo, items
+
+    return asyncio.run(leer())
+
+
+def _vencer_esperas(trabajo_id: str) -> None:
+    async def vencer():
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(TrabajoLoteItem)
+                .where(TrabajoLoteItem.trabajo_id == trabajo_id, TrabajoLoteItem.reintentar_desde.is_not(None))
+                .values(reintentar_desde=datetime.utcnow())
+            )
+            await db.execute(update(TrabajoLote).where(TrabajoLote.id == trabajo_id).values(reservado_hasta=None))
+            await db.commit()
+
+    asyncio.run(vencer())
+
+
+def test_errores_pasajeros_quedan_pendientes_y_se_reintentan(fake):
+    trabajo_id = _crear_trabajo(b"dni\n10000001\n90000001\n")
+
+    fake.configurar(caida=True)
+    _procesar()
+    trabajo, items = _estado(trabajo_id)
+    assert trabajo.estado == "procesando"
+    assert (trabajo.procesados, trabajo.no_encontrados) == (0, 0)
+    for item in items.values():
+        assert (item.estado, item.intentos) == ("pendiente", 1)
+        assert item.reintentar_desde > datetime.utcnow()
+    # El trabajo se suelta hasta el primer reintento
+    assert trabajo.reservado_hasta == min(item.reintentar_desde for item in items.values())
+
+    # Antes de que venza la espera el trabajo no se reserva ni se consulta
+    llamadas = fake.llamadas["total"]
+    _procesar()
+    assert fake.llamadas["total"] == llamadas
+
+    fake.configurar(caida=False)
+    _vencer_esperas(trabajo_id)
+    _procesar()
+    trabajo, items = _estado(trabajo_id)
+    assert trabajo.estado == "completado"
+    assert (trabajo.procesados, trabajo.encontrados, trabajo.no_encontrados, trabajo.errores) == (2, 1, 1, 0)
+    assert items["10000001"].estado == "encontrado"
+    assert items["90000001"].estado == "no_encontrado"
+
+
+def test_tras_los_intentos_maximos_el_dni_queda_con_error(fake, monkeypatch):
+    monkeypatch.setattr(get_settings(), "JOB_RETRY_MAX_ATTEMPTS", 2)
+    trabajo_id = _crear_trabajo(b"10000001\n")
+
+    fake.configurar(caida=True)
+    _procesar()
+    _vencer_esperas(trabajo_id)
+    _procesar()
+
+    trabajo, items = _estado(trabajo_id)
+    assert trabajo.estado == "completado"
+    assert (trabajo.procesados, trabajo.no_encontrados, trabajo.errores) == (1, 0, 1)
+    assert (items["10000001"].estado, items["10000001"].intentos) == ("error", 2)
+    assert "503" in items["10000001"].mensaje
+
+
+def test_carga_y_csv_de_resultados(fake):
+    trabajo_id = _crear_trabajo(b"dni,nombre\r\n10000001,ana\r\n123\r\n\r\n90000001\r\n10000001")
+
+    trabajo, items = _estado(trabajo_id)
+    assert (trabajo.estado, trabajo.total, trabajo.invalidos, trabajo.procesados) == ("pendiente", 4, 1, 1)
+    assert items["123"].estado == "invalido"
+
+    _procesar()
+
+    async def leer():
+        return "".join([parte async for parte in job_service.generar_resultados_csv(trabajo_id, tamano_bloque=2)])
+
+    filas = list(csv.reader(io.StringIO(asyncio.run(leer()))))
+    assert filas[0] == job_service.COLUMNAS_RESULTADO
+    assert [fila[:3] for fila in filas[1:]] == [
+        ["1", "10000001", "encontrado"],
+        ["2", "123", "invalido"],
+        ["3", "90000001", "no_encontrado"],
+        ["4", "10000001", "encontrado"],
+    ]
+    assert filas[1][4] and filas[1][4] == filas[4][4]
+
+
+def test_archivo_sin_dnis_no_crea_trabajo(base_vacia):
+    async def contenido():
+        yield b"dni\n\n"
+
+    async def crear():
+        async with AsyncSessionLocal() as db:
+            trabajo, mensaje = await job_service.crear_trabajo(db, contenido())
+            return trabajo, mensaje, await db.scalar(select(func.count()).select_from(TrabajoLote))
+
+    assert asyncio.run(crear()) == (None, "El archivo no contiene DNIs", 0)
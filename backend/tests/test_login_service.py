@@ -0,0 +1,50 @@
+"""
+Pruebas del bloqueo de login por IP de login_service.
+
+Uso (desde el directorio backend):
+    python -m pytest tests
+"""
+import asyncio
+
+from app.config import get_settings
+from app.services import login_service
+from app.services.cache_service import TTLCache
+
+
+def test_ips_nuevas_no_expulsan_los_bloqueos_vigentes(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "LOGIN_THROTTLE_PERSIST", False)
+    monkeypatch.setattr(login_service, "login_cache", TTLCache(10, settings.LOGIN_LOCKOUT_SECONDS))
+    monkeypatch.setattr(
+        login_service, "login_bloqueo_cache", TTLCache(10, settings.LOGIN_LOCKOUT_SECONDS, expulsar=False)
+    )
+
+    async def atacar():
+        for _ in range(settings.LOGIN_MAX_ATTEMPTS):
+            await login_service.registrar_fallo(None, "10.0.0.1")
+        assert await login_service.segundos_bloqueado(None, "10.0.0.1") > 0
+
+        # Una ola de fallos desde IPs nuevas llena la caché de intentos
+        for i in range(100):
+            await login_service.registrar_fallo(None, f"10.1.{i // 250}.{i % 250}")
+        assert login_service.login_cache.get("10.0.0.1") is None
+        return await login_service.segundos_bloqueado(None, "10.0.0.1")
+
+    assert asyncio.run(atacar()) > 0
+
+
+def test_login_exitoso_olvida_el_bloqueo(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "LOGIN_THROTTLE_PERSIST", False)
+    monkeypatch.setattr(login_service, "login_cache", TTLCache(10, settings.LOGIN_LOCKOUT_SECONDS))
+    monkeypatch.setattr(
+        login_service, "login_bloqueo_cache", TTLCache(10, settings.LOGIN_LOCKOUT_SECONDS, expulsar=False)
+    )
+
+    async def intentar():
+        for _ in range(settings.LOGIN_MAX_ATTEMPTS):
+            await login_service.registrar_fallo(None, "10.0.0.2")
+        await login_service.limpiar(None, "10.0.0.2")
+        return await login_service.segundos_bloqueado(None, "10.0.0.2")
+
+    assert asyncio.run(intentar()) == 0
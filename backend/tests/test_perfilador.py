@@ -0,0 +1,73 @@
+"""
+Pruebas del perfilador por muestreo: decisión de perfilar, muestras de la
+pila y perfiles guardados en formato folded.
+
+Uso (desde el directorio backend):
+    python -m pytest tests
+"""
+import os
+import time
+from collections import Counter
+
+import pytest
+
+from app import perfilador
+from app.config import get_settings
+
+
+@pytest.fixture
+def directorio(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_settings(), "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(get_settings(), "PROFILE_INTERVAL_MS", 1)
+    return tmp_path
+
+
+def _ocupado(segundos: float) -> None:
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        pass
+
+
+def test_debe_perfilar_con_cabecera_o_muestreo(monkeypatch):
+    monkeypatch.setitem(perfilador.configuracion, "tasa_muestreo", 0)
+    assert perfilador.debe_perfilar("perfil-pruebas")
+    assert not perfilador.debe_perfilar("otro")
+    assert not perfilador.debe_perfilar(None)
+
+    monkeypatch.setitem(perfilador.configuracion, "tasa_muestreo", 1)
+    assert perfilador.debe_perfilar(None)
+
+    # Sin PROFILE_TOKEN la cabecera no alcanza
+    monkeypatch.setitem(perfilador.configuracion, "tasa_muestreo", 0)
+    monkeypatch.setattr(get_settings(), "PROFILE_TOKEN", "")
+    assert not perfilador.debe_perfilar("")
+
+
+def test_muestras_de_la_pila_en_formato_folded(directorio):
+    perfil = perfilador.muestreador.iniciar()
+    _ocupado(0.2)
+    perfilador.muestreador.detener(perfil)
+
+    assert sum(perfil.values()) > 0
+    assert any(pila.endswith(f"{__name__}:_ocupado") for pila in perfil)
+
+    nombre = perfilador.guardar(perfil, "GET", "/api/persona/{dni}")
+    assert nombre.endswith("_GET_api_persona_dni.folded")
+    with open(perfilador.ruta_perfil(nombre), encoding="utf-8") as archivo:
+        lineas = archivo.read().splitlines()
+    pila, cantidad = lineas[0].rsplit(" ", 1)
+    assert perfil[pila] == int(cantidad) == max(perfil.values())
+
+
+def test_perfiles_se_limitan_a_profile_max_files(directorio, monkeypatch):
+    monkeypatch.setattr(get_settings(), "PROFILE_MAX_FILES", 2)
+    nombres = []
+    for _ in range(3):
+        nombres.append(perfilador.guardar(Counter({"modulo:funcion": 1}), "GET", "/health"))
+        time.sleep(0.001)
+
+    assert [p["archivo"] for p in perfilador.listar()] == nombres[:0:-1]
+    assert sorted(os.listdir(directorio)) == sorted(nombres[1:])
+    assert perfilador.guardar(Counter(), "GET", "/health") is None
+    assert perfilador.ruta_perfil(nombres[0]) is None
+    assert perfilador.ruta_perfil("../personas.db") is None
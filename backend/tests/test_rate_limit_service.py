@@ -0,0 +1,109 @@
+"""
+Pruebas del limitador por token (cubeta por minuto y cuota diaria) de
+rate_limit_service y del guardado del uso diario de token_service.
+
+Uso (desde el directorio backend):
+    python -m pytest tests
+"""
+import asyncio
+import time
+
+from app.database import AsyncSessionLocal
+from app.models import ApiToken
+from app.services import token_service
+from app.services.rate_limit_service import LimitadorTokens, cabeceras, fecha_a_dia, limitador
+
+# Mediodía de un día cualquiera (UTC), para no cruzar el cambio de día
+_AHORA = 20000 * 86400 + 43200.0
+
+
+def test_cubeta_por_minuto_se_agota_y_se_recarga():
+    limitador = LimitadorTokens(shards=2)
+
+    for restantes in (2, 1, 0):
+        assert limitador.consumir(1, 3, 0, _AHORA) == (True, restantes, 0.0, -1)
+
+    permitida, fichas, espera, cuota = limitador.consumir(1, 3, 0, _AHORA)
+    assert (permitida, fichas, cuota) == (False, 0, -1)
+    assert espera == 20.0  # una ficha cada 60 / 3 segundos
+
+    # Otro token no comparte la cubeta
+    assert limitador.consumir(2, 3, 0, _AHORA)[0]
+    # Pasado el tiempo de una ficha se vuelve a permitir
+    assert limitador.consumir(1, 3, 0, _AHORA + 20)[0]
+    assert not limitador.consumir(1, 3, 0, _AHORA + 20)[0]
+
+
+def test_cuota_diaria_se_agota_y_se_reinicia_al_cambiar_de_dia():
+    limitador = LimitadorTokens()
+
+    assert limitador.consumir(1, 0, 2, _AHORA) == (True, -1, 0.0, 1)
+    assert limitador.consumir(1, 0, 2, _AHORA) == (True, -1, 0.0, 0)
+    assert limitador.consumir(1, 0, 2, _AHORA) == (False, 0, 43200.0, 0)
+
+    assert limitador.consumir(1, 0, 2, _AHORA + 86400) == (True, -1, 0.0, 1)
+
+
+def test_sin_limites_siempre_se_permite():
+    limitador = LimitadorTokens()
+    for _ in range(1000):
+        assert limitador.consumir(1, 0, 0, _AHORA) == (True, -1, 0.0, -1)
+
+
+def test_uso_cargado_de_sqlite_cuenta_para_la_cuota():
+    limitador = LimitadorTokens()
+    limitador.consumir(1, 0, 10, _AHORA)
+    limitador.cargar(1, int(_AHORA // 86400), 9)
+
+    assert limitador.consumir(1, 0, 10, _AHORA)[0] is False
+    # Un total menor (leído antes de sincronizar) no reduce el uso
+    limitador.cargar(1, int(_AHORA // 86400), 3)
+    assert limitador.consumir(1, 0, 10, _AHORA)[0] is False
+
+
+def test_pendientes_devueltos_se_vuelven_a_tomar():
+    limitador = LimitadorTokens()
+    limitador.consumir(1, 0, 10, _AHORA)
+    limitador.consumir(1, 0, 10, _AHORA)
+
+    pendientes = limitador.tomar_pendientes()
+    assert pendientes == [(1, int(_AHORA // 86400), 2)]
+    assert limitador.tomar_pendientes() == []
+
+    limitador.devolver_pendientes(pendientes)
+    assert limitador.tomar_pendientes() == pendientes
+
+
+def test_cabeceras_de_rechazo():
+    headers = cabeceras(60, 100, (False, 0, 0.2, 5))
+    assert headers["X-RateLimit-Limit"] == "60"
+    assert headers["X-RateLimit-Remaining"] == "0"
+    assert headers["X-RateLimit-Quota-Limit"] == "100"
+    assert headers["X-RateLimit-Quota-Remaining"] == "5"
+    assert headers["Retry-After"] == "1"
+
+    assert cabeceras(0, 0, (True, -1, 0.0, -1)) == {}
+
+
+def test_uso_diario_se_guarda_en_bloque(base_vacia):
+    async def probar():
+        async with AsyncSessionLocal() as db:
+            token = await token_service.crear_token(db, "pruebas", cuota_diaria=100)
+            token_id, valor = token.id, token.token
+
+        for _ in range(3):
+            async with AsyncSessionLocal() as db:
+                activo = await token_service.validar_token(db, valor)
+            limitador.consumir(activo.id, activo.limite_por_minuto, activo.cuota_diaria)
+
+        async with AsyncSessionLocal() as db:
+            assert await token_service.guardar_uso_pendiente(db) == 1
+        async with AsyncSessionLocal() as db:
+            return token_id, await db.get(ApiToken, token_id)
+
+    token_id, guardado = asyncio.run(probar())
+    limitador.olvidar(token_id)
+
+    assert guardado.total_peticiones == 3
+    assert guardado.uso_diario == 3
+    assert fecha_a_dia(guardado.fecha_uso_diario) == int(time.time() // 86400)
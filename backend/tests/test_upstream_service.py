@@ -0,0 +1,113 @@
+"""
+Pruebas del circuito y el timeout adaptativo de upstream_service contra la
+API falsa de benchmarks/fake_apisperu.py (sin red).
+
+Uso (desde el directorio backend):
+    python -m pytest tests
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from fake_apisperu import FakeApisPeru
+
+from app.services import http_client, upstream_service
+from app.services.upstream_service import (
+    ABIERTO, CERRADO, SEMIABIERTO, CircuitBreaker, LatenciaAdaptativa, UpstreamNoDisponible,
+)
+
+URL = "http://apisperu.prueba/api/v1/dni/12345678?token=prueba"
+SEGUNDOS_ABIERTO = 0.05
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """API falsa sin latencia y un circuito propio que se abre al primer fallo"""
+    monkeypatch.setattr(upstream_service, "circuito", CircuitBreaker(1, SEGUNDOS_ABIERTO))
+    monkeypatch.setattr(upstream_service, "_espera_reintento", lambda intento: 0)
+    fake = FakeApisPeru(latencia_ms=0, jitter_ms=0)
+    asyncio.run(http_client.iniciar_cliente(fake.transporte()))
+    yield fake
+    asyncio.run(http_client.cerrar_cliente())
+
+
+def _abrir_y_esperar(fake: FakeApisPeru) -> None:
+    fake.configurar(caida=True)
+    with pytest.raises(UpstreamNoDisponible):
+        asyncio.run(upstream_service.obtener(URL))
+    assert upstream_service.circuito.estado == ABIERTO
+    asyncio.run(asyncio.sleep(SEGUNDOS_ABIERTO * 1.5))
+    assert upstream_service.circuito.estado == SEMIABIERTO
+
+
+def test_prueba_semiabierta_con_respuesta_corrupta_reabre_el_circuito(fake):
+    _abrir_y_esperar(fake)
+
+    fake.configurar(caida=False, respuesta_corrupta=True)
+    with pytest.raises(httpx.DecodingError):
+        asyncio.run(upstream_service.obtener(URL))
+    assert upstream_service.circuito.estado == ABIERTO
+
+    # Al recuperarse la API, la siguiente prueba cierra el circuito
+    asyncio.run(asyncio.sleep(SEGUNDOS_ABIERTO * 1.5))
+    fake.configurar(respuesta_corrupta=False)
+    respuesta = asyncio.run(upstream_service.obtener(URL))
+    assert respuesta.status_code == 200
+    assert upstream_service.circuito.estado == CERRADO
+
+
+def test_prueba_semiabierta_cancelada_libera_la_prueba(fake):
+    _abrir_y_esperar(fake)
+    fake.configurar(caida=False, latencia_ms=1000)
+
+    async def cancelar_prueba():
+        tarea = asyncio.create_task(upstream_service.obtener(URL))
+        await asyncio.sleep(0.01)
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+
+    asyncio.run(cancelar_prueba())
+    assert upstream_service.circuito.estado == SEMIABIERTO
+
+    fake.configurar(latencia_ms=0)
+    assert asyncio.run(upstream_service.obtener(URL)).status_code == 200
+    assert upstream_service.circuito.estado == CERRADO
+
+
+def test_latencias_con_ventana_llena_no_recalculan_en_cada_muestra():
+    latencias = LatenciaAdaptativa(muestras=20, factor=3.0, minimo=0.1, maximo=10.0)
+    for _ in range(40):
+        latencias.registrar(0.1)
+    calculados = latencias.percentiles()
+
+    for _ in range(9):
+        latencias.registrar(0.1)
+        assert latencias.percentiles() is calculados
+    latencias.registrar(0.1)
+    assert latencias.percentiles() is not calculados
+
+
+def test_timeouts_suben_el_timeout_adaptativo(monkeypatch):
+    latencias = LatenciaAdaptativa(muestras=20, factor=2.0, minimo=0.05, maximo=5.0)
+    for _ in range(20):
+        latencias.registrar(0.05)
+    monkeypatch.setattr(upstream_service, "latencias", latencias)
+    monkeypatch.setattr(upstream_service, "circuito", CircuitBreaker(100, SEGUNDOS_ABIERTO))
+    monkeypatch.setattr(upstream_service, "_espera_reintento", lambda intento: 0)
+    assert latencias.timeout() == pytest.approx(0.1)
+
+    # La API se vuelve lenta: cada intento vence con el timeout vigente
+    # (MockTransport no aplica timeouts, se simula el vencimiento)
+    def vencer(request: httpx.Request) -> httpx.Response:
+        raise httpx.ReadTimeout("lenta", request=request)
+
+    asyncio.run(http_client.iniciar_cliente(httpx.MockTransport(vencer)))
+    try:
+        for _ in range(4):
+            with pytest.raises(httpx.TimeoutException):
+                asyncio.run(upstream_service.obtener(URL))
+    finally:
+        asyncio.run(http_client.cerrar_cliente())
+    assert latencias.timeout() > 0.1